@@ -0,0 +1,142 @@
+import logging
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import Camera, CameraPermission, User, VideoWall
+
+logger = logging.getLogger(__name__)
+
+ACL_TIMEOUT = 600
+GENERATION_KEY = 'camera_acl:generation'
+
+
+def acl_cache_key(user_id):
+    return f'camera_acl:user:{user_id}'
+
+
+class CameraACL:
+    """The camera ids one user may view and edit, resolved in one go."""
+
+    __slots__ = ('viewable', 'editable')
+
+    def __init__(self, viewable, editable):
+        self.viewable = frozenset(viewable)
+        self.editable = frozenset(editable)
+
+    def can_view(self, camera_id):
+        return int(camera_id) in self.viewable
+
+    def can_edit(self, camera_id):
+        return int(camera_id) in self.editable
+
+
+def build_camera_acl(user_id, role):
+    """Resolve a user's ACL from the database, mirroring the role rules."""
+    if role in ['SUPER_ADMIN', 'ADMIN']:
+        # Super Admin or Admin can view any camera
+        viewable = Camera.objects.values_list('id', flat=True)
+    else:
+        viewable = CameraPermission.objects.filter(
+            user_id=user_id, can_view=True
+        ).values_list('camera_id', flat=True)
+
+    if role == 'SUPER_ADMIN':
+        editable = viewable
+    elif role == 'ADMIN':
+        # Admin can edit only their own cameras
+        editable = Camera.objects.filter(created_by_id=user_id).values_list('id', flat=True)
+    else:
+        editable = []
+    return CameraACL(viewable, editable)
+
+
+def get_camera_acl(user):
+    """Return the cached ACL for ``user``, building it on a miss.
+
+    The ACL is memoised on the user object for the rest of the request or
+    connection, and kept in the Django cache between them. Entries carry the
+    camera generation, so any camera change invalidates every entry at once,
+    while permission and role changes drop only the affected user.
+    """
+    acl = getattr(user, '_camera_acl', None)
+    if acl is not None:
+        return acl
+
+    key = acl_cache_key(user.id)
+    cached = cache.get_many([GENERATION_KEY, key])
+    generation = cached.get(GENERATION_KEY, 0)
+    entry = cached.get(key)
+    if entry is not None and entry[0] == generation and entry[1] == user.role:
+        acl = entry[2]
+    else:
+        acl = build_camera_acl(user.id, user.role)
+        cache.set(key, (generation, user.role, acl), ACL_TIMEOUT)
+
+    user._camera_acl = acl
+    return acl
+
+
+def wall_cache_key(wall_id):
+    return f'video_wall:cameras:{wall_id}'
+
+
+def get_wall_cameras(wall_id):
+    """Return the camera ids on a video wall, or None if there is no such wall; cached."""
+    key = wall_cache_key(wall_id)
+    cached = cache.get_many([GENERATION_KEY, key])
+    generation = cached.get(GENERATION_KEY, 0)
+    entry = cached.get(key)
+    # Tagged with the camera generation, like ACLs, so deleted cameras drop out
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+    wall = VideoWall.objects.filter(id=wall_id).first()
+    if wall is None:
+        return None
+    camera_ids = tuple(wall.cameras.order_by('id').values_list('id', flat=True))
+    cache.set(key, (generation, camera_ids), ACL_TIMEOUT)
+    return camera_ids
+
+
+def can_view_wall(user, wall_id):
+    """A wall shows every camera on it to every viewer, so viewers must be allowed to see them all."""
+    camera_ids = get_wall_cameras(wall_id)
+    if camera_ids is None:
+        return False
+    acl = get_camera_acl(user)
+    return all(acl.can_view(camera_id) for camera_id in camera_ids)
+
+
+def invalidate_user_acl(user_id):
+    cache.delete(acl_cache_key(user_id))
+
+
+def invalidate_all_acls():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+@receiver([post_save, post_delete], sender=CameraPermission)
+def camera_permission_changed(sender, instance, **kwargs):
+    invalidate_user_acl(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Camera)
+def camera_changed(sender, instance, **kwargs):
+    invalidate_all_acls()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_acl(instance.id)
+
+
+@receiver(post_delete, sender=VideoWall)
+@receiver(m2m_changed, sender=VideoWall.cameras.through)
+def wall_changed(sender, instance, **kwargs):
+    if isinstance(instance, VideoWall):
+        cache.delete(wall_cache_key(instance.id))
+    else:
+        # Walls changed from the camera side, e.g. camera.walls.add(wall)
+        cache.delete_many([wall_cache_key(wall_id) for wall_id in kwargs.get('pk_set') or ()])
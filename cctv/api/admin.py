@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Camera, CameraPermission ,DetectedFrame
+from .models import User, Camera, CameraPermission ,DetectedFrame, CameraLease, PipelineWorker, AlertRule, Alert, VideoWall, EventClip, AnalysisJob, AnalysisFile, DetectionRollup
 
 # Register your models here.
 
@@ -9,5 +9,59 @@ admin.site.register(DetectedFrame)
 admin.site.register(CameraPermission)
 @admin.register(Camera)
 class cameraAdmin(admin.ModelAdmin):
-    list_display = ["id", "name", "is_public","created_by","created_at","updated_at"]
-    
+    list_display = ["id", "name", "is_public", "priority", "detector_backend", "detector_input_size", "detection_interval","hls_enabled","recording_mode","created_by","created_at","updated_at"]
+    list_filter = ["priority", "detector_backend", "hls_enabled", "recording_mode"]
+
+
+@admin.register(CameraLease)
+class cameraLeaseAdmin(admin.ModelAdmin):
+    list_display = ["camera", "owner", "acquired_at", "heartbeat_at", "expires_at"]
+    list_filter = ["owner"]
+
+
+@admin.register(PipelineWorker)
+class pipelineWorkerAdmin(admin.ModelAdmin):
+    list_display = ["name", "started_at", "heartbeat_at"]
+
+
+@admin.register(AlertRule)
+class alertRuleAdmin(admin.ModelAdmin):
+    list_display = ["name", "camera", "label", "min_count", "duration", "active_from", "active_until", "is_active"]
+    list_filter = ["camera", "label", "is_active"]
+
+
+@admin.register(Alert)
+class alertAdmin(admin.ModelAdmin):
+    list_display = ["rule", "camera", "triggered_at"]
+    list_filter = ["camera", "rule"]
+
+
+@admin.register(EventClip)
+class eventClipAdmin(admin.ModelAdmin):
+    list_display = ["camera", "alert", "status", "triggered_at", "frames", "file"]
+    list_filter = ["camera", "status"]
+
+
+@admin.register(DetectionRollup)
+class detectionRollupAdmin(admin.ModelAdmin):
+    list_display = ["camera", "period", "start", "label", "frames", "total", "min_count", "max_count"]
+    list_filter = ["period", "camera", "label"]
+
+
+class analysisFileInline(admin.TabularInline):
+    model = AnalysisFile
+    readonly_fields = ["path", "status", "next_frame", "total_frames", "frames_done", "detections", "error"]
+    extra = 0
+
+
+@admin.register(AnalysisJob)
+class analysisJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "camera", "path", "stride", "processes", "status", "created_at", "finished_at"]
+    list_filter = ["status", "camera"]
+    inlines = [analysisFileInline]
+
+
+@admin.register(VideoWall)
+class videoWallAdmin(admin.ModelAdmin):
+    list_display = ["name", "width", "height", "fps", "hls_enabled", "created_by", "updated_at"]
+    filter_horizontal = ["cameras"]
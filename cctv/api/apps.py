@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Register the signal handlers that invalidate cached camera ACLs and tokens
+        from . import acl, jwtMiddleware  # noqa: F401
+
+        # Keep log I/O off request and frame threads
+        from django.conf import settings
+        if settings.CCTV_LOG_QUEUE:
+            from .logqueue import install_queue_logging
+            install_queue_logging()
@@ -0,0 +1,46 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User
+
+
+class CameraTokenUser(TokenUser):
+    """Request user built from access token claims without a database query.
+
+    Used through ``JWTStatelessUserAuthentication``. The token carries the
+    role and email issued at login; camera permissions are not in the token
+    but checked through the camera ACL cache, so a revoked camera takes
+    effect before the token expires. Views that must write to the user row load it with
+    ``get_user()``.
+    """
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', 'USER')
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    def get_user(self):
+        return User.objects.get(pk=self.id)
+
+    def __str__(self):
+        return self.email
+
+
+def get_tokens_for_user(user):
+    refresh = RefreshToken.for_user(user)
+    refresh['role'] = user.role
+    refresh['email'] = user.email
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
+
+
+def get_db_user(user):
+    """Return the User row behind a request user, loading it for token users."""
+    if isinstance(user, CameraTokenUser):
+        return user.get_user()
+    return user
@@ -0,0 +1,269 @@
+import logging
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .inference import camera_backend, draw_detections
+from .models import AnalysisFile, AnalysisJob, DetectedFrame
+from .pipeline import detection_result
+from .rollups import RollupBuffer, label_counts
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.ts')
+# Passthrough recording segments are named by their start time
+SEGMENT_NAME = re.compile(r'(\d{8}-\d{6})\.\w+$')
+
+
+def video_files(path):
+    """The video files at ``path``: the file itself, or every video below a directory, in name order."""
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, _, names in os.walk(path):
+        found.extend(os.path.join(root, name) for name in names if name.lower().endswith(VIDEO_EXTENSIONS))
+    return sorted(found)
+
+
+def resolve_analysis_path(path):
+    """Return ``path`` made absolute under CCTV_ANALYSIS_ROOT, or raise ValueError."""
+    root = os.path.realpath(settings.CCTV_ANALYSIS_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path} is outside {settings.CCTV_ANALYSIS_ROOT}")
+    if not os.path.exists(resolved):
+        raise ValueError(f"{path} does not exist")
+    return resolved
+
+
+def create_job(camera, path, created_by_id, **options):
+    """Create a job and its file rows; ``path`` must already be resolved."""
+    files = video_files(path)
+    if not files:
+        raise ValueError(f"No video files found in {path}")
+    with transaction.atomic():
+        job = AnalysisJob.objects.create(camera=camera, path=path, created_by_id=created_by_id, **options)
+        AnalysisFile.objects.bulk_create([AnalysisFile(job=job, path=file) for file in files])
+    return job
+
+
+def launch_job(job):
+    """Run a job in a detached ``analyze_footage`` process, so it outlives the request that started it."""
+    os.makedirs(os.path.join(settings.BASE_DIR, 'logs'), exist_ok=True)
+    with open(os.path.join(settings.BASE_DIR, 'logs', f'analysis_{job.id}.log'), 'ab') as log:
+        subprocess.Popen([sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'analyze_footage',
+                          '--job', str(job.id)], cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL,
+                         stdout=log, stderr=log, start_new_session=True)
+
+
+def job_progress(job):
+    totals = job.files.aggregate(total=Sum('total_frames'), done=Sum('frames_done'), detections=Sum('detections'))
+    counts = {status: 0 for status, _ in AnalysisFile.STATUSES}
+    for status in job.files.values_list('status', flat=True):
+        counts[status] += 1
+    return {
+        'files': counts,
+        'frames': totals['done'] or 0,
+        'total_frames': totals['total'] or 0,  # Known once each file has been opened
+        'detections': totals['detections'] or 0,
+    }
+
+
+class FrameReader(threading.Thread):
+    """Decodes one video on its own thread, ahead of inference, keeping every ``stride``-th frame.
+
+    Skipped frames are only grabbed, not converted. Kept frames are those
+    whose index is a multiple of the stride, so a resumed run picks the same
+    frames as an uninterrupted one.
+    """
+
+    def __init__(self, path, start=0, stride=1, prefetch=64):
+        super().__init__(daemon=True)
+        self.path = path
+        self.start_frame = start
+        self.stride = stride
+        self.queue = queue.Queue(prefetch)
+        self.stopped = False
+        self.fps = None
+        self.frame_count = 0
+        self.error = None  # Set when the video cannot be opened or decoded
+        self.opened = threading.Event()
+
+    def run(self):
+        import cv2
+        capture = cv2.VideoCapture(self.path)
+        try:
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            if not capture.isOpened():
+                self.error = f"Cannot open {self.path}"
+                return
+            self.opened.set()
+            if self.start_frame:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            index = self.start_frame
+            while not self.stopped:
+                if index % self.stride:
+                    if not capture.grab():
+                        break
+                else:
+                    ret, frame = capture.read()
+                    if not ret:
+                        break
+                    self.queue.put((index, frame))
+                index += 1
+            if index == self.start_frame and self.start_frame < max(self.frame_count, 1):
+                self.error = f"No frames could be decoded from {self.path}"
+        finally:
+            self.opened.set()
+            capture.release()
+            self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        self.stopped = True
+        while self.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def file_start_time(path, fps, frame_count):
+    """When a video began: from a recording segment's name, else its modification time less its length."""
+    match = SEGMENT_NAME.search(os.path.basename(path))
+    if match:
+        return timezone.make_aware(datetime.strptime(match.group(1), '%Y%m%d-%H%M%S'))
+    modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.get_current_timezone())
+    return modified - timedelta(seconds=frame_count / fps)
+
+
+class BatchAnalyzer:
+    """Runs the pending files of one job through detection and bulk-inserts the results.
+
+    Several analyzers, in separate processes, may work on the same job;
+    each claims one file at a time. After every batch the detected frames
+    and the file's resume point are committed together, so a crashed run
+    resumes at the last committed batch without duplicating rows.
+    """
+
+    progress_interval = 5.0
+
+    def __init__(self, job, backend=None, stdout=None):
+        self.job = job
+        self.backend = backend or camera_backend(job.camera)
+        self.stdout = stdout
+        self.output_dir = os.path.join(settings.MEDIA_ROOT, 'detected_frames')
+        self.reported_at = time.monotonic()
+        self.frames = 0
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        while not self.cancelled():
+            analysis_file = self.claim()
+            if analysis_file is None:
+                break
+            try:
+                self.process(analysis_file)
+            except Exception as e:
+                logger.error(f"Analysis of {analysis_file.path} failed: {str(e)}")
+                AnalysisFile.objects.filter(id=analysis_file.id).update(status='failed', error=str(e))
+
+    def claim(self):
+        for analysis_file in self.job.files.filter(status='pending').order_by('id'):
+            if AnalysisFile.objects.filter(id=analysis_file.id, status='pending').update(status='running'):
+                return analysis_file
+        return None
+
+    def cancelled(self):
+        return AnalysisJob.objects.filter(id=self.job.id, status='cancelled').exists()
+
+    def process(self, analysis_file):
+        reader = FrameReader(analysis_file.path, analysis_file.next_frame, self.job.stride)
+        reader.start()
+        reader.opened.wait()
+        if reader.error:
+            raise ValueError(reader.error)
+        total = -(-reader.frame_count // self.job.stride)
+        AnalysisFile.objects.filter(id=analysis_file.id).update(total_frames=total)
+        started_at = file_start_time(analysis_file.path, reader.fps, reader.frame_count)
+
+        batch = []
+        try:
+            for item in reader:
+                batch.append(item)
+                if len(batch) >= self.job.batch_size:
+                    self.flush(analysis_file, batch, reader.fps, started_at)
+                    batch = []
+                    if self.cancelled():
+                        AnalysisFile.objects.filter(id=analysis_file.id).update(status='pending')
+                        return
+            if batch:
+                self.flush(analysis_file, batch, reader.fps, started_at)
+            if reader.error:
+                raise ValueError(reader.error)
+        finally:
+            reader.close()
+        AnalysisFile.objects.filter(id=analysis_file.id).update(status='done')
+
+    def flush(self, analysis_file, batch, fps, started_at):
+        import cv2
+        results = self.backend.detect_batch([frame for _, frame in batch])
+        rows = []
+        rollups = RollupBuffer()
+        for (index, frame), detections in zip(batch, results):
+            if not detections:
+                continue  # Only frames with something in them are indexed
+            timestamp = started_at + timedelta(seconds=index / fps)
+            rollups.add(self.job.camera_id, timestamp, label_counts(detections))
+            image_path = os.path.join(self.output_dir, f'analysis_{self.job.id}_{analysis_file.id}_{index}.jpg')
+            cv2.imwrite(image_path, draw_detections(frame, detections))
+            rows.append(DetectedFrame(camera_id=self.job.camera_id, frame_image=image_path,
+                                      timestamp=timestamp,
+                                      detection_result=detection_result(detections)))
+        with transaction.atomic():
+            DetectedFrame.objects.bulk_create(rows)
+            rollups.flush()  # Committed with the rows, so a resumed file never counts a frame twice
+            AnalysisFile.objects.filter(id=analysis_file.id).update(
+                next_frame=batch[-1][0] + 1, frames_done=F('frames_done') + len(batch),
+                detections=F('detections') + sum(len(detections) for detections in results))
+        self.frames += len(batch)
+        self.report()
+
+    def report(self):
+        now = time.monotonic()
+        if self.stdout is None or now - self.reported_at < self.progress_interval:
+            return
+        progress = job_progress(self.job)
+        total = progress['total_frames'] or '?'
+        self.stdout.write(f"Job {self.job.id}: {progress['frames']}/{total} frames, "
+                          f"{progress['detections']} detections, {progress['files']['done']} files done, "
+                          f"{self.frames / (now - self.reported_at):.1f} fps in this process")
+        self.reported_at = now
+        self.frames = 0
+
+
+def finish_job(job):
+    """Settle a job's status once no process is working on it."""
+    job.refresh_from_db()
+    if job.status == 'cancelled':
+        return job
+    statuses = set(job.files.values_list('status', flat=True))
+    job.status = 'failed' if 'failed' in statuses else 'done' if statuses <= {'done'} else 'queued'
+    job.finished_at = timezone.now() if job.status != 'queued' else None
+    job.save(update_fields=['status', 'finished_at'])
+    return job
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import psutil
+from channels.layers import get_channel_layer
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from .inference import InferenceBackend
+from .pipeline import CameraPipeline, camera_group_name, open_capture
+
+logger = logging.getLogger(__name__)
+
+# Frame sources, a detector and viewers that stand in for cameras, the model
+# and browsers, so the real capture -> detect -> persist -> fan-out path can be
+# measured on any machine and compared run to run.
+
+
+class SyntheticCapture:
+    """A cv2.VideoCapture look-alike rendering bright boxes moving over a gradient.
+
+    Frames depend only on the seed and frame index, so every run sees the
+    same video. After ``frames`` reads it reports end of stream.
+    """
+
+    def __init__(self, width=1280, height=720, frames=None, objects=3, seed=0):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.index = 0
+        self.opened = True
+        rng = np.random.RandomState(seed)
+        gradient = np.linspace(40, 140, width, dtype=np.uint8)
+        self.background = np.repeat(np.tile(gradient, (height, 1))[:, :, np.newaxis], 3, axis=2)
+        # Each object: size, start position and speed in pixels per frame
+        self.objects = [(rng.randint(40, 120), rng.randint(40, 120), rng.rand() * width, rng.rand() * height,
+                         rng.uniform(-8, 8), rng.uniform(-6, 6)) for _ in range(objects)]
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        import cv2
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: 20.0}.get(prop, 0)
+
+    def read(self):
+        import cv2
+        if not self.opened or (self.frames is not None and self.index >= self.frames):
+            return False, None
+        frame = self.background.copy()
+        for w, h, x, y, dx, dy in self.objects:
+            left = int(x + dx * self.index) % (self.width - w)
+            top = int(y + dy * self.index) % (self.height - h)
+            cv2.rectangle(frame, (left, top), (left + w, top + h), (235, 235, 235), -1)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
+
+class LoopingCapture:
+    """Replays a video file from the start whenever it runs out."""
+
+    def __init__(self, source):
+        self.capture = open_capture(source)
+
+    def __getattr__(self, name):
+        return getattr(self.capture, name)
+
+    def read(self):
+        import cv2
+        ret, frame = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+
+class StubBackend(InferenceBackend):
+    """Boxes every bright region of the frame, optionally waiting to stand in for a model.
+
+    Deterministic and cheap, so pipeline overhead is measured rather than
+    the model. ``latency`` only adds wall time; run a real backend to load
+    the CPU like a detector would.
+    """
+
+    name = 'stub'
+    thread_safe = True
+
+    def __init__(self, input_size=640, latency=0.0, label='person'):
+        super().__init__(input_size)
+        self.latency = latency
+        self.label = label
+
+    def detect(self, frame):
+        import cv2
+        if self.latency:
+            time.sleep(self.latency)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        detections = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h >= 400:
+                detections.append([self.label, 0.9, x, y, x + w, y + h])
+        return detections
+
+
+class BenchPipeline(CameraPipeline):
+    """A camera pipeline with a pluggable source and detector that keeps every stage timing."""
+
+    def __init__(self, camera_id, capture_factory, backend=None, frame_interval=0.0, lease=None):
+        super().__init__(camera_id, lease=lease)
+        self.capture_factory = capture_factory
+        self.stub = backend
+        self.frame_interval = frame_interval
+        self.samples = {}
+
+    def open_source(self, camera):
+        return self.capture_factory(camera)
+
+    def load_backend(self, camera, input_size=None):
+        if self.stub is not None:
+            return self.stub
+        return super().load_backend(camera, input_size)
+
+    def record(self, stage, seconds):
+        super().record(stage, seconds)
+        self.samples.setdefault(stage, []).append(seconds)
+
+
+class Viewer:
+    """A channel layer subscriber that decodes frames the way a WebSocket consumer sends them."""
+
+    def __init__(self, channel_layer, camera_id):
+        self.channel_layer = channel_layer
+        self.camera_id = camera_id
+        self.channel = None
+        self.latencies = []
+        self.first_frame = None
+        self.last_frame = None
+        self.ended = False
+
+    async def join(self):
+        self.channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(camera_group_name(self.camera_id), self.channel)
+
+    async def leave(self):
+        await self.channel_layer.group_discard(camera_group_name(self.camera_id), self.channel)
+
+    async def run(self, stop, poll=0.005):
+        while not stop.is_set() and not self.ended:
+            try:
+                # Polled, since the in-memory layer cannot wake a loop from a pipeline thread
+                message = await asyncio.wait_for(self.channel_layer.receive(self.channel), poll)
+            except asyncio.TimeoutError:
+                continue
+            self.handle(message)
+
+    def handle(self, message):
+        if message['type'] == 'stream.end':
+            self.ended = True
+            return
+        json.dumps({'frame': message['frame']})  # The consumer's per-frame send cost
+        now = time.time()
+        self.latencies.append(now - message['ts'])
+        self.first_frame = self.first_frame or now
+        self.last_frame = now
+
+    @property
+    def fps(self):
+        if len(self.latencies) < 2:
+            return 0.0
+        return (len(self.latencies) - 1) / (self.last_frame - self.first_frame)
+
+
+@contextmanager
+def throwaway_database():
+    """Point the default database and MEDIA_ROOT at temporary copies; yields the media root.
+
+    Benchmarks write frames and rows, which must never land in real data.
+    """
+    media_root = tempfile.TemporaryDirectory()
+    if connection.vendor == 'sqlite':
+        # On disk, since in-memory SQLite fails concurrent writers instead of making them wait
+        connection.settings_dict['TEST']['NAME'] = os.path.join(media_root.name, 'bench.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(MEDIA_ROOT=media_root.name):
+            yield media_root.name
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        media_root.cleanup()
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0, 'p50_ms': 0.0, 'p99_ms': 0.0}
+    p50, p99 = np.percentile(samples, [50, 99])
+    return {'count': len(samples), 'p50_ms': round(p50 * 1000, 3), 'p99_ms': round(p99 * 1000, 3)}
+
+
+def run_benchmark(cameras, capture_factory, backend=None, viewers=0, seconds=10.0, frame_interval=0.0,
+                  channel_layer=None):
+    """Run one pipeline per camera plus ``viewers`` subscribers per camera and report throughput.
+
+    ``cameras`` are saved Camera instances. Returns fps per camera and in
+    total, exact p50/p99 of every stage and of capture-to-viewer latency,
+    and the process's CPU use and RSS over the run.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    pipelines = [BenchPipeline(camera.id, capture_factory, backend, frame_interval) for camera in cameras]
+    for pipeline in pipelines:
+        pipeline.channel_layer = pipeline.events.channel_layer = channel_layer
+    audience = [Viewer(channel_layer, camera.id) for camera in cameras for _ in range(viewers)]
+
+    async def each(method, *args):
+        await asyncio.gather(*(getattr(viewer, method)(*args) for viewer in audience))
+
+    stop = threading.Event()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(each('join'))
+    receiver = threading.Thread(target=loop.run_until_complete, args=(each('run', stop),), daemon=True)
+    receiver.start()
+
+    process = psutil.Process()
+    rss_start = process.memory_info().rss
+    cpu_start = process.cpu_times()
+    started = time.perf_counter()
+    for pipeline in pipelines:
+        pipeline.start()
+    deadline = started + seconds
+    while time.perf_counter() < deadline and any(pipeline.is_alive() for pipeline in pipelines):
+        time.sleep(0.05)
+    for pipeline in pipelines:
+        pipeline.stop(wait=True)
+    elapsed = time.perf_counter() - started
+    cpu_end = process.cpu_times()
+    rss_end = process.memory_info().rss
+
+    stop.set()
+    receiver.join(timeout=5)
+    loop.run_until_complete(each('leave'))
+    loop.close()
+
+    frames = [len(pipeline.samples.get('capture', ())) for pipeline in pipelines]
+    stages = {}
+    for pipeline in pipelines:
+        for stage, samples in pipeline.samples.items():
+            stages.setdefault(stage, []).extend(samples)
+    latencies = [latency for viewer in audience for latency in viewer.latencies]
+    return {
+        'cameras': len(pipelines),
+        'viewers_per_camera': viewers,
+        'seconds': round(elapsed, 3),
+        'frames': sum(frames),
+        'fps': round(sum(frames) / elapsed, 2),
+        'min_camera_fps': round(min(frames, default=0) / elapsed, 2),
+        'stages': {stage: percentiles(samples) for stage, samples in sorted(stages.items())},
+        'viewer_latency': percentiles(latencies),
+        'viewer_fps': round(sum(viewer.fps for viewer in audience) / len(audience), 2) if audience else None,
+        'cpu_percent': round(100 * (cpu_end.user + cpu_end.system - cpu_start.user - cpu_start.system) / elapsed, 1),
+        'rss_mb': round(rss_end / 2**20, 1),
+        'rss_growth_mb': round((rss_end - rss_start) / 2**20, 1),
+    }
@@ -0,0 +1,168 @@
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection
+from .metrics import metrics
+from .models import EventClip
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 4  # Clips collecting post-roll at once per camera; more are marked failed
+
+
+def utc(ts):
+    return datetime.fromtimestamp(ts, dt_timezone.utc)
+
+
+class FrameRing:
+    """The last ``seconds`` of one camera's encoded frames, never holding more than ``max_bytes``."""
+
+    def __init__(self, seconds, max_bytes):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (capture time, JPEG bytes)
+        self.size = 0
+
+    def add(self, ts, jpeg):
+        self.frames.append((ts, jpeg))
+        self.size += len(jpeg)
+        horizon = ts - self.seconds
+        while self.frames and (self.size > self.max_bytes or self.frames[0][0] < horizon):
+            _, old = self.frames.popleft()
+            self.size -= len(old)
+
+    def since(self, ts):
+        return [frame for frame in self.frames if frame[0] >= ts]
+
+
+class PendingClip:
+    def __init__(self, clip_id, camera_id, frames, ends_at):
+        self.clip_id = clip_id
+        self.camera_id = camera_id
+        self.frames = frames
+        self.ends_at = ends_at
+        self.size = sum(len(jpeg) for _, jpeg in frames)
+
+
+class ClipRecorder:
+    """Keeps one camera's pre-event ring and collects the post-roll of clips being cut.
+
+    The pipeline hands over each frame's JPEG, which it encodes anyway, so
+    buffering costs a reference per frame. When an event fires, the ring's
+    last ``pre_seconds`` and the next ``post_seconds`` of frames become an
+    EventClip, written to disk by the background clip writer.
+    """
+
+    def __init__(self, camera_id, pre_seconds=None, post_seconds=None, max_bytes=None, writer=None):
+        self.camera_id = camera_id
+        self.pre_seconds = settings.CCTV_CLIP_PRE_SECONDS if pre_seconds is None else pre_seconds
+        self.post_seconds = settings.CCTV_CLIP_POST_SECONDS if post_seconds is None else post_seconds
+        self.max_bytes = settings.CCTV_CLIP_BUFFER_MB * 2**20 if max_bytes is None else max_bytes
+        self.ring = FrameRing(self.pre_seconds, self.max_bytes)
+        self.writer = writer or clip_writer
+        self.pending = []
+
+    def add(self, ts, jpeg):
+        self.ring.add(ts, jpeg)
+        for clip in list(self.pending):
+            clip.frames.append((ts, jpeg))
+            clip.size += len(jpeg)
+            if ts >= clip.ends_at or clip.size > self.max_bytes:
+                self.pending.remove(clip)
+                self.writer.submit(clip)
+
+    def trigger(self, ts, alert=None, detected_frame=None):
+        """Start a clip around ``ts``, linked to the alert and frame that caused it."""
+        clip = EventClip.objects.create(
+            camera_id=self.camera_id, alert=alert, detected_frame=detected_frame,
+            started_at=utc(ts - self.pre_seconds), triggered_at=utc(ts))
+        if len(self.pending) >= MAX_PENDING:
+            logger.warning(f"Too many clips in progress for Camera ID {self.camera_id}; clip {clip.id} skipped")
+            EventClip.objects.filter(id=clip.id).update(status='failed')
+            return clip
+        self.pending.append(PendingClip(clip.id, self.camera_id, self.ring.since(ts - self.pre_seconds),
+                                        ts + self.post_seconds))
+        return clip
+
+    def flush(self):
+        """Write clips still collecting post-roll with what they have, e.g. when the pipeline stops."""
+        while self.pending:
+            self.writer.submit(self.pending.pop())
+
+
+class ClipWriter:
+    """Writes finished clips to MEDIA_ROOT/clips/ on one background thread.
+
+    Decoding and encoding clips never runs on a pipeline thread. When the
+    queue is full the clip is marked failed rather than stalling the camera.
+    """
+
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, pending):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='clip-writer', daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait(pending)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Clip writer busy; clip {pending.clip_id} for Camera ID {pending.camera_id} dropped")
+            EventClip.objects.filter(id=pending.clip_id).update(status='failed')
+
+    def run(self):
+        while True:
+            pending = self.queue.get()
+            try:
+                self.write(pending)
+            except Exception as e:
+                logger.error(f"Failed to write clip {pending.clip_id}: {str(e)}")
+                EventClip.objects.filter(id=pending.clip_id).update(status='failed')
+            finally:
+                self.queue.task_done()
+                connection.close()
+
+    def write(self, pending):
+        import cv2
+        import numpy as np
+        if not pending.frames:
+            raise ValueError("no frames buffered")
+        name = os.path.join('clips', str(pending.camera_id), f'clip_{pending.clip_id}.mp4')
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        frames = pending.frames
+        duration = frames[-1][0] - frames[0][0]
+        fps = min(30.0, max(1.0, (len(frames) - 1) / duration)) if duration > 0 else 10.0
+        writer = None
+        try:
+            for _, jpeg in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+        EventClip.objects.filter(id=pending.clip_id).update(
+            status='ready', file=name, frames=len(frames), ended_at=utc(frames[-1][0]))
+        logger.info(f"Wrote clip {pending.clip_id} for Camera ID {pending.camera_id}: "
+                    f"{len(frames)} frames over {duration:.1f}s")
+
+
+clip_writer = ClipWriter()
+
+metrics.gauge('cctv_clip_queue_depth', "Event clips waiting to be written.",
+              callback=lambda: {(): clip_writer.queue.qsize()})
+metrics.counter('cctv_clips_dropped_total', "Event clips dropped because the writer was busy.",
+                callback=lambda: {(): clip_writer.dropped})
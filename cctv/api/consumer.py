@@ -1,27 +1,40 @@
 import json
-import cv2
-import base64
-import threading
-import time
-import os
 import logging
-from channels.generic.websocket import WebsocketConsumer
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import WebsocketConsumer, AsyncJsonWebsocketConsumer
 from channels.exceptions import StopConsumer
-from ultralytics import YOLO
 from django.conf import settings
-from .models import Camera, DetectedFrame
+from .acl import can_view_wall, get_camera_acl
+from .events import events_group_name
+from .framecache import first_frame_seconds, latest_frames
+from .logqueue import camera_logger
+from .mosaic import wall_frame_id, wall_group_name, walls
+from .pipeline import camera_group_name, registry
 
 logger = logging.getLogger('custom_logger')
 
 class VideoStreamConsumer(WebsocketConsumer):
     def connect(self):
+        self.connected_at = time.perf_counter()
+        self.first_frame_sent = False
         self.camera_id = self.scope['url_route']['kwargs']['camera_id']
-        self.camera_group_name = f'camera_{self.camera_id}'
-        
+        self.camera_group_name = camera_group_name(self.camera_id)
+        self.holds_pipeline = False
+        self.log = camera_logger(logger, self.camera_id)  # Sampled per-frame lines
+
         logger.info(f"Connecting to camera stream: Camera ID {self.camera_id}")
 
-        # Join camera group
-        self.channel_layer.group_add(
+        if not get_camera_acl(self.scope['user']).can_view(self.camera_id):
+            logger.warning(f"User {self.scope['user'].id} may not view Camera ID {self.camera_id}")
+            self.close(code=4003)
+            return
+
+        # Join camera group; frames arrive through the channel layer from
+        # whichever process runs this camera's pipeline
+        async_to_sync(self.channel_layer.group_add)(
             self.camera_group_name,
             self.channel_name
         )
@@ -29,41 +42,29 @@ class VideoStreamConsumer(WebsocketConsumer):
         self.accept()
         logger.info(f"WebSocket connection accepted for Camera ID {self.camera_id}")
 
-        # Initialize YOLO model
-        self.model = YOLO('yolov8s.pt')
-        logger.debug("YOLO model initialized")
+        # Stream processes run the pipeline themselves, shared by every viewer
+        # of the camera; web processes only relay frames from a worker
+        if settings.CCTV_PROCESS_ROLE == 'stream':
+            registry.acquire(self.camera_id)
+            self.holds_pipeline = True
 
-        # Create output directory
-        output_dir = os.path.join(settings.MEDIA_ROOT, 'detected_frames')
-        os.makedirs(output_dir, exist_ok=True)
-        logger.info(f"Output directory created: {output_dir}")
-
-        # Create a unique filename for this stream
-        output_filename = f'output_camera_{self.camera_id}.mp4'
-        self.output_path = os.path.join(output_dir, output_filename)
-        logger.info(f"Output file path set: {self.output_path}")
-
-        # Initialize video writer
-        self.writer = None
-
-        # Start streaming in a new thread
-        self.streaming_thread = threading.Thread(target=self.stream_video)
-        self.streaming_thread.daemon = True  # Daemonize thread
-        self.streaming_thread.start()
-        logger.info(f"Started streaming thread for Camera ID {self.camera_id}")
+        # Show the camera's latest frame at once rather than after the next capture
+        latest = latest_frames.get(self.camera_id)
+        if latest is not None:
+            self.send_frame(latest.frame, latest.ts, 'cached', detections=latest.detections, cached=True)
 
     def disconnect(self, close_code):
         logger.warning(f"Disconnecting from camera stream: Camera ID {self.camera_id}, Close code: {close_code}")
-        
+
         # Leave camera group
-        self.channel_layer.group_discard(
+        async_to_sync(self.channel_layer.group_discard)(
             self.camera_group_name,
             self.channel_name
         )
-        
-        if hasattr(self, 'writer') and self.writer:
-            self.writer.release()
-            logger.info("Video writer released")
+
+        if self.holds_pipeline:
+            registry.release(self.camera_id)
+            self.holds_pipeline = False
 
         logger.info(f"WebSocket connection closed for Camera ID {self.camera_id}")
         raise StopConsumer()
@@ -77,94 +78,91 @@ class VideoStreamConsumer(WebsocketConsumer):
             logger.warning("Stopping video stream as per request")
             self.close()
 
-    def stream_video(self):
-        logger.info(f"Starting video stream for Camera ID {self.camera_id}")
-
-        try:
-            camera = self.get_camera()
-            cap = cv2.VideoCapture(0)  # Open the webcam
-
-            # Initialize video writer
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            self.writer = cv2.VideoWriter(self.output_path, fourcc, 20.0, 
-                                          (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 
-                                           int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))))
-            logger.debug(f"Video writer initialized with output path: {self.output_path}")
-
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    logger.error("Failed to read frame from webcam")
-                    break
-
-                # Perform object detection
-                results = self.model(frame)
-
-                # If the model detects objects, it will be in the results object
-                # results[0] refers to the first result, usually, in the format of a list of detections
-                annotated_frame = results[0].plot()  # Annotate the frame
-                logger.debug("Object detection and annotation complete")
-
-                # Save detection results to the database
-                detection_result = self.get_detection_result(results)
-
-                # Create DetectedFrame entry in the database
-                detected_frame = DetectedFrame(
-                    camera=camera,
-                    frame_image=self.save_frame_to_file(annotated_frame),
-                    detection_result=detection_result
-                )
-                detected_frame.save()
-                logger.debug("Detection saved to the database")
-
-                # Write frame to video file
-                self.writer.write(annotated_frame)
-                logger.debug("Frame written to video file")
-
-                # Encode frame to base64 for sending over WebSocket
-                _, buffer = cv2.imencode('.jpg', annotated_frame)
-                frame_base64 = base64.b64encode(buffer).decode('utf-8')
-
-                self.send(text_data=json.dumps({
-                    'frame': frame_base64
-                }))
-                logger.debug("Frame sent to WebSocket")
-
-                time.sleep(0.1)  # Adjust this value to control frame rate
-
-        except Exception as e:
-            logger.error(f"Error in stream_video: {str(e)}")
-        finally:
-            if cap.isOpened():
-                cap.release()
-                logger.debug("Webcam resource released")
-            if self.writer:
-                self.writer.release()
-                logger.info("Video writer released")
-            self.close()
+    def stream_frame(self, event):
+        self.send_frame(event['frame'], event.get('ts'))
+        self.log.debug("Frame sent to WebSocket for Camera ID %s", self.camera_id)
+
+    def send_frame(self, frame, ts, source='live', **extra):
+        self.send(text_data=json.dumps({
+            'frame': frame,
+            'ts': ts,  # Capture time, for clients measuring latency
+            **extra,
+        }))
+        if not self.first_frame_sent:
+            self.first_frame_sent = True
+            first_frame_seconds.labels(source).observe(time.perf_counter() - self.connected_at)
+
+    def stream_end(self, event):
+        logger.warning(f"Pipeline ended for Camera ID {self.camera_id}")
+        self.close()
+
+
+class WallStreamConsumer(VideoStreamConsumer):
+    """Streams a video wall's mosaic, composed once in this process for all of its viewers."""
+
+    def connect(self):
+        self.connected_at = time.perf_counter()
+        self.first_frame_sent = False
+        self.wall_id = self.scope['url_route']['kwargs']['wall_id']
+        self.camera_group_name = wall_group_name(self.wall_id)
+        self.holds_pipeline = False
+        self.log = camera_logger(logger, wall_frame_id(self.wall_id))
+
+        if not can_view_wall(self.scope['user'], self.wall_id):
+            logger.warning(f"User {self.scope['user'].id} may not view Video Wall ID {self.wall_id}")
+            self.close(code=4003)
+            return
+
+        async_to_sync(self.channel_layer.group_add)(self.camera_group_name, self.channel_name)
+        self.accept()
+        walls.acquire(self.wall_id)
+        self.holds_pipeline = True
+
+        latest = latest_frames.get(wall_frame_id(self.wall_id))
+        if latest is not None:
+            self.send_frame(latest.frame, latest.ts, 'cached', cached=True)
+
+    def disconnect(self, close_code):
+        async_to_sync(self.channel_layer.group_discard)(self.camera_group_name, self.channel_name)
+        if self.holds_pipeline:
+            walls.release(self.wall_id)
+            self.holds_pipeline = False
+        logger.info(f"WebSocket connection closed for Video Wall ID {self.wall_id}")
+        raise StopConsumer()
+
+
+class DetectionEventConsumer(AsyncJsonWebsocketConsumer):
+    """Streams compact detection events without any video payload.
+
+    Clients may pass ``?cameras=1,2,3`` to narrow the subscription; otherwise
+    they receive events for every camera they are allowed to view. Each
+    camera costs one group membership, not a pipeline or a frame stream.
+    """
+
+    async def connect(self):
+        self.camera_ids = set()
+        acl = await database_sync_to_async(get_camera_acl)(self.scope['user'])
+        viewable = set(acl.viewable)
+        requested = self.requested_cameras()
+        self.camera_ids = viewable & requested if requested is not None else viewable
+
+        for camera_id in self.camera_ids:
+            await self.channel_layer.group_add(events_group_name(camera_id), self.channel_name)
+
+        await self.accept()
+        await self.send_json({'kind': 'subscribed', 'cameras': sorted(self.camera_ids)})
+        logger.info(f"Event subscriber joined for {len(self.camera_ids)} cameras")
+
+    async def disconnect(self, close_code):
+        for camera_id in self.camera_ids:
+            await self.channel_layer.group_discard(events_group_name(camera_id), self.channel_name)
+
+    def requested_cameras(self):
+        query_string = parse_qs(self.scope.get('query_string', b'').decode())
+        cameras = query_string.get('cameras', [None])[0]
+        if not cameras:
+            return None
+        return {int(camera_id) for camera_id in cameras.split(',') if camera_id.strip().isdigit()}
 
-    def get_camera(self):
-        logger.debug(f"Fetching camera information for Camera ID {self.camera_id}")
-        return Camera.objects.get(id=self.camera_id)
-
-    def get_detection_result(self, results):
-        """Extract and return the detection results in a readable format."""
-        detection_result = []
-        for result in results:
-            for detection in result.boxes:
-                label = detection.cls[0]
-                confidence = detection.conf[0]
-                detection_result.append(f"Label: {label}, Confidence: {confidence:.2f}")
-        return "\n".join(detection_result)
-
-    def save_frame_to_file(self, frame):
-        """Save the frame as an image and return the image path."""
-        output_dir = os.path.join(settings.MEDIA_ROOT, 'detected_frames')
-        os.makedirs(output_dir, exist_ok=True)
-
-        timestamp = time.time()
-        frame_filename = f"frame_{timestamp}.jpg"
-        frame_path = os.path.join(output_dir, frame_filename)
-
-        cv2.imwrite(frame_path, frame)
-        return frame_path
+    async def camera_event(self, event):
+        await self.send_json(event['event'])
@@ -0,0 +1,45 @@
+import time
+import logging
+from asgiref.sync import async_to_sync
+
+logger = logging.getLogger(__name__)
+
+
+def events_group_name(camera_id):
+    return f'events_{camera_id}'
+
+
+class EventPublisher:
+    """Publishes compact per-camera detection events on the channel layer.
+
+    Events travel on their own ``events_<camera_id>`` groups, separate from
+    the video groups, so subscribers never receive frame payloads. A camera
+    that sees nothing publishes one empty batch and then stays quiet until
+    something is detected again.
+    """
+
+    def __init__(self, channel_layer, camera_id):
+        self.channel_layer = channel_layer
+        self.camera_id = camera_id
+        self.group_name = events_group_name(camera_id)
+        self.seq = 0
+        self.last_was_empty = False
+
+    def publish(self, kind, **payload):
+        self.seq += 1
+        event = {'camera': self.camera_id, 'kind': kind, 'seq': self.seq, 'ts': round(time.time(), 3)}
+        event.update(payload)
+        async_to_sync(self.channel_layer.group_send)(self.group_name, {
+            'type': 'camera.event',
+            'event': event,
+        })
+
+    def publish_detections(self, detections):
+        """Publish one frame's detections as ``[label, confidence, x1, y1, x2, y2]`` rows."""
+        if not detections:
+            if self.last_was_empty:
+                return
+            self.last_was_empty = True
+        else:
+            self.last_was_empty = False
+        self.publish('detections', detections=detections)
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# One camera's most recent published frame: the JPEG, its base64 form as sent
+# over WebSockets, the detections drawn on it and a per-pipeline sequence number.
+LatestFrame = namedtuple('LatestFrame', ['camera_id', 'seq', 'ts', 'jpeg', 'frame', 'detections'])
+
+
+def latest_frame_key(camera_id):
+    return f'latest_frame:{camera_id}'
+
+
+class LatestFrames:
+    """The latest encoded frame of every camera, so new viewers see a picture at once.
+
+    Pipelines replace their camera's entry on every frame. Viewers in the
+    same process read it from memory. Pipelines holding a camera lease also
+    copy it to the shared cache, at most every ``share_interval`` seconds,
+    for viewers in other processes. Entries older than ``ttl`` are not served.
+    """
+
+    def __init__(self, ttl=None, share_interval=None):
+        self.ttl = settings.CCTV_LATEST_FRAME_TTL if ttl is None else ttl
+        self.share_interval = settings.CCTV_LATEST_FRAME_SHARE_INTERVAL if share_interval is None else share_interval
+        self.frames = {}
+        self.shared_at = {}
+
+    def put(self, latest, share=None):
+        self.frames[latest.camera_id] = latest
+        if share is None:
+            share = settings.CCTV_PROCESS_ROLE == 'worker'
+        if share and latest.ts - self.shared_at.get(latest.camera_id, 0) >= self.share_interval:
+            self.shared_at[latest.camera_id] = latest.ts
+            cache.set(latest_frame_key(latest.camera_id), latest, self.ttl)
+
+    def get(self, camera_id):
+        latest = self.frames.get(camera_id)
+        if latest is None:
+            latest = cache.get(latest_frame_key(camera_id))
+        if latest is None or time.time() - latest.ts > self.ttl:
+            return None
+        return latest
+
+    def get_many(self, camera_ids):
+        """Return {camera id: latest frame} for the ids with a fresh frame, in one cache round trip."""
+        found = {camera_id: self.frames.get(camera_id) for camera_id in camera_ids}
+        missing = [camera_id for camera_id, latest in found.items() if latest is None]
+        if missing:
+            shared = cache.get_many([latest_frame_key(camera_id) for camera_id in missing])
+            for camera_id in missing:
+                found[camera_id] = shared.get(latest_frame_key(camera_id))
+        now = time.time()
+        return {camera_id: latest for camera_id, latest in found.items()
+                if latest is not None and now - latest.ts <= self.ttl}
+
+    def discard(self, camera_id):
+        self.frames.pop(camera_id, None)
+        if self.shared_at.pop(camera_id, None) is not None:
+            cache.delete(latest_frame_key(camera_id))
+
+
+class SnapshotVariants:
+    """A small LRU of resized JPEGs, keyed by camera, frame sequence and size.
+
+    Dashboards polling many thumbnails ask for the same few sizes of the
+    same frame, so each is only decoded and resized once.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = settings.CCTV_SNAPSHOT_VARIANTS if maxsize is None else maxsize
+        self.variants = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, latest, width=None, height=None):
+        if not width and not height:
+            return latest.jpeg
+        key = (latest.camera_id, latest.seq, latest.ts, width, height)
+        with self.lock:
+            jpeg = self.variants.get(key)
+            if jpeg is not None:
+                self.variants.move_to_end(key)
+                self.hits += 1
+                return jpeg
+            self.misses += 1
+        jpeg = resize_jpeg(latest.jpeg, width, height)
+        with self.lock:
+            self.variants[key] = jpeg
+            while len(self.variants) > self.maxsize:
+                self.variants.popitem(last=False)
+        return jpeg
+
+
+def resize_jpeg(jpeg, width=None, height=None, quality=80):
+    """Scale a JPEG to fit within width x height, keeping its aspect ratio; never upscales."""
+    from PIL import Image  # Pillow, not cv2, so web processes stay free of the ML stack
+    image = Image.open(BytesIO(jpeg))
+    size = (width or image.width, height or image.height)
+    image.draft('RGB', size)  # Let the decoder downscale by up to 8x while decoding
+    image.thumbnail(size)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+latest_frames = LatestFrames()
+snapshot_variants = SnapshotVariants()
+
+first_frame_seconds = metrics.histogram(
+    'cctv_first_frame_seconds', "Time from a viewer connecting to its first frame.", ('source',))
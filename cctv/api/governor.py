@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+import psutil
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Utilisation of the node's CPU budget above which work is shed, and below
+# which it is restored; the gap keeps cameras from flapping between levels.
+HIGH_WATER = 0.9
+LOW_WATER = 0.7
+# Weight of the newest sample in the per-stage moving averages.
+SMOOTHING = 0.2
+HIGH_PRIORITY = 2
+
+# What a camera gives up at each degradation level: detector runs are spread
+# over more frames first, then the cascade stops escalating to the large
+# model, then the model input shrinks and finally fewer frames are processed.
+Degradation = namedtuple('Degradation', ['interval', 'escalate', 'input_scale', 'frame_delay'])
+LEVELS = (
+    Degradation(interval=1, escalate=True, input_scale=1.0, frame_delay=1),
+    Degradation(interval=2, escalate=True, input_scale=1.0, frame_delay=1),
+    Degradation(interval=4, escalate=False, input_scale=1.0, frame_delay=1),
+    Degradation(interval=4, escalate=False, input_scale=0.5, frame_delay=2),
+    Degradation(interval=8, escalate=False, input_scale=0.5, frame_delay=4),
+)
+
+
+def governor_cache_key(node):
+    return f'governor:{node}'
+
+
+class StageCosts:
+    """Moving averages of one pipeline's per-frame stage times and frame rate."""
+
+    def __init__(self):
+        self.stages = {}
+        self.frame_period = None
+        self.last_frame = None
+
+    def record(self, stage, seconds):
+        previous = self.stages.get(stage)
+        self.stages[stage] = seconds if previous is None else previous + SMOOTHING * (seconds - previous)
+
+    def frame_done(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_frame is not None:
+            period = now - self.last_frame
+            self.frame_period = period if self.frame_period is None else (
+                self.frame_period + SMOOTHING * (period - self.frame_period))
+        self.last_frame = now
+
+    @property
+    def fps(self):
+        return 1 / self.frame_period if self.frame_period else 0.0
+
+    @property
+    def cost(self):
+        """Seconds of work per second of wall time, i.e. cores used."""
+        return sum(self.stages.values()) * self.fps
+
+    def as_dict(self):
+        return {
+            'fps': round(self.fps, 2),
+            'cost': round(self.cost, 3),
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+        }
+
+
+class CameraLoad:
+    def __init__(self, priority):
+        self.priority = priority
+        self.level = 0
+        self.costs = StageCosts()
+
+
+class CpuGovernor:
+    """Keeps this process's pipelines within a CPU budget.
+
+    Every ``interval`` seconds the process CPU time is compared with the
+    budget. Over the high-water mark one camera is degraded a level: the
+    lowest priority first, and among equals the most expensive. Under the
+    low-water mark one camera is restored, highest priority first.
+    High-priority cameras are never degraded.
+    """
+
+    def __init__(self, budget=None, interval=None, node=None):
+        self.budget = budget or settings.CCTV_CPU_BUDGET or os.cpu_count()
+        self.interval = interval or settings.CCTV_GOVERNOR_INTERVAL
+        self.node = node or settings.CCTV_WORKER_NAME
+        self.lock = threading.Lock()
+        self.cameras = {}
+        self.decisions = deque(maxlen=20)
+        self.utilization = 0.0
+        self.thread = None
+        self.process = psutil.Process()
+        self.last_sample = None
+
+    def register(self, camera_id, priority):
+        with self.lock:
+            load = self.cameras[camera_id] = CameraLoad(priority)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return load.costs
+
+    def unregister(self, camera_id):
+        with self.lock:
+            self.cameras.pop(camera_id, None)
+
+    def degradation(self, camera_id):
+        load = self.cameras.get(camera_id)
+        return LEVELS[load.level if load else 0]
+
+    def sample(self):
+        """Share of the CPU budget this process used since the last sample."""
+        times = self.process.cpu_times()
+        now = (time.monotonic(), times.user + times.system)
+        previous, self.last_sample = self.last_sample, now
+        if previous is None or now[0] <= previous[0]:
+            return self.utilization
+        return (now[1] - previous[1]) / (now[0] - previous[0]) / self.budget
+
+    def step(self, utilization):
+        """Degrade or restore at most one camera; return the decision, if any."""
+        self.utilization = utilization
+        with self.lock:
+            loads = list(self.cameras.items())
+        if utilization > HIGH_WATER:
+            candidates = [(camera_id, load) for camera_id, load in loads
+                          if load.priority < HIGH_PRIORITY and load.level < len(LEVELS) - 1]
+            candidates.sort(key=lambda item: (item[1].priority, -item[1].costs.cost))
+            change = 1
+        elif utilization < LOW_WATER:
+            candidates = [(camera_id, load) for camera_id, load in loads if load.level > 0]
+            candidates.sort(key=lambda item: (-item[1].priority, item[1].level))
+            change = -1
+        else:
+            return None
+        if not candidates:
+            return None
+
+        camera_id, load = candidates[0]
+        load.level += change
+        decision = {
+            'ts': time.time(),
+            'camera': camera_id,
+            'action': 'degrade' if change > 0 else 'restore',
+            'level': load.level,
+            'utilization': round(utilization, 3),
+        }
+        self.decisions.append(decision)
+        logger.info(f"Governor {decision['action']}d Camera ID {camera_id} to level {load.level} "
+                    f"at {utilization:.0%} of {self.budget} cores")
+        return decision
+
+    def snapshot(self):
+        with self.lock:
+            loads = list(self.cameras.items())
+        return {
+            'node': self.node,
+            'ts': time.time(),
+            'budget_cores': self.budget,
+            'utilization': round(self.utilization, 3),
+            'headroom_cores': round(max(0.0, 1 - self.utilization) * self.budget, 2),
+            'cameras': [
+                {'camera': camera_id, 'priority': load.priority, 'level': load.level,
+                 'degradation': LEVELS[load.level]._asdict(), **load.costs.as_dict()}
+                for camera_id, load in sorted(loads)
+            ],
+            'decisions': list(self.decisions),
+        }
+
+    def run(self):
+        self.sample()
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.step(self.sample())
+                # Shared through the cache so any web process can show every node
+                cache.set(governor_cache_key(self.node), self.snapshot(), self.interval * 3)
+            except Exception as e:
+                logger.error(f"Governor tick failed: {str(e)}")
+
+
+def governor_snapshots(nodes):
+    snapshots = cache.get_many([governor_cache_key(node) for node in nodes])
+    return [snapshots[key] for key in sorted(snapshots)]
+
+
+governor = CpuGovernor()
+
+metrics.gauge('cctv_governor_utilization', "Share of the CPU budget used by this process.",
+              callback=lambda: {(): round(governor.utilization, 3)})
+metrics.gauge('cctv_camera_degradation_level', "Governor degradation level of each camera.", ('camera',),
+              callback=lambda: {(camera_id,): load.level for camera_id, load in list(governor.cameras.items())})
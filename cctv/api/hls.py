@@ -0,0 +1,97 @@
+import logging
+import os
+import queue
+import subprocess
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST = 'index.m3u8'
+
+
+def hls_directory(camera_id):
+    return os.path.join(settings.MEDIA_ROOT, 'hls', str(camera_id))
+
+
+def hls_playlist_url(camera_id):
+    return f'{settings.MEDIA_URL}hls/{camera_id}/{PLAYLIST}'
+
+
+def hls_command(output_dir):
+    """ffmpeg reading JPEGs on stdin and writing rolling H.264 segments plus a live playlist."""
+    segment = settings.CCTV_HLS_SEGMENT_SECONDS
+    return [
+        settings.CCTV_FFMPEG, '-hide_banner', '-loglevel', 'error',
+        # Frames arrive at whatever rate the pipeline runs; stamp them as they come
+        '-f', 'image2pipe', '-c:v', 'mjpeg', '-use_wallclock_as_timestamps', '1', '-i', '-',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})',
+        '-f', 'hls', '-hls_time', str(segment), '-hls_list_size', str(settings.CCTV_HLS_PLAYLIST_SIZE),
+        '-hls_flags', 'delete_segments+independent_segments',
+        '-hls_segment_filename', os.path.join(output_dir, 'segment_%05d.ts'),
+        os.path.join(output_dir, PLAYLIST),
+    ]
+
+
+class HlsWriter:
+    """Feeds one camera's encoded JPEGs to a single ffmpeg process writing HLS segments.
+
+    The segments and playlist are plain files, so any number of players can
+    be served by the web server or a CDN without reaching Python. Frames
+    pass through a small queue to a writer thread; when ffmpeg falls behind
+    frames are dropped rather than stalling the pipeline.
+    """
+
+    def __init__(self, camera_id, command=None, maxsize=30):
+        self.camera_id = camera_id
+        self.output_dir = hls_directory(camera_id)
+        self.command = command or hls_command(self.output_dir)
+        self.queue = queue.Queue(maxsize)
+        self.process = None
+        self.thread = None
+        self.dropped = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, 'ffmpeg.log'), 'ab') as log:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                            stderr=log)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        logger.info(f"Writing HLS for Camera ID {self.camera_id} to {self.output_dir}")
+
+    def write(self, jpeg):
+        try:
+            self.queue.put_nowait(jpeg)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            jpeg = self.queue.get()
+            if jpeg is None:
+                break
+            try:
+                self.process.stdin.write(jpeg)
+            except (BrokenPipeError, ValueError):
+                logger.error(f"ffmpeg for Camera ID {self.camera_id} exited with {self.process.poll()}; "
+                             f"see {self.output_dir}/ffmpeg.log")
+                break
+
+    def close(self):
+        try:
+            self.queue.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self.thread.join(timeout=5)
+        try:
+            self.process.stdin.close()  # ffmpeg finishes the last segment and ends the playlist
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self.dropped:
+            logger.warning(f"HLS for Camera ID {self.camera_id} dropped {self.dropped} frames")
@@ -0,0 +1,45 @@
+import logging
+import threading
+import time
+from django.db import connection
+from .models import Camera, VideoWall
+from .mosaic import walls
+from .pipeline import registry
+
+logger = logging.getLogger(__name__)
+
+
+class HlsHolder:
+    """Keeps HLS-enabled cameras and walls running with nobody watching them live.
+
+    Pipelines otherwise only run while a WebSocket or MJPEG viewer holds
+    them, and an HLS audience never connects to Python. Stream processes
+    hold both; sharded workers already run every camera they own, so they
+    only hold walls. Leases keep each one to a single process.
+    """
+
+    interval = 10  # Seconds between re-reading which cameras and walls have HLS enabled
+
+    def __init__(self, cameras=registry, wall_registry=walls):
+        self.cameras = cameras
+        self.walls = wall_registry
+        self.thread = None
+
+    def sync(self):
+        if self.cameras is not None:
+            self.cameras.hold(Camera.objects.filter(hls_enabled=True).values_list('id', flat=True))
+        self.walls.hold(VideoWall.objects.filter(hls_enabled=True).values_list('id', flat=True))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='hls-holder', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Failed to hold HLS outputs: {str(e)}")
+            finally:
+                connection.close()
+            time.sleep(self.interval)
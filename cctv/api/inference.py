@@ -0,0 +1,398 @@
+import ast
+import copy
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from .threads import thread_budget
+
+logger = logging.getLogger(__name__)
+
+# Same thresholds as ultralytics' predictor, so backends agree on what counts as a detection
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+PAD_VALUE = 114
+# Escalations a cascade may bank while under budget, to absorb short bursts.
+ESCALATION_BURST = 5
+
+# Detections leave every backend as compact [label, confidence, x1, y1, x2, y2] rows in
+# frame pixels, the format events and alert rules already consume. cv2, torch and
+# onnxruntime are imported inside the backends so only pipeline processes load them.
+
+
+class InferenceBackend:
+    name = None
+    thread_safe = False  # Whether one instance may serve several camera threads
+
+    def __init__(self, input_size=640):
+        self.input_size = input_size
+
+    def detect(self, frame):
+        raise NotImplementedError
+
+    def detect_batch(self, frames):
+        """Detections for each of several frames; backends that batch natively override this."""
+        return [self.detect(frame) for frame in frames]
+
+    def resized(self, input_size):
+        """This backend at another input size, sharing its loaded model where the model allows."""
+        backend = copy.copy(self)
+        backend.input_size = input_size
+        return backend
+
+
+class TorchBackend(InferenceBackend):
+    """The ultralytics model on PyTorch eager; the accuracy baseline."""
+
+    name = 'torch'
+
+    def __init__(self, input_size=640, weights=None):
+        super().__init__(input_size)
+        from ultralytics import YOLO
+        self.model = YOLO(weights or settings.CCTV_DETECTOR_WEIGHTS)
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        # One forward pass over the whole list
+        results = self.model(list(frames), imgsz=self.input_size, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD,
+                             verbose=False)
+        batches = []
+        for result in results:
+            detections = []
+            for box in result.boxes:
+                x1, y1, x2, y2 = (int(value) for value in box.xyxy[0].tolist())
+                label = result.names[int(box.cls[0])]
+                detections.append([label, round(float(box.conf[0]), 2), x1, y1, x2, y2])
+            batches.append(detections)
+        return batches
+
+
+class OnnxBackend(InferenceBackend):
+    """An exported YOLOv8 ONNX model on the ONNX Runtime CPU provider.
+
+    Sessions are safe to call from several threads, so cameras with the same
+    backend and input size share one.
+    """
+
+    name = 'onnx'
+    int8 = False
+    thread_safe = True
+
+    def __init__(self, input_size=640, weights=None, path=None):
+        super().__init__(input_size)
+        import onnxruntime
+        self.weights = weights
+        self.path = path or onnx_model_path(weights or settings.CCTV_DETECTOR_WEIGHTS, input_size, self.int8)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"{self.path} not found; run 'manage.py export_detector --imgsz {input_size}"
+                                    f"{' --int8' if self.int8 else ''}'")
+        self.session = onnxruntime.InferenceSession(str(self.path), sess_options=thread_budget.session_options(),
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def preprocess(self, frame):
+        """Letterbox a BGR frame into the square NCHW float tensor the model expects."""
+        import cv2
+        height, width = frame.shape[:2]
+        scale = min(self.input_size / height, self.input_size / width)
+        resized_width, resized_height = round(width * scale), round(height * scale)
+        pad_x = (self.input_size - resized_width) / 2
+        pad_y = (self.input_size - resized_height) / 2
+
+        resized = cv2.resize(frame, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+        canvas = np.full((self.input_size, self.input_size, 3), PAD_VALUE, dtype=np.uint8)
+        top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+        canvas[top:top + resized_height, left:left + resized_width] = resized
+
+        tensor = canvas[:, :, ::-1].transpose(2, 0, 1)[np.newaxis]  # BGR HWC to RGB NCHW
+        return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0, scale, (left, top)
+
+    def postprocess(self, output, scale, padding, frame_shape):
+        """Turn the raw (1, 4 + classes, anchors) output into detection rows."""
+        import cv2
+        predictions = output[0].T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= CONF_THRESHOLD
+        if not keep.any():
+            return []
+        boxes, confidences, class_ids = predictions[keep, :4], confidences[keep], class_ids[keep]
+
+        # Centre/size boxes in model pixels to corner boxes in frame pixels
+        xyxy = np.empty_like(boxes)
+        xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+        xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - padding[0]) / scale
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - padding[1]) / scale
+        height, width = frame_shape[:2]
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+
+        # Per-class NMS, like the ultralytics predictor
+        rects = np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+        kept = cv2.dnn.NMSBoxesBatched(rects.tolist(), confidences.tolist(), class_ids.tolist(),
+                                       CONF_THRESHOLD, IOU_THRESHOLD)
+        detections = []
+        for index in sorted(np.array(kept).flatten(), key=lambda i: -confidences[i]):
+            x1, y1, x2, y2 = (int(value) for value in xyxy[index])
+            label = self.names.get(int(class_ids[index]), str(class_ids[index]))
+            detections.append([label, round(float(confidences[index]), 2), x1, y1, x2, y2])
+        return detections
+
+    def detect(self, frame):
+        tensor, scale, padding = self.preprocess(frame)
+        output = self.session.run(None, {self.input_name: tensor})[0]
+        return self.postprocess(output, scale, padding, frame.shape)
+
+    def resized(self, input_size):
+        # Exports have a fixed input shape, so another size is another model; shared once loaded
+        return load_backend(self.name, input_size, self.weights)
+
+
+class Int8OnnxBackend(OnnxBackend):
+    """The ONNX model with INT8 weights and activations; faster, slightly less accurate."""
+
+    name = 'onnx-int8'
+    int8 = True
+
+
+class CascadeBackend(InferenceBackend):
+    """Screens every frame with a small model and re-runs the full model only when needed.
+
+    A frame is escalated when the screening model reports one of the
+    camera's high-value labels, or any detection it is unsure of. Each frame
+    earns ``budget`` of an escalation, so at most that share of frames reach
+    the full model; past it the screening detections are used as they are.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, screen, full, labels=(), confidence=0.5, budget=0.25):
+        super().__init__(full.input_size)
+        self.screen = screen
+        self.full = full
+        self.labels = set(labels)
+        self.confidence = confidence
+        self.budget = budget
+        self.credit = 1.0
+        self.escalate = True  # Cleared by the CPU governor to shed load
+        self.frames = 0
+        self.escalations = Counter()
+        self.over_budget = 0
+
+    def escalation_reason(self, detections):
+        for label, confidence, *_ in detections:
+            if label in self.labels:
+                return 'label'
+        for label, confidence, *_ in detections:
+            if confidence < self.confidence:
+                return 'ambiguous'
+        return None
+
+    def detect(self, frame):
+        self.frames += 1
+        detections = self.screen.detect(frame)
+        reason = self.escalation_reason(detections)
+        self.credit = min(self.credit + self.budget, ESCALATION_BURST)
+        if reason is None:
+            return detections
+        if self.credit < 1 or not self.escalate:
+            self.over_budget += 1
+            return detections
+        self.credit -= 1
+        self.escalations[reason] += 1
+        return self.full.detect(frame)
+
+    def resized(self, input_size):
+        """Resize both models in place, keeping the escalation budget and statistics.
+
+        Both are resized before either is swapped in, so a failure leaves
+        the cascade at its previous size rather than at two sizes.
+        """
+        screen = self.screen.resized(input_size)
+        full = self.full.resized(input_size)
+        self.screen, self.full, self.input_size = screen, full, input_size
+        return self
+
+    def stats(self):
+        escalated = sum(self.escalations.values())
+        return {
+            'frames': self.frames,
+            'escalated': escalated,
+            'escalation_rate': round(escalated / self.frames, 3) if self.frames else 0.0,
+            'by_reason': dict(self.escalations),
+            'over_budget': self.over_budget,
+        }
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, OnnxBackend, Int8OnnxBackend)}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def load_backend(name='torch', input_size=640, weights=None):
+    """Build a backend, reusing one instance across cameras when it is thread-safe."""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend: {name}")
+    if not backend_class.thread_safe:
+        return backend_class(input_size, weights=weights)
+
+    key = (name, input_size, weights)
+    with _shared_lock:
+        backend = _shared.get(key)
+        if backend is None:
+            backend = _shared[key] = backend_class(input_size, weights=weights)
+            logger.info(f"Loaded {name} backend at {input_size}px from {backend.path}")
+        return backend
+
+
+def camera_backend(camera, input_size=None):
+    """Build the detector configured on a camera, cascaded behind a screening model if set."""
+    input_size = input_size or camera.detector_input_size
+    full = load_backend(camera.detector_backend, input_size)
+    if not camera.screening_weights:
+        return full
+    screen = load_backend(camera.detector_backend, input_size, weights=camera.screening_weights)
+    return CascadeBackend(screen, full, labels=camera.escalation_labels,
+                          confidence=camera.escalation_confidence, budget=camera.escalation_budget)
+
+
+def onnx_model_path(weights, input_size, int8=False):
+    suffix = '.int8' if int8 else ''
+    return Path(settings.CCTV_MODEL_DIR) / f'{Path(weights).stem}-{input_size}{suffix}.onnx'
+
+
+def export_onnx(weights, input_size):
+    """Export the ultralytics weights to ONNX at a fixed input size."""
+    from ultralytics import YOLO
+    target = onnx_model_path(weights, input_size)
+    os.makedirs(target.parent, exist_ok=True)
+    exported = YOLO(weights).export(format='onnx', imgsz=input_size, dynamic=False)
+    os.replace(exported, target)
+    return target
+
+
+def quantize_onnx(weights, input_size, calibration_frames=None):
+    """Write the INT8 variant of an exported model.
+
+    With calibration frames, activations are quantized statically from their
+    observed ranges, which keeps convolutions in INT8 end to end. Without them
+    only the weights are quantized and activations are scaled at run time.
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    class CalibrationReader(CalibrationDataReader):
+        def __init__(self, backend, frames):
+            self.input_name = backend.input_name
+            self.tensors = iter([backend.preprocess(frame)[0] for frame in frames])
+
+        def get_next(self):
+            tensor = next(self.tensors, None)
+            return None if tensor is None else {self.input_name: tensor}
+
+    source = onnx_model_path(weights, input_size)
+    target = onnx_model_path(weights, input_size, int8=True)
+    if calibration_frames:
+        reader = CalibrationReader(OnnxBackend(input_size, path=source), calibration_frames)
+        quantize_static(str(source), str(target), reader, quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    else:
+        quantize_dynamic(str(source), str(target), weight_type=QuantType.QUInt8)
+    return target
+
+
+def read_clip(path, limit=None, stride=1):
+    """Decode up to ``limit`` frames of a local video file into memory."""
+    import cv2
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    index = 0
+    try:
+        while limit is None or len(frames) < limit:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if index % stride == 0:
+                frames.append(frame)
+            index += 1
+    finally:
+        capture.release()
+    if not frames:
+        raise ValueError(f"No frames could be read from {path}")
+    return frames
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_detections(reference, candidate, iou=0.5):
+    """Greedily pair same-label boxes; return (matched, missed, extra) counts."""
+    unmatched = list(reference)
+    matched = 0
+    for detection in sorted(candidate, key=lambda row: -row[1]):
+        best, best_iou = None, iou
+        for index, other in enumerate(unmatched):
+            if other[0] != detection[0]:
+                continue
+            overlap = box_iou(detection[2:], other[2:])
+            if overlap >= best_iou:
+                best, best_iou = index, overlap
+        if best is not None:
+            unmatched.pop(best)
+            matched += 1
+    return matched, len(unmatched), len(candidate) - matched
+
+
+def agreement(reference_batches, candidate_batches, iou=0.5):
+    """Precision, recall and F1 of one backend's detections against a baseline's."""
+    matched = missed = extra = 0
+    for reference, candidate in zip(reference_batches, candidate_batches):
+        counts = match_detections(reference, candidate, iou)
+        matched, missed, extra = matched + counts[0], missed + counts[1], extra + counts[2]
+    precision = matched / (matched + extra) if matched + extra else 1.0
+    recall = matched / (matched + missed) if matched + missed else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4)}
+
+
+def run_backend(backend, frames, warmup=3):
+    """Run a backend over frames; return its detections and throughput."""
+    for frame in frames[:warmup]:
+        backend.detect(frame)
+    started = time.perf_counter()
+    batches = [backend.detect(frame) for frame in frames]
+    elapsed = time.perf_counter() - started
+    return batches, {
+        'frames': len(frames),
+        'fps': round(len(frames) / elapsed, 2),
+        'ms_per_frame': round(elapsed * 1000 / len(frames), 2),
+    }
+
+
+def draw_detections(frame, detections):
+    """Draw detection boxes and labels onto a copy of the frame."""
+    import cv2
+    annotated = frame.copy()
+    for label, confidence, x1, y1, x2, y2 in detections:
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(annotated, f'{label} {confidence:.2f}', (x1, max(y1 - 5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    return annotated
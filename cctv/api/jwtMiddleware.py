@@ -1,13 +1,114 @@
 import jwt
+import time
+import threading
+from collections import OrderedDict
 from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
 from channels.db import database_sync_to_async
 from urllib.parse import parse_qs
-from .models import User
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .acl import get_camera_acl
+from .metrics import metrics
+from .models import Camera, CameraPermission, User
 import logging
 from channels.middleware import BaseMiddleware
 
 logger = logging.getLogger(__name__)
 
+
+class UserSnapshot:
+    """The parts of a user WebSocket consumers need, cached per token.
+
+    ``get_camera_acl`` picks up the snapshot's ACL directly, so permission
+    checks on a cached handshake need neither the cache nor the database.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, email, role, is_active, acl):
+        self.id = self.pk = id
+        self.email = email
+        self.role = role
+        self.is_active = is_active
+        self._camera_acl = acl
+
+    @property
+    def viewable_cameras(self):
+        return self._camera_acl.viewable
+
+    def __str__(self):
+        return self.email
+
+
+class TokenCache:
+    """Bounded LRU of validated token -> UserSnapshot.
+
+    Entries expire with the token, or after ``ttl`` seconds so changes made
+    on another node are picked up; changes made in this process drop the
+    affected entries straight away through signals.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self.entries[token]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, token, user, token_expires_at):
+        expires_at = min(token_expires_at, time.time() + self.ttl)
+        with self.lock:
+            self.entries[token] = (expires_at, user)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in [token for token, entry in self.entries.items() if entry[1].id == user_id]:
+                del self.entries[token]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(settings.CCTV_TOKEN_CACHE_SIZE, settings.CCTV_TOKEN_CACHE_TTL)
+metrics.gauge('cctv_token_cache', "WebSocket token cache size and hit counters.", ('stat',),
+              callback=lambda: {(stat,): value for stat, value in token_cache.stats().items()})
+
+
 @database_sync_to_async
 def get_user_from_jwt(token):
     try:
@@ -16,9 +117,38 @@ def get_user_from_jwt(token):
         
         access_token = AccessToken(token)
         user = User.objects.get(id=access_token['user_id'])
+        if not user.is_active:
+            return None, None
+        snapshot = UserSnapshot(user.id, user.email, user.role, user.is_active, get_camera_acl(user))
+        return snapshot, access_token['exp']
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, TokenError, User.DoesNotExist):
+        return None, None
+
+
+async def authenticate_token(token):
+    """Return the user for ``token``, from the cache when possible."""
+    user = token_cache.get(token)
+    if user is not None:
         return user
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, User.DoesNotExist):
-        return None
+    user, expires_at = await get_user_from_jwt(token)
+    if user is not None:
+        token_cache.set(token, user, expires_at)
+    return user
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.id)
+
+
+@receiver([post_save, post_delete], sender=CameraPermission)
+def camera_permission_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Camera)
+def camera_changed(sender, instance, **kwargs):
+    token_cache.clear()
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
@@ -36,7 +166,7 @@ class JWTAuthMiddleware(BaseMiddleware):
             await self.close_connection(send, 4002, "Authentication token required")
             return
         
-        user = await get_user_from_jwt(token)
+        user = await authenticate_token(token)
         if user is None:
             logger.warning("Invalid or expired token")
             await self.close_connection(send, 4001, "Invalid or expired token")
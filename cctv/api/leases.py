@@ -0,0 +1,153 @@
+import time
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Now
+from .models import CameraLease, PipelineWorker
+from .sharding import HashRing
+
+logger = logging.getLogger(__name__)
+
+# Stop trusting a lease slightly before the database would let another
+# worker take it, so two pipelines never run inference for the same camera.
+SAFETY_MARGIN = 0.2
+
+
+class Lease:
+    """Time-limited ownership of one camera's pipeline by one worker.
+
+    Expiry is computed by the database clock, so workers with skewed clocks
+    still agree on when a lease is free. Locally the holder keeps a monotonic
+    deadline that ends before the database expiry; ``is_held()`` turns false
+    as soon as a heartbeat is missed, even if the database is unreachable.
+    """
+
+    def __init__(self, camera_id, owner, ttl=None):
+        self.camera_id = camera_id
+        self.owner = owner
+        self.ttl = ttl or settings.CCTV_LEASE_TTL
+        self.deadline = 0.0
+
+    def acquire(self):
+        """Take the lease if it is free, expired or already ours."""
+        started = time.monotonic()
+        expires_at = Now() + timedelta(seconds=self.ttl)
+        taken = CameraLease.objects.filter(camera_id=self.camera_id).filter(
+            Q(owner=self.owner) | Q(expires_at__lte=Now())
+        ).update(
+            acquired_at=Case(When(owner=self.owner, then=F('acquired_at')), default=Now()),
+            owner=self.owner,
+            heartbeat_at=Now(),
+            expires_at=expires_at,
+        )
+        if not taken:
+            try:
+                with transaction.atomic():
+                    CameraLease.objects.create(
+                        camera_id=self.camera_id,
+                        owner=self.owner,
+                        acquired_at=Now(),
+                        heartbeat_at=Now(),
+                        expires_at=expires_at,
+                    )
+                taken = True
+            except IntegrityError:
+                taken = False
+
+        if taken:
+            self.deadline = started + self.ttl * (1 - SAFETY_MARGIN)
+            logger.info(f"{self.owner} acquired lease for Camera ID {self.camera_id}")
+        return bool(taken)
+
+    def renew(self):
+        """Extend a lease we still hold; returns False once it has been lost."""
+        started = time.monotonic()
+        if not self.is_held():
+            return False
+        renewed = CameraLease.objects.filter(
+            camera_id=self.camera_id, owner=self.owner, expires_at__gt=Now()
+        ).update(heartbeat_at=Now(), expires_at=Now() + timedelta(seconds=self.ttl))
+        if renewed:
+            self.deadline = started + self.ttl * (1 - SAFETY_MARGIN)
+        else:
+            self.deadline = 0.0
+            logger.warning(f"{self.owner} lost lease for Camera ID {self.camera_id}")
+        return bool(renewed)
+
+    def release(self):
+        self.deadline = 0.0
+        CameraLease.objects.filter(camera_id=self.camera_id, owner=self.owner).delete()
+        logger.info(f"{self.owner} released lease for Camera ID {self.camera_id}")
+
+    def is_held(self):
+        return time.monotonic() < self.deadline
+
+
+class CacheLease:
+    """A lease kept in the shared cache, for pipelines without a camera row such as video walls.
+
+    Same interface as ``Lease``. Taking it is atomic through ``cache.add``;
+    renewal only checks the owner first, which is enough for work that is
+    merely duplicated for a moment, never persisted twice.
+    """
+
+    def __init__(self, key, owner, ttl=None):
+        self.key = f'lease:{key}'
+        self.owner = owner
+        self.ttl = ttl or settings.CCTV_LEASE_TTL
+        self.deadline = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        taken = cache.add(self.key, self.owner, self.ttl) or self.renew()
+        if taken:
+            self.deadline = started + self.ttl * (1 - SAFETY_MARGIN)
+        return taken
+
+    def renew(self):
+        started = time.monotonic()
+        renewed = cache.get(self.key) == self.owner and cache.touch(self.key, self.ttl)
+        self.deadline = started + self.ttl * (1 - SAFETY_MARGIN) if renewed else 0.0
+        return bool(renewed)
+
+    def release(self):
+        self.deadline = 0.0
+        if cache.get(self.key) == self.owner:
+            cache.delete(self.key)
+
+    def is_held(self):
+        return time.monotonic() < self.deadline
+
+
+def heartbeat_worker(name):
+    """Record that worker ``name`` is alive."""
+    updated = PipelineWorker.objects.filter(name=name).update(heartbeat_at=Now())
+    if not updated:
+        try:
+            with transaction.atomic():
+                PipelineWorker.objects.create(name=name, heartbeat_at=Now())
+        except IntegrityError:
+            pass
+
+
+def remove_worker(name):
+    PipelineWorker.objects.filter(name=name).delete()
+
+
+def live_workers(ttl=None):
+    """Names of workers whose last heartbeat is within one lease TTL."""
+    ttl = ttl or settings.CCTV_LEASE_TTL
+    names = PipelineWorker.objects.filter(
+        heartbeat_at__gt=Now() - timedelta(seconds=ttl)
+    ).values_list('name', flat=True)
+    if settings.CCTV_WORKERS:
+        names = [name for name in names if name in settings.CCTV_WORKERS]
+    return sorted(names)
+
+
+def live_ring(ttl=None):
+    """Hash ring over live workers; a dead worker's cameras move to the next node."""
+    return HashRing(live_workers(ttl))
@@ -0,0 +1,118 @@
+import asyncio
+import base64
+import logging
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from .framecache import latest_frames
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = 'frame'
+
+
+def mjpeg_part(jpeg):
+    """One multipart/x-mixed-replace part holding a JPEG."""
+    return b''.join([
+        b'--', BOUNDARY.encode(), b'\r\nContent-Type: image/jpeg\r\nContent-Length: ', str(len(jpeg)).encode(),
+        b'\r\n\r\n', jpeg, b'\r\n',
+    ])
+
+
+class FrameFeed:
+    """One stream's frames as ready-to-send MJPEG parts, shared by every HTTP viewer in this process.
+
+    A stream is a channel layer group plus the latest frame id its pipeline
+    publishes under: a camera, or a video wall mosaic. A single
+    subscription per stream receives what the pipeline publishes; each frame is decoded and wrapped once and all
+    viewers are woken together, so another viewer adds one write per frame
+    and nothing else. Slow viewers skip to the newest frame.
+    """
+
+    def __init__(self, group_name, frame_id, channel_layer):
+        self.group_name = group_name
+        self.channel_layer = channel_layer
+        self.part = None
+        self.seq = 0
+        self.changed = asyncio.Event()
+        self.viewers = 0
+        self.task = None
+        latest = latest_frames.get(frame_id)
+        if latest is not None:
+            self.publish(latest.jpeg)
+
+    def publish(self, jpeg):
+        self.part = mjpeg_part(jpeg)
+        self.seq += 1
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def run(self):
+        channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group_name, channel)
+        try:
+            while True:
+                message = await self.channel_layer.receive(channel)
+                if message['type'] == 'stream.frame':
+                    self.publish(base64.b64decode(message['frame']))
+        finally:
+            await self.channel_layer.group_discard(self.group_name, channel)
+
+    async def parts(self):
+        seq = 0
+        while True:
+            changed = self.changed
+            if self.seq == seq:
+                await changed.wait()
+            seq = self.seq
+            yield self.part
+
+
+class FeedRegistry:
+    """Keeps one FrameFeed per watched stream on this process's event loop."""
+
+    def __init__(self):
+        self.feeds = {}
+
+    def acquire(self, group_name, frame_id):
+        feed = self.feeds.get(group_name)
+        if feed is None:
+            feed = self.feeds[group_name] = FrameFeed(group_name, frame_id, get_channel_layer())
+            feed.task = asyncio.create_task(feed.run())
+        feed.viewers += 1
+        return feed
+
+    def release(self, feed):
+        feed.viewers -= 1
+        if feed.viewers <= 0 and self.feeds.get(feed.group_name) is feed:
+            del self.feeds[feed.group_name]
+            feed.task.cancel()
+
+
+feeds = FeedRegistry()
+
+
+async def mjpeg_stream(group_name, frame_id, pipelines=None, pipeline_id=None):
+    """Yield MJPEG parts for one viewer until the client goes away.
+
+    With ``pipelines``, the viewer also holds ``pipeline_id``'s pipeline in
+    that registry, as WebSocket viewers do.
+    """
+    feed = feeds.acquire(group_name, frame_id)
+    holds_pipeline = False
+    logger.info(f"MJPEG viewer joined {group_name}, {feed.viewers} watching")
+    try:
+        if pipelines is not None:
+            await sync_to_async(pipelines.acquire)(pipeline_id)
+            holds_pipeline = True
+        async for part in feed.parts():
+            yield part
+    finally:
+        feeds.release(feed)
+        if holds_pipeline:
+            await sync_to_async(pipelines.release)(pipeline_id)
+        logger.info(f"MJPEG viewer left {group_name}")
+
+
+metrics.gauge('cctv_mjpeg_viewers', "MJPEG viewers of each stream in this process.", ('group',),
+              callback=lambda: {(group_name,): feed.viewers for group_name, feed in list(feeds.feeds.items())})
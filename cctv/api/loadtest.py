@@ -0,0 +1,366 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
+import psutil
+from django.conf import settings
+from .bench import SyntheticCapture, percentiles
+from .pipeline import camera_group_name
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv')
+LEAK_KEYS = ('threads', 'writers', 'db_connections', 'pipelines', 'group_members')
+DEFAULT_DB_PORTS = {'postgresql': 5432, 'mysql': 3306}
+
+
+class StreamClient:
+    """One viewer of ``ws/stream/<camera_id>/``, counting frames and their capture-to-client latency."""
+
+    def __init__(self, camera_id, token):
+        self.camera_id = camera_id
+        self.path = f'/ws/stream/{camera_id}/?token={token}'
+        self.connect_seconds = None
+        self.connect_started = None
+        self.first_frame_seconds = None  # From starting to connect to the first frame
+        self.first_frame_cached = False
+        self.close_code = None
+        self.frames = 0
+        self.latencies = []  # Since the last report
+        self.first_frame = None
+        self.last_frame = None
+        self.closed = None
+
+    def handle(self, text):
+        now = time.time()
+        message = json.loads(text)
+        if not self.frames:
+            self.first_frame_seconds = time.perf_counter() - self.connect_started
+            self.first_frame_cached = bool(message.get('cached'))
+        if message.get('ts'):
+            self.latencies.append(now - message['ts'])
+        self.frames += 1
+        self.first_frame = self.first_frame or now
+        self.last_frame = now
+
+    @property
+    def fps(self):
+        if self.frames < 2:
+            return 0.0
+        return (self.frames - 1) / (self.last_frame - self.first_frame)
+
+
+class InProcessClient(StreamClient):
+    """Drives the ASGI application directly through a channels test communicator."""
+
+    def __init__(self, camera_id, token, application):
+        super().__init__(camera_id, token)
+        self.application = application
+        self.communicator = None
+        self.reader = None
+
+    async def connect(self, timeout=10):
+        from channels.testing import WebsocketCommunicator
+        self.closed = asyncio.get_running_loop().create_future()
+        self.communicator = WebsocketCommunicator(self.application, self.path)
+        self.connect_started = time.perf_counter()
+        connected, code = await self.communicator.connect(timeout)
+        if not connected:
+            self.close_code = code
+            return False
+        self.connect_seconds = time.perf_counter() - self.connect_started
+        self.reader = asyncio.create_task(self.read())
+        return True
+
+    async def read(self):
+        # Straight from the output queue: a receive timeout would cancel the consumer
+        while True:
+            message = await self.communicator.output_queue.get()
+            if message['type'] == 'websocket.close':
+                self.close_code = message.get('code', 1000)
+                self.closed.set_result(self.close_code)
+                return
+            self.handle(message['text'])
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.communicator is not None:
+            await self.communicator.disconnect()
+
+
+class SocketClient(StreamClient):
+    """Connects over a real socket to a running server, e.g. daphne."""
+
+    def __init__(self, camera_id, token, url):
+        super().__init__(camera_id, token)
+        self.url = url.rstrip('/')
+        self.protocol = None
+
+    async def connect(self, timeout=10):
+        from autobahn.asyncio.websocket import WebSocketClientFactory, WebSocketClientProtocol
+        client = self
+        loop = asyncio.get_running_loop()
+        opened, self.closed = loop.create_future(), loop.create_future()
+
+        class Protocol(WebSocketClientProtocol):
+            def onOpen(self):
+                opened.set_result(True)
+
+            def onMessage(self, payload, is_binary):
+                client.handle(payload.decode())
+
+            def onClose(self, was_clean, code, reason):
+                client.close_code = code
+                for future in (opened, client.closed):
+                    if not future.done():
+                        future.set_result(False if future is opened else code)
+
+        address = urlparse(self.url)
+        factory = WebSocketClientFactory(self.url + self.path)
+        factory.protocol = Protocol
+        self.connect_started = time.perf_counter()
+        try:
+            _, self.protocol = await asyncio.wait_for(loop.create_connection(
+                factory, address.hostname, address.port or (443 if address.scheme == 'wss' else 80),
+                ssl=address.scheme == 'wss'), timeout)
+            if not await asyncio.wait_for(opened, timeout):
+                return False
+        except (OSError, asyncio.TimeoutError) as e:
+            self.close_code = str(e) or type(e).__name__
+            return False
+        self.connect_seconds = time.perf_counter() - self.connect_started
+        return True
+
+    async def close(self):
+        if self.protocol is not None and not self.closed.done():
+            self.protocol.sendClose(1000)
+            try:
+                await asyncio.wait_for(asyncio.shield(self.closed), 5)
+            except asyncio.TimeoutError:
+                self.protocol.dropConnection(abort=True)
+
+
+class ServerProbe:
+    """Samples a server process for memory and the resources a viewer could leak."""
+
+    def __init__(self, pid=None):
+        self.process = psutil.Process(pid)
+        database = settings.DATABASES['default']
+        self.vendor = database['ENGINE'].rsplit('.', 1)[-1]
+        self.db_port = int(database.get('PORT') or DEFAULT_DB_PORTS.get(self.vendor, 0))
+
+    def db_connections(self, files):
+        if self.vendor == 'sqlite3':
+            from django.db import connection
+            name = os.path.realpath(str(connection.settings_dict['NAME']))
+            return sum(1 for path in files if path == name)
+        return sum(1 for conn in self.process.net_connections(kind='inet')
+                   if conn.raddr and conn.raddr.port == self.db_port)
+
+    def sample(self, detail=False):
+        files = [os.path.realpath(item.path) for item in self.process.open_files()]
+        return {
+            'rss_mb': round(self.process.memory_info().rss / 2**20, 1),
+            'threads': self.process.num_threads(),
+            'writers': sum(1 for path in files if path.endswith(VIDEO_EXTENSIONS)),
+            'db_connections': self.db_connections(files),
+        }
+
+
+class InProcessProbe(ServerProbe):
+    """Also counts running pipelines and channel group members when the server is this process."""
+
+    def __init__(self, channel_layer, camera_ids):
+        super().__init__()
+        self.channel_layer = channel_layer
+        self.camera_ids = camera_ids
+
+    def sample(self, detail=False):
+        from .pipeline import registry
+        sample = super().sample()
+        sample['pipelines'] = len(registry.running_cameras())
+        members = group_members(self.channel_layer, self.camera_ids)
+        if members is not None:
+            sample['group_members'] = members
+        if detail:
+            sample['thread_names'] = sorted(thread.name for thread in threading.enumerate())
+        return sample
+
+
+def synthetic_frame(width=1280, height=720, quality=80):
+    """A base64 JPEG about the size a pipeline publishes."""
+    import cv2
+    _, frame = SyntheticCapture(width, height).read()
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(buffer).decode('utf-8')
+
+
+async def publish_frames(channel_layer, camera_ids, frame, fps):
+    """Stand in for camera pipelines, sending one frame per camera group every 1/fps seconds until cancelled."""
+    while True:
+        started = time.perf_counter()
+        for camera_id in camera_ids:
+            await channel_layer.group_send(camera_group_name(camera_id),
+                                           {'type': 'stream.frame', 'frame': frame, 'ts': time.time()})
+        await asyncio.sleep(max(0.0, 1 / fps - (time.perf_counter() - started)))
+
+
+class LoadTest:
+    """Opens ``clients`` viewers spread over ``camera_ids`` and holds them for ``duration`` seconds.
+
+    Connections are opened at ``connect_rate`` per second. Every
+    ``report_interval`` seconds a sample of frame rate, latency, server
+    memory, threads, video writers and database connections is taken, and
+    ``churn`` of the clients reconnect so leaks per connection add up.
+    Leaks are what remains above the baseline once every client is gone.
+    """
+
+    def __init__(self, client_factory, camera_ids, clients, probe, duration=60.0, connect_rate=100.0,
+                 report_interval=10.0, churn=0.0, settle=2.0):
+        self.client_factory = client_factory
+        self.camera_ids = camera_ids
+        self.clients = clients
+        self.probe = probe
+        self.duration = duration
+        self.connect_rate = connect_rate
+        self.report_interval = report_interval
+        self.churn = churn
+        self.settle = settle
+        self.connected = []
+        self.connect_times = []
+        self.failures = {}
+        self.fps = []
+        self.first_frames = []
+        self.first_frames_cached = 0
+        self.timeline = []
+        self.rotation = 0
+        self.last_report = None
+
+    async def open(self, index):
+        client = self.client_factory(self.camera_ids[index % len(self.camera_ids)])
+        if await client.connect():
+            self.connected.append(client)
+            self.connect_times.append(client.connect_seconds)
+        else:
+            code = str(client.close_code)
+            self.failures[code] = self.failures.get(code, 0) + 1
+            logger.warning(f"Load test client for Camera ID {client.camera_id} refused: {code}")
+
+    async def open_many(self, count, start=0):
+        pending = []
+        for index in range(start, start + count):
+            pending.append(asyncio.create_task(self.open(index)))
+            await asyncio.sleep(1 / self.connect_rate)
+        await asyncio.gather(*pending)
+
+    async def retire(self, clients):
+        for client in clients:
+            self.connected.remove(client)
+            if client.frames > 1:
+                self.fps.append(client.fps)
+            if client.first_frame_seconds is not None:
+                self.first_frames.append(client.first_frame_seconds)
+                self.first_frames_cached += client.first_frame_cached
+        await asyncio.gather(*(client.close() for client in clients))
+
+    async def settled_sample(self):
+        await asyncio.sleep(self.settle)
+        return await asyncio.to_thread(self.probe.sample, True)
+
+    def report(self, started):
+        now = time.perf_counter()
+        elapsed, self.last_report = now - self.last_report, now
+        latencies = []
+        frames = 0
+        for client in self.connected:
+            latencies.extend(client.latencies)
+            frames += len(client.latencies)
+            client.latencies = []
+        sample = dict(self.probe.sample(), t=round(now - started, 1),
+                      clients=len(self.connected), frames_per_second=round(frames / elapsed, 1),
+                      latency=percentiles(latencies))
+        self.timeline.append(sample)
+        logger.info(f"Load test at {sample['t']}s: {sample['clients']} clients, "
+                    f"{sample['frames_per_second']} frames/s, p99 {sample['latency']['p99_ms']} ms, "
+                    f"{sample['rss_mb']} MB RSS, {sample['threads']} threads")
+
+    async def run(self):
+        # One warm-up viewer first, so pools the server keeps for its lifetime are in the baseline
+        await self.open(0)
+        await self.retire(list(self.connected))
+        self.connect_times, self.failures, self.fps, self.first_frames, self.first_frames_cached = [], {}, [], [], 0
+        baseline = await self.settled_sample()
+
+        started = time.perf_counter()
+        await self.open_many(self.clients)
+        ramp_seconds = time.perf_counter() - started
+        self.last_report = time.perf_counter()
+        deadline = started + self.duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(min(self.report_interval, max(0.0, deadline - time.perf_counter())))
+            self.report(started)
+            reconnect = int(self.churn * len(self.connected))
+            if reconnect:
+                await self.retire(self.connected[:reconnect])
+                await self.open_many(reconnect, self.rotation)
+                self.rotation += reconnect
+        dropped = [client for client in self.connected if client.closed.done()]
+        await self.retire(list(self.connected))
+        final = await self.settled_sample()
+
+        return {
+            'clients': self.clients,
+            'cameras': len(self.camera_ids),
+            'seconds': round(time.perf_counter() - started, 1),
+            'ramp_seconds': round(ramp_seconds, 2),
+            'connect': percentiles(self.connect_times),
+            'first_frame': dict(percentiles(self.first_frames), cached=self.first_frames_cached),
+            'refused': self.failures,
+            'closed_by_server': len(dropped),
+            'client_fps': {
+                'mean': round(float(np.mean(self.fps)), 2) if self.fps else 0.0,
+                'min': round(min(self.fps), 2) if self.fps else 0.0,
+            },
+            'rss_growth_mb_per_hour': rss_growth_per_hour(self.timeline),
+            'baseline': baseline,
+            'final': final,
+            'leaks': leaks(baseline, final),
+            'timeline': self.timeline,
+        }
+
+
+def leaks(baseline, final):
+    """Resources held after every client left beyond what the server held before they came."""
+    found = {name: final[name] - baseline[name] for name in LEAK_KEYS
+             if name in final and final[name] > baseline.get(name, 0)}
+    if 'thread_names' in final:
+        threads = sorted(set(final['thread_names']) - set(baseline['thread_names']))
+        if threads:
+            found['thread_names'] = threads
+    return found
+
+
+def rss_growth_per_hour(timeline):
+    """Least-squares RSS slope once the first quarter of the run has warmed caches."""
+    points = timeline[len(timeline) // 4:]
+    if len(points) < 2:
+        return None
+    seconds = np.array([point['t'] for point in points])
+    rss = np.array([point['rss_mb'] for point in points])
+    if np.ptp(seconds) == 0:
+        return None
+    return round(float(np.polyfit(seconds, rss, 1)[0]) * 3600, 1)
+
+
+def group_members(channel_layer, camera_ids):
+    """Channels still subscribed to the given cameras, for in-memory layers."""
+    groups = getattr(channel_layer, 'groups', None)
+    if not isinstance(groups, dict):
+        return None
+    return sum(len(groups.get(camera_group_name(camera_id), ())) for camera_id in camera_ids)
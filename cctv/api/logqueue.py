@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from django.conf import settings
+from .metrics import metrics
+
+_listeners = []
+_handlers = []
+
+
+class CameraLogAdapter(logging.LoggerAdapter):
+    """Tags records with the camera they concern so per-camera sampling can key on it."""
+
+    def process(self, msg, kwargs):
+        kwargs.setdefault('extra', {})['camera'] = self.extra['camera']
+        return msg, kwargs
+
+
+def camera_logger(logger, camera_id):
+    return CameraLogAdapter(logger, {'camera': camera_id})
+
+
+class CameraLogSampler(logging.Filter):
+    """Lets through one record per message, level and camera every ``interval`` seconds.
+
+    Only records tagged with a camera are sampled, so per-frame lines are
+    thinned out while one-off messages always pass. The next record let
+    through notes how many were suppressed. Messages are keyed on their
+    unformatted template, so lines must use lazy %-style arguments rather
+    than f-strings to be recognised as repeats.
+    """
+
+    def __init__(self, interval=None):
+        super().__init__()
+        self.interval = settings.CCTV_LOG_SAMPLE_INTERVAL if interval is None else interval
+        self.lock = threading.Lock()
+        self.last = {}
+        self.suppressed = {}
+        self.total_suppressed = 0
+
+    def filter(self, record):
+        camera = getattr(record, 'camera', None)
+        if camera is None or not self.interval:
+            return True
+        key = (record.name, record.levelno, record.msg, camera)
+        with self.lock:
+            last = self.last.get(key)
+            if last is not None and record.created - last < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                self.total_suppressed += 1
+                return False
+            self.last[key] = record.created
+            count = self.suppressed.pop(key, 0)
+        if count:
+            record.msg = f'{record.msg} ({count} similar messages suppressed)'
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Queues records for a background listener without formatting or blocking.
+
+    Records stay in this process, so they are passed as they are and the
+    message is only formatted by the listener thread. When the queue is full
+    the record is dropped rather than making the caller wait.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def install_queue_logging(maxsize=None, sample_interval=None):
+    """Move the configured handlers of every logger behind a queue and listener thread.
+
+    Call once the logging config is applied. Loggers keep their levels and
+    propagation; only the handler I/O moves off the calling thread.
+    """
+    if _handlers:
+        return
+    maxsize = settings.CCTV_LOG_QUEUE_SIZE if maxsize is None else maxsize
+    sampler = CameraLogSampler(sample_interval)
+    loggers = [logging.getLogger()] + [
+        logger for logger in list(logging.Logger.manager.loggerDict.values()) if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        if not logger.handlers:
+            continue
+        handler = AsyncQueueHandler(queue.Queue(maxsize))
+        handler.addFilter(sampler)
+        listener = QueueListener(handler.queue, *logger.handlers, respect_handler_level=True)
+        logger.handlers = [handler]
+        listener.start()
+        _handlers.append(handler)
+        _listeners.append(listener)
+    atexit.register(stop_queue_logging)
+
+    metrics.gauge('cctv_log_queue_depth', "Log records waiting to be written.",
+                  callback=lambda: {(): sum(handler.queue.qsize() for handler in _handlers)})
+    metrics.counter('cctv_log_records_dropped_total', "Log records dropped because the queue was full.",
+                    callback=lambda: {(): sum(handler.dropped for handler in _handlers)})
+    metrics.counter('cctv_log_records_suppressed_total', "Repeated per-camera log records sampled out.",
+                    callback=lambda: {(): sampler.total_suppressed})
+
+
+def stop_queue_logging():
+    """Flush queued records and stop the listener threads."""
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.batch import BatchAnalyzer, create_job, finish_job, job_progress
+from api.bench import StubBackend
+from api.inference import BACKENDS, load_backend
+from api.models import AnalysisJob, Camera
+
+
+class Command(BaseCommand):
+    help = "Run detection over recorded video files and index the results as the camera's detected frames."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="A video file or a directory of them.")
+        parser.add_argument('--camera', type=int, help="Camera the footage belongs to.")
+        parser.add_argument('--job', type=int, help="Resume this job instead of starting one.")
+        parser.add_argument('--stride', type=int, default=5, help="Analyse every Nth frame.")
+        parser.add_argument('--batch-size', type=int, default=8, help="Frames per detector call and bulk insert.")
+        parser.add_argument('--processes', type=int, help="Processes working on the job's files at once.")
+        parser.add_argument('--detector', choices=['stub'] + list(BACKENDS),
+                            help="Override the camera's detector; 'stub' measures everything but the model.")
+        parser.add_argument('--imgsz', type=int, help="Override the camera's detector input size.")
+        parser.add_argument('--worker', action='store_true',
+                            help="Only work on --job's files, beside the process that started it.")
+
+    def handle(self, *args, **options):
+        # The limits AnalysisJobSerializer applies to jobs started through the API
+        if options['stride'] < 1:
+            raise CommandError("--stride must be at least 1 frame")
+        if not 1 <= options['batch_size'] <= 64:
+            raise CommandError("--batch-size must be from 1 to 64 frames")
+        if options['processes'] is not None and options['processes'] < 1:
+            raise CommandError("--processes must be at least 1")
+        if options['job']:
+            try:
+                job = AnalysisJob.objects.select_related('camera').get(id=options['job'])
+            except AnalysisJob.DoesNotExist:
+                raise CommandError(f"No analysis job {options['job']}")
+        else:
+            if not options['path'] or not options['camera']:
+                raise CommandError("Give a path and --camera, or --job to resume one")
+            try:
+                camera = Camera.objects.get(id=options['camera'])
+                job = create_job(camera, os.path.abspath(options['path']), camera.created_by_id,
+                                 stride=options['stride'], batch_size=options['batch_size'],
+                                 processes=options['processes'] or 1)
+            except (Camera.DoesNotExist, ValueError) as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Created job {job.id} for {job.files.count()} files")
+
+        if options['worker']:
+            BatchAnalyzer(job, self.backend(job, options)).run()
+            return
+
+        # Nothing else runs this job now, so files left running by a crashed run are picked up again
+        job.files.filter(status='running').update(status='pending')
+        job.status = 'running'
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        processes = options['processes'] or job.processes
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'analyze_footage',
+                   '--job', str(job.id), '--worker']
+        for name in ('detector', 'imgsz'):
+            if options[name]:
+                command += [f'--{name}', str(options[name])]
+        workers = [subprocess.Popen(command, cwd=settings.BASE_DIR) for _ in range(processes - 1)]
+
+        started = time.monotonic()
+        try:
+            BatchAnalyzer(job, self.backend(job, options), stdout=self.stdout).run()
+        finally:
+            for worker in workers:
+                worker.wait()
+        job = finish_job(job)
+        progress = job_progress(job)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Job {job.id} {job.status}: {progress['frames']} frames analysed, "
+                          f"{progress['detections']} detections in {elapsed:.1f}s "
+                          f"({progress['frames'] / max(elapsed, 1e-9):.1f} fps over {processes} processes)")
+
+    def backend(self, job, options):
+        input_size = options['imgsz'] or job.camera.detector_input_size
+        if options['detector'] == 'stub':
+            return StubBackend(input_size)
+        if options['detector']:
+            return load_backend(options['detector'], input_size)
+        return None  # The camera's own backend
@@ -0,0 +1,86 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.inference import BACKENDS, CascadeBackend, agreement, read_clip, run_backend
+from api.tracking import DetectionScheduler
+
+
+class Command(BaseCommand):
+    help = "Report detection fps and accuracy of each inference backend on a fixed local clip."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clip', default=os.path.join(settings.MEDIA_ROOT, 'bench', 'clip.mp4'))
+        parser.add_argument('--frames', type=int, default=200)
+        parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+        parser.add_argument('--imgsz', type=int, nargs='+', default=[640])
+        parser.add_argument('--interval', type=int, nargs='+', default=[1],
+                            help="Frames per detector run; boxes are tracked in between.")
+        parser.add_argument('--cascade', metavar='WEIGHTS',
+                            help="Also run each backend behind this screening model, e.g. yolov8n.pt.")
+        parser.add_argument('--escalation-labels', nargs='*', default=[])
+        parser.add_argument('--escalation-confidence', type=float, default=0.5)
+        parser.add_argument('--escalation-budget', type=float, default=0.25)
+        parser.add_argument('--baseline-imgsz', type=int, default=640,
+                            help="Input size of the PyTorch run accuracy is measured against.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        frames = read_clip(options['clip'], options['frames'])
+        baseline = None
+        try:
+            baseline, _ = run_backend(BACKENDS['torch'](options['baseline_imgsz']), frames)
+        except (ImportError, OSError) as exc:
+            self.stderr.write(f"No PyTorch baseline, accuracy not reported: {exc}")
+
+        results = []
+        for name in options['backends']:
+            for input_size in options['imgsz']:
+                try:
+                    backend = BACKENDS[name](input_size)
+                    screen = BACKENDS[name](input_size, weights=options['cascade']) if options['cascade'] else None
+                except (ImportError, OSError) as exc:
+                    results.append({'backend': name, 'imgsz': input_size, 'error': str(exc)})
+                    continue
+                # Warm up once; schedulers and cascades keep state so are run cold
+                for model in filter(None, (backend, screen)):
+                    model.detect(frames[0])
+                for interval in options['interval']:
+                    results.append(self.measure(backend, name, input_size, interval, frames, baseline))
+                    if screen is not None:
+                        cascade = CascadeBackend(screen, backend, labels=options['escalation_labels'],
+                                                 confidence=options['escalation_confidence'],
+                                                 budget=options['escalation_budget'])
+                        results.append(self.measure(cascade, name, input_size, interval, frames, baseline))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            line = f"{result['backend']:>10} {result['imgsz']:>5}px"
+            if result.get('cascade'):
+                line += " cascade"
+            if 'error' in result:
+                self.stdout.write(line + f": skipped ({result['error']})")
+                continue
+            line += (f" every {result['interval']:>2}: {result['fps']:7.2f} fps, {result['ms_per_frame']:7.2f} ms/frame, "
+                     f"{result['detector_runs']} detector runs")
+            if result.get('cascade'):
+                line += f", {result['escalation_rate']:.1%} escalated"
+            if 'f1' in result:
+                line += f", precision {result['precision']:.3f}, recall {result['recall']:.3f}, F1 {result['f1']:.3f}"
+            self.stdout.write(line)
+
+    def measure(self, backend, name, input_size, interval, frames, baseline):
+        result = {'backend': name, 'imgsz': input_size, 'interval': interval,
+                  'cascade': isinstance(backend, CascadeBackend)}
+        scheduler = DetectionScheduler(backend, interval)
+        batches, throughput = run_backend(scheduler, frames, warmup=0)
+        result.update(throughput)
+        result['detector_runs'] = scheduler.detector_runs
+        result['detections'] = sum(len(batch) for batch in batches)
+        if result['cascade']:
+            result.update(backend.stats())
+        if baseline is not None:
+            result.update(agreement(baseline, batches))
+        return result
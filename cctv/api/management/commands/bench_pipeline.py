@@ -0,0 +1,75 @@
+import json
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from api.bench import LoopingCapture, StubBackend, SyntheticCapture, run_benchmark, throwaway_database
+from api.inference import BACKENDS
+from api.models import Camera, User
+
+
+class Command(BaseCommand):
+    help = "Run synthetic or file-backed cameras through the full pipeline and report fps and stage latencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cameras', type=int, default=4)
+        parser.add_argument('--viewers', type=int, default=1, help="Simulated viewers per camera.")
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--source', help="Video file every camera replays; defaults to synthetic frames.")
+        parser.add_argument('--resolution', default='1280x720', help="Synthetic frame size, WIDTHxHEIGHT.")
+        parser.add_argument('--detector', choices=['stub'] + list(BACKENDS), default='stub',
+                            help="'stub' boxes bright regions deterministically; others load the real model.")
+        parser.add_argument('--detector-ms', type=float, default=0,
+                            help="Milliseconds the stub detector waits per frame, standing in for a model.")
+        parser.add_argument('--imgsz', type=int, default=640)
+        parser.add_argument('--interval', type=int, default=1, help="Frames per detector run.")
+        parser.add_argument('--frame-interval', type=float, default=0,
+                            help="Seconds each pipeline sleeps per frame; 0 runs flat out.")
+        parser.add_argument('--channel-layer', choices=['memory', 'configured'], default='memory',
+                            help="Fan out in process, or through the configured (e.g. Redis) layer.")
+        parser.add_argument('--output', help="Write the results to this JSON file, for diffing between runs.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            width, height = (int(value) for value in options['resolution'].lower().split('x'))
+        except ValueError:
+            raise CommandError("--resolution must look like 1280x720")
+
+        if options['source']:
+            def capture_factory(camera):
+                return LoopingCapture(options['source'])
+        else:
+            def capture_factory(camera):
+                return SyntheticCapture(width, height, seed=camera.id)
+        backend = StubBackend(options['imgsz'], options['detector_ms'] / 1000) if options['detector'] == 'stub' else None
+        channel_layer = InMemoryChannelLayer(capacity=1000) if options['channel_layer'] == 'memory' else get_channel_layer()
+
+        with throwaway_database():
+            admin = User.objects.create_user(email='bench-admin@example.com', password='bench', role='ADMIN')
+            cameras = [
+                Camera.objects.create(name=f'Bench {index}', created_by=admin, detector_backend=options['detector'],
+                                      detector_input_size=options['imgsz'], detection_interval=options['interval'])
+                for index in range(options['cameras'])
+            ]
+            results = run_benchmark(cameras, capture_factory, backend, options['viewers'], options['seconds'],
+                                    options['frame_interval'], channel_layer)
+
+        results['config'] = {key: options[key] for key in (
+            'source', 'resolution', 'detector', 'detector_ms', 'imgsz', 'interval', 'frame_interval', 'channel_layer')}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+                output.write('\n')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        self.stdout.write(f"{results['cameras']} cameras, {results['viewers_per_camera']} viewers each: "
+                          f"{results['fps']:.1f} fps total, {results['min_camera_fps']:.1f} fps slowest camera, "
+                          f"{results['cpu_percent']:.0f}% CPU, {results['rss_mb']:.0f} MB RSS "
+                          f"(+{results['rss_growth_mb']:.1f} MB)")
+        for stage, result in results['stages'].items():
+            self.stdout.write(f"{stage:>10}: p50 {result['p50_ms']:8.2f} ms, p99 {result['p99_ms']:8.2f} ms")
+        latency = results['viewer_latency']
+        if latency['count']:
+            self.stdout.write(f"{'viewer':>10}: p50 {latency['p50_ms']:8.2f} ms, p99 {latency['p99_ms']:8.2f} ms "
+                              f"capture to receive, {results['viewer_fps']:.1f} fps per viewer")
@@ -0,0 +1,78 @@
+import base64
+import json
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from api.authentication import get_tokens_for_user
+from api.models import Camera, CameraPermission, User
+from api.views import CameraViewSet
+
+
+class Command(BaseCommand):
+    help = "Compare REST requests per second with Basic/session auth against stateless JWT auth."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help="Requests per scheme; Basic auth hashes a password on each one.")
+        parser.add_argument('--cameras', type=int, default=50)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so the benchmark user never lands in real data
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run(options['requests'], options['cameras'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(f"{name:>6}: {result['requests_per_second']:10.1f} req/s "
+                              f"({result['ms_per_request']:.2f} ms/request)")
+        speedup = results['jwt']['requests_per_second'] / results['basic']['requests_per_second']
+        self.stdout.write(f"JWT is {speedup:.0f}x faster than Basic auth")
+
+    def run(self, requests, cameras):
+        cache.clear()
+        password = 'bench-password'
+        admin = User.objects.create_user(email='bench-admin@example.com', password=password, role='ADMIN')
+        viewer = User.objects.create_user(email='bench-viewer@example.com', password=password, role='USER')
+        for index in range(cameras):
+            camera = Camera.objects.create(name=f'Bench {index}', created_by=admin)
+            CameraPermission.objects.create(user=viewer, camera=camera, can_view=True)
+
+        basic = 'Basic ' + base64.b64encode(f'{viewer.email}:{password}'.encode()).decode()
+        bearer = 'Bearer ' + get_tokens_for_user(viewer)['access']
+        schemes = {
+            'basic': ([SessionAuthentication, BasicAuthentication], basic),
+            'jwt': ([JWTStatelessUserAuthentication, SessionAuthentication], bearer),
+        }
+
+        factory = APIRequestFactory()
+        results = {}
+        for name, (authentication_classes, header) in schemes.items():
+            view = CameraViewSet.as_view({'get': 'list'}, authentication_classes=authentication_classes)
+            # Warm the ACL cache and code paths before timing
+            view(factory.get('/api/cameras/', HTTP_AUTHORIZATION=header))
+
+            started = time.perf_counter()
+            for _ in range(requests):
+                response = view(factory.get('/api/cameras/', HTTP_AUTHORIZATION=header))
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                'requests': requests,
+                'seconds': round(elapsed, 4),
+                'requests_per_second': round(requests / elapsed, 1),
+                'ms_per_request': round(elapsed * 1000 / requests, 3),
+            }
+        return results
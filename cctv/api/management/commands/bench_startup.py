@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ROLES = ('web', 'stream', 'worker')
+HEAVY_MODULES = ('torch', 'cv2', 'ultralytics')
+
+# Runs in a fresh interpreter so every role starts cold
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cctv.settings')
+error = None
+first_pipeline = None
+try:
+    if os.environ['CCTV_PROCESS_ROLE'] == 'worker':
+        import django
+        django.setup()
+        from api.pipeline import preload_ml_stack
+        preload_ml_stack()
+    else:
+        import cctv.asgi
+    elapsed = time.perf_counter() - started
+    if os.environ['CCTV_PROCESS_ROLE'] != 'web':
+        # What the first pipeline still has to import once the process is up
+        from api.pipeline import preload_ml_stack
+        mark = time.perf_counter()
+        preload_ml_stack()
+        first_pipeline = round(time.perf_counter() - mark, 3)
+except Exception as exc:
+    error = f'{type(exc).__name__}: {exc}'
+    elapsed = time.perf_counter() - started
+import psutil
+print(json.dumps({
+    'setup_seconds': round(elapsed, 3),
+    'rss_mb': round(psutil.Process().memory_info().rss / 2**20, 1),
+    'loaded': [name for name in %r if name in sys.modules],
+    'first_pipeline_seconds': first_pipeline,
+    'error': error,
+}))
+''' % (HEAVY_MODULES,)
+
+
+class Command(BaseCommand):
+    help = "Measure cold start time and idle memory of each process role."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', nargs='+', choices=ROLES, default=list(ROLES))
+        parser.add_argument('--repeat', type=int, default=3, help="Cold starts per role; the fastest is reported.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        results = {role: self.measure(role, options['repeat']) for role in options['roles']}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for role, result in results.items():
+            line = (f"{role:>6}: {result['wall_seconds']:6.2f} s cold start, "
+                    f"{result['setup_seconds']:6.2f} s in setup, {result['rss_mb']:7.1f} MB RSS, "
+                    f"loaded: {', '.join(result['loaded']) or 'none'}")
+            if result['first_pipeline_seconds'] is not None:
+                line += f", {result['first_pipeline_seconds']:.2f} s of imports left for the first pipeline"
+            if result['error']:
+                line += f" ({result['error']})"
+            self.stdout.write(line)
+
+    def measure(self, role, repeat):
+        env = dict(os.environ, CCTV_PROCESS_ROLE=role)
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable, '-c', PROBE], cwd=settings.BASE_DIR, env=env,
+                                       capture_output=True, text=True)
+            wall = time.perf_counter() - started
+            if completed.returncode != 0:
+                raise CommandError(f"{role} probe failed:\n{completed.stderr}")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result['wall_seconds'] = round(wall, 3)
+            runs.append(result)
+        return min(runs, key=lambda run: run['wall_seconds'])
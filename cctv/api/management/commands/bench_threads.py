@@ -0,0 +1,123 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# One synthetic camera per thread: decode-sized OpenCV work plus a detector-sized
+# ONNX Runtime run per frame, for a fixed time, in a fresh process per configuration.
+PROBE = '''
+import json, os, sys, threading, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cctv.settings')
+import django
+django.setup()
+import cv2, numpy as np, onnxruntime, psutil
+from api.threads import ThreadBudget
+
+cameras, seconds, model = int(sys.argv[1]), float(sys.argv[2]), sys.argv[3]
+budget = ThreadBudget(enabled=sys.argv[4] == 'budgeted')
+for _ in range(cameras):
+    budget.acquire()
+
+frames = [0] * cameras
+start = threading.Barrier(cameras + 1)
+
+def camera(index):
+    session = onnxruntime.InferenceSession(model, sess_options=budget.session_options(),
+                                           providers=['CPUExecutionProvider'])
+    name = session.get_inputs()[0].name
+    size = session.get_inputs()[0].shape[2]
+    frame = np.random.RandomState(index).randint(0, 255, (720, 1280, 3), dtype=np.uint8)
+    start.wait()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        resized = cv2.resize(frame, (size, size))
+        tensor = resized.transpose(2, 0, 1)[np.newaxis].astype(np.float32) / 255
+        session.run(None, {name: tensor})
+        cv2.imencode('.jpg', cv2.GaussianBlur(frame, (9, 9), 0))
+        frames[index] += 1
+
+workers = [threading.Thread(target=camera, args=(index,)) for index in range(cameras)]
+for worker in workers:
+    worker.start()
+start.wait()
+process = psutil.Process()
+process.cpu_percent()
+time.sleep(seconds / 2)
+threads = process.num_threads()
+for worker in workers:
+    worker.join()
+print(json.dumps({
+    'fps': round(sum(frames) / seconds, 2),
+    'min_camera_fps': round(min(frames) / seconds, 2),
+    'threads': threads,
+    'cpu_percent': process.cpu_percent(),
+    'threads_per_pipeline': budget.per_pipeline if budget.enabled else None,
+}))
+'''
+
+
+def synthetic_model(path, size=320):
+    """Write a small convolutional network with a detector's input shape."""
+    import numpy as np
+    from onnx import TensorProto, helper, numpy_helper, save
+    rng = np.random.RandomState(0)
+    nodes, initializers, previous, channels = [], [], 'images', 3
+    for index, width in enumerate((16, 32, 64, 64, 128)):
+        weight = numpy_helper.from_array(rng.randn(width, channels, 3, 3).astype(np.float32) * 0.1, f'w{index}')
+        initializers.append(weight)
+        nodes.append(helper.make_node('Conv', [previous, weight.name], [f'c{index}'], pads=[1, 1, 1, 1],
+                                      strides=[2, 2] if index < 4 else [1, 1]))
+        nodes.append(helper.make_node('Relu', [f'c{index}'], [f'r{index}']))
+        previous, channels = f'r{index}', width
+    graph = helper.make_graph(
+        nodes, 'synthetic_detector',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [1, 3, size, size])],
+        [helper.make_tensor_value_info(previous, TensorProto.FLOAT, None)],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    save(model, path)
+
+
+class Command(BaseCommand):
+    help = "Compare aggregate fps of synthetic cameras with and without thread budgeting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cameras', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--model', help="ONNX model to run; defaults to a synthetic 320px network.")
+        parser.add_argument('--affinity', help="CPU list to pin each run to, e.g. 0-3.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            model = options['model']
+            if not model:
+                model = os.path.join(directory, 'synthetic.onnx')
+                synthetic_model(model)
+            results = [
+                dict(cameras=cameras, mode=mode, **self.measure(cameras, mode, model, options))
+                for cameras in options['cameras']
+                for mode in ('unbudgeted', 'budgeted')
+            ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(f"{result['cameras']:>3} cameras {result['mode']:>10}: {result['fps']:8.2f} fps total, "
+                              f"{result['min_camera_fps']:6.2f} fps slowest camera, {result['threads']:>4} threads, "
+                              f"{result['cpu_percent']:6.1f}% CPU")
+
+    def measure(self, cameras, mode, model, options):
+        command = [sys.executable, '-c', PROBE, str(cameras), str(options['seconds']), model, mode]
+        if options['affinity']:
+            command = ['taskset', '-c', options['affinity']] + command
+        completed = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise CommandError(f"{cameras} camera {mode} run failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.inference import (Int8OnnxBackend, OnnxBackend, TorchBackend, agreement, export_onnx,
+                           quantize_onnx, read_clip, run_backend)
+
+
+class Command(BaseCommand):
+    help = "Export the detector to ONNX (optionally INT8) and validate it against the PyTorch model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', default=settings.CCTV_DETECTOR_WEIGHTS)
+        parser.add_argument('--imgsz', type=int, nargs='+', default=[640], help="Input sizes to export.")
+        parser.add_argument('--int8', action='store_true', help="Also write an INT8-quantized model.")
+        parser.add_argument('--calibration', help="Video used to calibrate INT8 activations; "
+                                                  "without it only weights are quantized.")
+        parser.add_argument('--calibration-frames', type=int, default=100)
+        parser.add_argument('--validate', metavar='CLIP', help="Compare detections with PyTorch on this video.")
+        parser.add_argument('--frames', type=int, default=100, help="Frames of the clip to validate on.")
+        parser.add_argument('--min-f1', type=float, default=0.9,
+                            help="Fail when an exported model agrees with PyTorch less than this.")
+
+    def handle(self, *args, **options):
+        weights = options['weights']
+        calibration_frames = None
+        if options['int8'] and options['calibration']:
+            calibration_frames = read_clip(options['calibration'], options['calibration_frames'])
+
+        for input_size in options['imgsz']:
+            path = export_onnx(weights, input_size)
+            self.stdout.write(f"Exported {path}")
+            if options['int8']:
+                path = quantize_onnx(weights, input_size, calibration_frames)
+                self.stdout.write(f"Quantized {path}")
+
+        if options['validate']:
+            self.validate(weights, options)
+
+    def validate(self, weights, options):
+        frames = read_clip(options['validate'], options['frames'])
+        variants = [OnnxBackend] + ([Int8OnnxBackend] if options['int8'] else [])
+        failures = []
+        for input_size in options['imgsz']:
+            baseline, _ = run_backend(TorchBackend(input_size, weights=weights), frames)
+            for backend_class in variants:
+                batches, _ = run_backend(backend_class(input_size, weights=weights), frames)
+                score = agreement(baseline, batches)
+                self.stdout.write(f"{backend_class.name} at {input_size}px vs torch: precision {score['precision']:.3f}, "
+                                  f"recall {score['recall']:.3f}, F1 {score['f1']:.3f}")
+                if score['f1'] < options['min_f1']:
+                    failures.append(f"{backend_class.name} at {input_size}px (F1 {score['f1']:.3f})")
+        if failures:
+            raise CommandError(f"Below --min-f1 {options['min_f1']}: {', '.join(failures)}")
@@ -0,0 +1,130 @@
+import asyncio
+import json
+from functools import partial
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from api.authentication import get_tokens_for_user
+from api.bench import BenchPipeline, StubBackend, SyntheticCapture, throwaway_database
+from api.loadtest import (InProcessClient, InProcessProbe, LoadTest, ServerProbe, SocketClient, publish_frames,
+                          synthetic_frame)
+from api.models import Camera, User
+from api.pipeline import CameraPipeline, registry
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 1000}}}
+
+
+class Command(BaseCommand):
+    help = "Hold many authenticated viewers on ws/stream/<camera_id>/ and report fan-out capacity and leaks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to hold the clients; hours for a soak.")
+        parser.add_argument('--connect-rate', type=float, default=100, help="New connections per second.")
+        parser.add_argument('--report-interval', type=float, default=10)
+        parser.add_argument('--churn', type=float, default=0,
+                            help="Share of clients that reconnect every report interval, e.g. 0.1.")
+        parser.add_argument('--url', help="Server to connect to, e.g. ws://127.0.0.1:8000; "
+                                          "defaults to the ASGI application in this process.")
+        parser.add_argument('--email', help="With --url: user whose token the clients present.")
+        parser.add_argument('--camera-ids', type=int, nargs='+', help="With --url: cameras to spread clients over.")
+        parser.add_argument('--server-pid', type=int, help="With --url: server process to sample for memory and leaks.")
+        parser.add_argument('--cameras', type=int, default=4, help="In process: cameras to spread clients over.")
+        parser.add_argument('--role', choices=['web', 'stream'], default='web',
+                            help="In process: 'web' relays synthetic frames published at --fps; "
+                                 "'stream' runs a stub-detector pipeline per watched camera.")
+        parser.add_argument('--fps', type=float, default=10)
+        parser.add_argument('--resolution', default='1280x720')
+        parser.add_argument('--channel-layer', choices=['memory', 'configured'], default='memory')
+        parser.add_argument('--output', help="Write the report to this JSON file.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            width, height = (int(value) for value in options['resolution'].lower().split('x'))
+        except ValueError:
+            raise CommandError("--resolution must look like 1280x720")
+        options['size'] = (width, height)
+
+        report = self.remote(options) if options['url'] else self.in_process(options)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+                output.write('\n')
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        connect = report['connect']
+        self.stdout.write(f"{report['clients']} clients on {report['cameras']} cameras for {report['seconds']}s: "
+                          f"connect p50 {connect['p50_ms']:.1f} ms, p99 {connect['p99_ms']:.1f} ms, "
+                          f"{sum(report['refused'].values())} refused, {report['closed_by_server']} closed by server")
+        first = report['first_frame']
+        self.stdout.write(f"first frame p50 {first['p50_ms']:.1f} ms, p99 {first['p99_ms']:.1f} ms, "
+                          f"{first['cached']} of {first['count']} from the latest-frame cache")
+        self.stdout.write(f"client fps mean {report['client_fps']['mean']:.1f}, min {report['client_fps']['min']:.1f}; "
+                          f"RSS {report['baseline']['rss_mb']:.0f} -> {report['final']['rss_mb']:.0f} MB, "
+                          f"growth {report['rss_growth_mb_per_hour']} MB/h")
+        if report['timeline']:
+            latency = report['timeline'][-1]['latency']
+            self.stdout.write(f"last interval latency p50 {latency['p50_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms")
+        if report['leaks']:
+            self.stdout.write(self.style.ERROR(f"Leaked after all clients left: {report['leaks']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No leaked threads, writers, DB connections or subscriptions"))
+
+    def remote(self, options):
+        if not options['email'] or not options['camera_ids']:
+            raise CommandError("--url needs --email and --camera-ids")
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['email']}")
+        token = get_tokens_for_user(user)['access']
+        load = LoadTest(lambda camera_id: SocketClient(camera_id, token, options['url']), options['camera_ids'],
+                        options['clients'], ServerProbe(options['server_pid']), **self.schedule(options))
+        return asyncio.run(load.run())
+
+    def in_process(self, options):
+        layers = IN_MEMORY_LAYER if options['channel_layer'] == 'memory' else settings.CHANNEL_LAYERS
+        with throwaway_database(), override_settings(CCTV_PROCESS_ROLE=options['role'], CHANNEL_LAYERS=layers):
+            from channels.layers import get_channel_layer
+            from cctv.asgi import application
+            admin = User.objects.create_user(email='load-admin@example.com', password='load', role='ADMIN')
+            camera_ids = [Camera.objects.create(name=f'Load {index}', created_by=admin).id
+                          for index in range(options['cameras'])]
+            token = get_tokens_for_user(admin)['access']
+            channel_layer = get_channel_layer()
+            load = LoadTest(lambda camera_id: InProcessClient(camera_id, token, application), camera_ids,
+                            options['clients'], InProcessProbe(channel_layer, camera_ids), **self.schedule(options))
+
+            if options['role'] == 'stream':
+                registry.pipeline_factory = partial(
+                    BenchPipeline, capture_factory=lambda camera: SyntheticCapture(*options['size'], seed=camera.id),
+                    backend=StubBackend(), frame_interval=1 / options['fps'])
+            try:
+                return asyncio.run(self.drive(load, channel_layer, camera_ids, options))
+            finally:
+                registry.stop_all(wait=True)
+                registry.pipeline_factory = CameraPipeline
+
+    async def drive(self, load, channel_layer, camera_ids, options):
+        if options['role'] == 'web':
+            frame = synthetic_frame(*options['size'])
+            feeder = asyncio.create_task(publish_frames(channel_layer, camera_ids, frame, options['fps']))
+        else:
+            # Pipelines publish from their own threads, which cannot wake this loop
+            # through an in-memory layer; a short tick bounds the delivery delay
+            feeder = asyncio.create_task(tick(0.005))
+        try:
+            return await load.run()
+        finally:
+            feeder.cancel()
+
+    def schedule(self, options):
+        return {key: options[key] for key in ('duration', 'connect_rate', 'report_interval', 'churn')}
+
+
+async def tick(interval):
+    while True:
+        await asyncio.sleep(interval)
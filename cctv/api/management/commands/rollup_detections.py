@@ -0,0 +1,48 @@
+from datetime import datetime, time as dt_time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from api.models import DetectedFrame
+from api.rollups import hour_ceil, hour_floor, rebuild
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Not a date or datetime: {value}")
+        moment = datetime.combine(day, dt_time.min)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+class Command(BaseCommand):
+    help = ("Rebuild detection rollups from stored detected frames, for history saved before rollups existed. "
+            "Rollups in the range are replaced; live pipelines writing to it at the same time may be undercounted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--camera', type=int, help="Only this camera.")
+        parser.add_argument('--since', help="Date or datetime; defaults to the oldest detected frame.")
+        parser.add_argument('--until', help="Date or datetime; defaults to the newest detected frame.")
+
+    def handle(self, *args, **options):
+        frames = DetectedFrame.objects.all()
+        if options['camera']:
+            frames = frames.filter(camera_id=options['camera'])
+        bounds = frames.aggregate(oldest=Min('timestamp'), newest=Max('timestamp'))
+        if bounds['oldest'] is None:
+            self.stdout.write("No detected frames to roll up")
+            return
+
+        # Whole hours, so every minute and hour rollup in the range is rebuilt completely
+        since = hour_floor(parse_moment(options['since']) if options['since'] else bounds['oldest'])
+        if options['until']:
+            until = hour_ceil(parse_moment(options['until']))
+        else:
+            until = hour_floor(bounds['newest']) + timedelta(hours=1)
+        if until <= since:
+            raise CommandError("--until must be after --since")
+        frames = frames.filter(timestamp__gte=since, timestamp__lt=until)
+        count = rebuild(frames, since, until, camera_id=options['camera'])
+        self.stdout.write(f"Rolled up {count} detected frames from {since} to {until}")
@@ -0,0 +1,94 @@
+import time
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.holders import HlsHolder
+from api.leases import Lease, heartbeat_worker, live_ring, remove_worker
+from api.metrics import metrics, serve_metrics
+from api.models import Camera
+from api.pipeline import preload_ml_stack, registry
+from api.threads import pin_process
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run the camera pipelines this worker owns, holding a lease on each camera."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker', default=settings.CCTV_WORKER_NAME,
+                            help="Name of this worker; must be listed in CCTV_WORKERS when that is set.")
+        parser.add_argument('--interval', type=float, default=settings.CCTV_LEASE_TTL / 3,
+                            help="Seconds between heartbeats and camera assignment checks.")
+        parser.add_argument('--metrics-port', type=int, default=settings.CCTV_METRICS_PORT,
+                            help="Serve Prometheus metrics on this port; 0 disables.")
+
+    def handle(self, *args, **options):
+        worker = options['worker']
+        if settings.CCTV_WORKERS and worker not in settings.CCTV_WORKERS:
+            raise CommandError(f"Worker '{worker}' is not listed in CCTV_WORKERS {settings.CCTV_WORKERS}")
+        if settings.CHANNEL_LAYERS['default']['BACKEND'] == 'channels.layers.InMemoryChannelLayer':
+            raise CommandError("Camera workers need a shared channel layer; set REDIS_URL")
+
+        # Pin before the ML libraries start their thread pools, then pay their import once
+        pin_process()
+        preload_ml_stack()
+
+        if options['metrics_port']:
+            serve_metrics(options['metrics_port'])
+
+        self.worker = worker
+        self.interval = options['interval']
+        self.leases = {}
+        self.hls = HlsHolder(cameras=None)  # Owned cameras run anyway; walls are leased among workers
+        self.stdout.write(f"Worker {worker} running, lease TTL {settings.CCTV_LEASE_TTL}s")
+        try:
+            while True:
+                self.sync_pipelines()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Hand cameras over immediately instead of waiting for the leases to expire
+            registry.stop_all(wait=True)
+            for lease in self.leases.values():
+                lease.release()
+            remove_worker(worker)
+
+    def sync_pipelines(self):
+        """Heartbeat, renew held leases, then take or hand over cameras per the ring."""
+        heartbeat_worker(self.worker)
+
+        for camera_id, lease in list(self.leases.items()):
+            if not lease.renew():
+                registry.stop(camera_id)
+                del self.leases[camera_id]
+
+        ring = live_ring()
+        owned = {
+            camera_id for camera_id in Camera.objects.values_list('id', flat=True)
+            if ring.get_node(camera_id) == self.worker
+        }
+
+        for camera_id in set(self.leases) - owned:
+            logger.info(f"Worker {self.worker} handing over Camera ID {camera_id}")
+            registry.stop(camera_id, wait=True)
+            self.leases.pop(camera_id).release()
+
+        running = registry.running_cameras()
+        for camera_id in owned:
+            lease = self.leases.get(camera_id)
+            if lease is None:
+                lease = Lease(camera_id, self.worker)
+                if not lease.acquire():
+                    # Previous owner still holds it; retry once its lease expires
+                    continue
+                self.leases[camera_id] = lease
+            if camera_id not in running:
+                logger.info(f"Worker {self.worker} starting Camera ID {camera_id}")
+                registry.start(camera_id, lease=lease)
+
+        self.hls.sync()
+
+        # For the JSON admin endpoint, which runs in a web process
+        metrics.publish(self.worker, self.interval * 3)
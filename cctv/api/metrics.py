@@ -0,0 +1,243 @@
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from half a millisecond to a few seconds per stage.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def metrics_cache_key(node):
+    return f'metrics:{node}'
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is one bisect and three additions.
+
+    Series are written by the one pipeline thread that owns their camera, so
+    the hot path takes no lock.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class _Disabled:
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+DISABLED = _Disabled()
+
+
+class MetricFamily:
+    def __init__(self, registry, kind, name, documentation, labelnames, factory, callback=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.factory = factory
+        self.callback = callback  # Returns {label values: value}, read at collection time
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        if not self.registry.enabled:
+            return DISABLED
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(tuple(str(value) for value in values), None)
+
+    def collect(self):
+        if self.callback is None:
+            with self.lock:
+                return list(self.children.items())
+        try:
+            return [(tuple(str(value) for value in labels), value) for labels, value in self.callback().items()]
+        except Exception as e:
+            logger.error(f"Collecting {self.name} failed: {str(e)}")
+            return []
+
+
+class MetricsRegistry:
+    """Process-local counters, gauges and histograms in the Prometheus data model."""
+
+    def __init__(self, enabled=None):
+        self.enabled = settings.CCTV_METRICS_ENABLED if enabled is None else enabled
+        self.families = {}
+
+    def register(self, kind, name, documentation, labelnames=(), factory=None, callback=None):
+        family = MetricFamily(self, kind, name, documentation, tuple(labelnames), factory, callback)
+        self.families[name] = family
+        return family
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self.register('counter', name, documentation, labelnames, Counter, callback)
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register('gauge', name, documentation, labelnames, Gauge, callback)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register('histogram', name, documentation, labelnames, lambda: Histogram(buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for family in self.families.values():
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for values, child in family.collect():
+                labels = dict(zip(family.labelnames, values))
+                if family.kind != 'histogram':
+                    value = child if family.callback else child.value
+                    lines.append(f'{family.name}{format_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets + ('+Inf',), child.counts):
+                    cumulative += count
+                    lines.append(f'{family.name}_bucket{format_labels({**labels, "le": bound})} {cumulative}')
+                lines.append(f'{family.name}_sum{format_labels(labels)} {child.sum}')
+                lines.append(f'{family.name}_count{format_labels(labels)} {child.count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Summarise every metric as JSON: histograms become count, mean, p50 and p99."""
+        result = {}
+        for family in self.families.values():
+            series = []
+            for values, child in family.collect():
+                entry = {'labels': dict(zip(family.labelnames, values))}
+                if family.kind == 'histogram':
+                    entry.update({
+                        'count': child.count,
+                        'mean_ms': round(child.sum * 1000 / child.count, 3) if child.count else 0.0,
+                        'p50_ms': round(child.quantile(0.5) * 1000, 3),
+                        'p99_ms': round(child.quantile(0.99) * 1000, 3),
+                    })
+                else:
+                    entry['value'] = child if family.callback else child.value
+                series.append(entry)
+            result[family.name] = series
+        return result
+
+    def publish(self, node, timeout):
+        """Share this process's snapshot through the cache for the admin endpoint."""
+        cache.set(metrics_cache_key(node), {'node': node, 'ts': time.time(), 'metrics': self.snapshot()}, timeout)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def scrape_authorized(authorization):
+    """Whether an Authorization header carries CCTV_METRICS_TOKEN, compared in constant time; open when unset."""
+    token = settings.CCTV_METRICS_TOKEN
+    if not token:
+        return True
+    return hmac.compare_digest((authorization or '').encode(), f'Bearer {token}'.encode())
+
+
+def serve_metrics(port, registry=None):
+    """Serve /metrics over HTTP from a background thread, for processes without Django views."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not scrape_authorized(self.headers.get('Authorization')):
+                self.send_response(401)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on port {server.server_port}")
+    return server
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    'cctv_stage_seconds', "Time spent in each pipeline stage per frame.", ('camera', 'stage'))
+frames_total = metrics.counter(
+    'cctv_frames_total', "Frames processed, by whether the detector ran or boxes were tracked.", ('camera', 'mode'))
+frames_dropped_total = metrics.counter(
+    'cctv_frames_dropped_total', "Frames lost before processing.", ('camera', 'reason'))
+pipeline_starts_total = metrics.counter(
+    'cctv_pipeline_starts_total', "Pipeline starts; more than one per camera means it reconnected.", ('camera',))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_detectedframe_delete_detectedobject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='source',
+            field=models.CharField(default='0', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='detectedframe',
+            name='frame_image',
+            field=models.ImageField(upload_to='media/detected/'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-19 14:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_pipeline_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('label', models.CharField(max_length=50)),
+                ('zone', models.JSONField(blank=True, null=True)),
+                ('active_from', models.TimeField(blank=True, null=True)),
+                ('active_until', models.TimeField(blank=True, null=True)),
+                ('min_count', models.PositiveIntegerField(default=1)),
+                ('duration', models.PositiveIntegerField(default=0)),
+                ('cooldown', models.PositiveIntegerField(default=60)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('camera', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='api.camera')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('triggered_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('detail', models.JSONField(default=dict)),
+                ('camera', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.camera')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.alertrule')),
+            ],
+        ),
+    ]
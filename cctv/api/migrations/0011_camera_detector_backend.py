@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_alert_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='detector_backend',
+            field=models.CharField(choices=[('torch', 'PyTorch'), ('onnx', 'ONNX Runtime'), ('onnx-int8', 'ONNX Runtime INT8')], default='torch', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='detector_input_size',
+            field=models.PositiveIntegerField(default=640),
+        ),
+    ]
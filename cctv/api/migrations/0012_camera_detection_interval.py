@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_camera_detector_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='detection_interval',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
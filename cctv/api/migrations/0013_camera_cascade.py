@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_camera_detection_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='escalation_budget',
+            field=models.FloatField(default=0.25),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='escalation_confidence',
+            field=models.FloatField(default=0.5),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='escalation_labels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='screening_weights',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
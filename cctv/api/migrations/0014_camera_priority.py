@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_camera_cascade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Low'), (1, 'Normal'), (2, 'High')], default=1),
+        ),
+    ]
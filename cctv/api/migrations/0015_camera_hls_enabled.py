@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_camera_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='hls_enabled',
+            field=models.BooleanField(default=False),
+        ),
+    ]
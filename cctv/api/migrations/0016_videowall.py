@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_camera_hls_enabled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoWall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('width', models.PositiveIntegerField(default=1920)),
+                ('height', models.PositiveIntegerField(default=1080)),
+                ('fps', models.FloatField(default=5)),
+                ('hls_enabled', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cameras', models.ManyToManyField(related_name='walls', to='api.camera')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
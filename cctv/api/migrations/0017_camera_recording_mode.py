@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_videowall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='recording_mode',
+            field=models.CharField(choices=[('annotated', 'Annotated (re-encoded)'), ('passthrough', 'Passthrough (original stream)'), ('off', 'Off')], default='annotated', max_length=20),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_camera_recording_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventClip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('recording', 'Recording'), ('ready', 'Ready'), ('failed', 'Failed')], default='recording', max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('triggered_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, upload_to='clips/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('alert', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clips', to='api.alert')),
+                ('camera', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clips', to='api.camera')),
+                ('detected_frame', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.detectedframe')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_analysis_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=10)),
+                ('start', models.DateTimeField()),
+                ('label', models.CharField(max_length=100)),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('min_count', models.PositiveIntegerField(default=0)),
+                ('max_count', models.PositiveIntegerField(default=0)),
+                ('camera', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.camera')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'start'], name='api_detecti_period_e2a9bf_idx')],
+                'constraints': [models.UniqueConstraint(fields=('camera', 'period', 'label', 'start'), name='unique_detection_rollup')],
+            },
+        ),
+    ]
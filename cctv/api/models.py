@@ -51,7 +51,34 @@ class User(AbstractUser):
     
 class Camera(models.Model):
     name = models.CharField(max_length=100)
-   
+    source = models.CharField(max_length=255, default='0')  # Device index or stream URL
+    PRIORITIES = (
+        (0, 'Low'),
+        (1, 'Normal'),
+        (2, 'High'),  # Never degraded by the CPU governor
+    )
+    priority = models.PositiveSmallIntegerField(choices=PRIORITIES, default=1)
+    DETECTOR_BACKENDS = (
+        ('torch', 'PyTorch'),
+        ('onnx', 'ONNX Runtime'),
+        ('onnx-int8', 'ONNX Runtime INT8'),
+    )
+    detector_backend = models.CharField(max_length=20, choices=DETECTOR_BACKENDS, default='torch')
+    detector_input_size = models.PositiveIntegerField(default=640)  # Square model input, a multiple of 32
+    detection_interval = models.PositiveIntegerField(default=1)  # Frames per detector run; boxes are tracked between
+    # Cascade: screen frames with a small model and escalate to the full one per these rules
+    screening_weights = models.CharField(max_length=100, blank=True)  # e.g. "yolov8n.pt"; blank disables the cascade
+    escalation_labels = models.JSONField(default=list, blank=True)  # Labels always confirmed by the full model
+    escalation_confidence = models.FloatField(default=0.5)  # Screening detections below this are escalated
+    escalation_budget = models.FloatField(default=0.25)  # Largest share of frames sent to the full model
+    hls_enabled = models.BooleanField(default=False)  # Also write rolling HLS segments for passive viewers
+    RECORDING_MODES = (
+        ('annotated', 'Annotated (re-encoded)'),
+        ('passthrough', 'Passthrough (original stream)'),  # Remuxed by ffmpeg; detections in a JSONL sidecar
+        ('off', 'Off'),
+    )
+    recording_mode = models.CharField(max_length=20, choices=RECORDING_MODES, default='annotated')
+
     is_public = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -80,4 +107,164 @@ class DetectedFrame(models.Model):
     detection_result = models.TextField()  # Store detection information (optional)
     
     def __str__(self):
-        return f"Detected Frame at {self.timestamp} for Camera {self.camera.id}"
\ No newline at end of file
+        return f"Detected Frame at {self.timestamp} for Camera {self.camera.id}"
+
+
+class PipelineWorker(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+
+class CameraLease(models.Model):
+    camera = models.OneToOneField(Camera, on_delete=models.CASCADE, related_name='lease')
+    owner = models.CharField(max_length=255)  # Name of the worker running the pipeline
+    acquired_at = models.DateTimeField()
+    heartbeat_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Camera {self.camera_id} owned by {self.owner}"
+
+
+class AlertRule(models.Model):
+    name = models.CharField(max_length=100)
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='alert_rules')
+    label = models.CharField(max_length=50)  # Detected class, e.g. "person" or "car"
+    zone = models.JSONField(null=True, blank=True)  # [x1, y1, x2, y2] in frame pixels
+    active_from = models.TimeField(null=True, blank=True)
+    active_until = models.TimeField(null=True, blank=True)  # May wrap past midnight
+    min_count = models.PositiveIntegerField(default=1)
+    duration = models.PositiveIntegerField(default=0)  # Seconds the condition must hold
+    cooldown = models.PositiveIntegerField(default=60)  # Seconds before the rule can fire again
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Alert(models.Model):
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE)
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE)
+    triggered_at = models.DateTimeField(default=timezone.now)
+    detail = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.rule.name} on Camera {self.camera_id} at {self.triggered_at}"
+
+
+class EventClip(models.Model):
+    """A short video around an alert: buffered pre-roll plus post-roll, written in the background."""
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='clips')
+    alert = models.ForeignKey(Alert, on_delete=models.SET_NULL, null=True, blank=True, related_name='clips')
+    detected_frame = models.ForeignKey(DetectedFrame, on_delete=models.SET_NULL, null=True, blank=True)
+    STATUSES = (
+        ('recording', 'Recording'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+    status = models.CharField(max_length=20, choices=STATUSES, default='recording')
+    started_at = models.DateTimeField()
+    triggered_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+    frames = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='clips/', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Clip of Camera {self.camera_id} at {self.triggered_at}"
+
+
+class DetectionRollup(models.Model):
+    """Counts of one class on one camera over a minute or an hour, merged in as detected frames are saved."""
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='rollups')
+    PERIODS = (
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+    )
+    period = models.CharField(max_length=10, choices=PERIODS)
+    start = models.DateTimeField()
+    label = models.CharField(max_length=100)
+    frames = models.PositiveIntegerField(default=0)  # Frames in which the class was seen
+    total = models.PositiveBigIntegerField(default=0)  # Detections of the class over those frames
+    min_count = models.PositiveIntegerField(default=0)
+    max_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['camera', 'period', 'label', 'start'], name='unique_detection_rollup'),
+        ]
+        indexes = [models.Index(fields=['period', 'start'])]  # Range queries across every camera
+
+    @property
+    def average(self):
+        return self.total / self.frames if self.frames else 0.0
+
+    def __str__(self):
+        return f"{self.label} on Camera {self.camera_id} for the {self.period} from {self.start}"
+
+
+class AnalysisJob(models.Model):
+    """Offline detection over recorded video files, attributed to a camera; resumable."""
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='analysis_jobs')
+    path = models.CharField(max_length=1000)  # A video file or a directory of them, under CCTV_ANALYSIS_ROOT
+    stride = models.PositiveIntegerField(default=5)  # Analyse every Nth frame
+    batch_size = models.PositiveIntegerField(default=8)  # Frames per detector call and per bulk insert
+    processes = models.PositiveIntegerField(default=1)
+    STATUSES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    )
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Analysis of {self.path}"
+
+
+class AnalysisFile(models.Model):
+    """One video of an analysis job; ``next_frame`` is committed with each batch so runs resume there."""
+    job = models.ForeignKey(AnalysisJob, on_delete=models.CASCADE, related_name='files')
+    path = models.CharField(max_length=1000)
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    next_frame = models.PositiveIntegerField(default=0)
+    total_frames = models.PositiveIntegerField(default=0)
+    frames_done = models.PositiveIntegerField(default=0)  # Frames analysed, after the stride
+    detections = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.path
+
+
+class VideoWall(models.Model):
+    """A grid of cameras composed server-side into one stream for a control-room display."""
+    name = models.CharField(max_length=100)
+    cameras = models.ManyToManyField(Camera, related_name='walls')  # Tiled in camera id order
+    width = models.PositiveIntegerField(default=1920)
+    height = models.PositiveIntegerField(default=1080)
+    fps = models.FloatField(default=5)
+    hls_enabled = models.BooleanField(default=False)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
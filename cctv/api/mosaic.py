@@ -0,0 +1,198 @@
+import base64
+import logging
+import math
+import os
+import threading
+import time
+from io import BytesIO
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection
+from .framecache import LatestFrame, latest_frames, snapshot_variants
+from .hls import HlsWriter
+from .metrics import metrics
+from .leases import CacheLease
+from .models import VideoWall
+from .pipeline import PipelineRegistry, registry
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = (24, 24, 24)
+
+
+def wall_group_name(wall_id):
+    return f'wall_{wall_id}'
+
+
+def wall_frame_id(wall_id):
+    """The wall's key among latest frames, HLS directories and snapshot ETags."""
+    return f'wall-{wall_id}'
+
+
+def grid(count, width, height):
+    """Split a width x height canvas into ``count`` cells, as (x, y, w, h), row by row."""
+    if count == 0:
+        return []
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    cell_width, cell_height = width // columns, height // rows
+    return [((index % columns) * cell_width, (index // columns) * cell_height, cell_width, cell_height)
+            for index in range(count)]
+
+
+class WallPipeline:
+    """Compose the latest frames of a wall's cameras into one grid image and publish it.
+
+    Tiles come from the cameras' latest frames, downscaled through the
+    snapshot variant cache, and a cell is only redrawn when its camera has
+    a new frame. The mosaic is encoded once per tick and published like a
+    camera: to its channel layer group, as a latest frame for snapshots and
+    MJPEG, and to HLS when enabled. A wall viewer costs one small stream
+    instead of one full-resolution stream per camera.
+
+    Walls are composed wherever they are watched, web processes included,
+    so this uses Pillow like snapshot thumbnails and never cv2 or numpy.
+    """
+
+    refresh_interval = 10  # Seconds between re-reading the wall's cameras and size
+    keepalive = 1.0  # Seconds after which an unchanged mosaic is published again
+
+    def __init__(self, wall_id, lease=None):
+        self.wall_id = wall_id
+        self.lease = lease
+        self.frame_id = wall_frame_id(wall_id)
+        self.group_name = wall_group_name(wall_id)
+        self.channel_layer = get_channel_layer()
+        self.running = False
+        self.thread = None
+        self.canvas = None
+        self.cells = []
+        self.tiles = {}  # Camera id -> (seq, ts) of the frame drawn in its cell
+        self.held = set()
+        self.seq = 0
+        self.hls = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        logger.info(f"Started mosaic for Video Wall ID {self.wall_id}")
+
+    def stop(self, wait=False):
+        self.running = False
+        if wait and self.thread is not None:
+            self.thread.join(timeout=30)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def publish(self, message):
+        async_to_sync(self.channel_layer.group_send)(self.group_name, message)
+
+    def run(self):
+        try:
+            wall, cameras = self.get_wall()
+            loaded = time.monotonic()
+            if wall.hls_enabled:
+                self.start_hls()
+            published = 0
+            while self.running:
+                if self.lease is not None and not self.lease.is_held():
+                    logger.warning(f"Lease for Video Wall ID {self.wall_id} no longer held, stopping mosaic")
+                    break
+                started = time.monotonic()
+                if started - loaded >= self.refresh_interval:
+                    wall, cameras = self.get_wall()
+                    loaded = started
+                self.hold([camera.id for camera in cameras])
+
+                changed = self.compose(cameras, wall.width, wall.height)
+                if changed or started - published >= self.keepalive:
+                    output = BytesIO()
+                    self.canvas.save(output, 'JPEG', quality=80)
+                    jpeg = output.getvalue()
+                    frame = base64.b64encode(jpeg).decode('utf-8')
+                    captured = time.time()
+                    self.seq += 1
+                    # Shared so snapshots of the wall work from any web node
+                    latest_frames.put(LatestFrame(self.frame_id, self.seq, captured, jpeg, frame, []), share=True)
+                    if self.hls is not None:
+                        self.hls.write(jpeg)
+                    self.publish({'type': 'stream.frame', 'frame': frame, 'ts': captured})
+                    published = started
+                time.sleep(max(0.0, 1 / wall.fps - (time.monotonic() - started)))
+        except Exception as e:
+            logger.error(f"Error in mosaic for Video Wall ID {self.wall_id}: {str(e)}")
+        finally:
+            self.running = False
+            latest_frames.discard(self.frame_id)
+            self.hold([])
+            if self.hls is not None:
+                self.hls.close()
+            self.publish({'type': 'stream.end'})
+            connection.close()
+
+    def compose(self, cameras, width, height):
+        """Redraw the cells whose camera has a new frame; return whether anything changed."""
+        from PIL import Image, ImageDraw
+        cells = grid(len(cameras), width, height)
+        layout_changed = self.canvas is None or self.canvas.size != (width, height) or cells != self.cells
+        if layout_changed:
+            self.canvas = Image.new('RGB', (width, height), BACKGROUND)
+            self.cells = cells
+            self.tiles = {}
+
+        frames = latest_frames.get_many([camera.id for camera in cameras])
+        changed = layout_changed
+        for camera, (x, y, w, h) in zip(cameras, cells):
+            latest = frames.get(camera.id)
+            version = (latest.seq, latest.ts) if latest is not None else None
+            if camera.id in self.tiles and self.tiles[camera.id] == version:
+                continue
+            self.tiles[camera.id] = version
+            changed = True
+            self.canvas.paste(BACKGROUND, (x, y, x + w, y + h))
+            if latest is not None:
+                # Shared with snapshot thumbnails; decoded at tile size, never at full size
+                tile = Image.open(BytesIO(snapshot_variants.get(latest, w, h)))
+                self.canvas.paste(tile, (x + (w - tile.width) // 2, y + (h - tile.height) // 2))
+            label = camera.name if latest is not None else f'{camera.name} - no signal'
+            ImageDraw.Draw(self.canvas).text((x + 8, y + 8), label, fill=(255, 255, 255))
+        return changed
+
+    def hold(self, camera_ids):
+        """In stream processes, keep the wall's camera pipelines running while it is watched."""
+        if settings.CCTV_PROCESS_ROLE != 'stream':
+            return
+        wanted = set(camera_ids)
+        for camera_id in wanted - self.held:
+            registry.acquire(camera_id)
+        for camera_id in self.held - wanted:
+            registry.release(camera_id)
+        self.held = wanted
+
+    def start_hls(self):
+        hls = HlsWriter(self.frame_id)
+        try:
+            hls.start()
+        except OSError as e:
+            logger.error(f"HLS disabled for Video Wall ID {self.wall_id}: {str(e)}")
+            return
+        self.hls = hls
+
+    def get_wall(self):
+        wall = VideoWall.objects.get(id=self.wall_id)
+        return wall, list(wall.cameras.order_by('id'))
+
+
+def wall_lease(wall_id):
+    """Walls are composed wherever they are watched, but only by one process at a time."""
+    return CacheLease(wall_frame_id(wall_id), f'{settings.CCTV_WORKER_NAME}:{os.getpid()}')
+
+
+wall_starts_total = metrics.counter('cctv_wall_starts_total', "Video wall mosaic starts.", ('wall',))
+walls = PipelineRegistry(WallPipeline, starts=wall_starts_total, lease_factory=wall_lease)
+
+metrics.gauge('cctv_walls_running', "Video wall mosaics composed in this process.",
+              callback=lambda: {(): len(walls.running_cameras())})
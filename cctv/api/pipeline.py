@@ -0,0 +1,493 @@
+import base64
+import threading
+import time
+import os
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection
+from .clips import ClipRecorder
+from .events import EventPublisher
+from .framecache import LatestFrame, latest_frames
+from .governor import LEVELS, governor
+from .hls import HlsWriter
+from .logqueue import camera_logger
+from .metrics import frames_dropped_total, frames_total, metrics, pipeline_starts_total, stage_seconds
+from .inference import CascadeBackend, camera_backend, draw_detections
+from .leases import Lease
+from .models import Camera, DetectedFrame
+from .recording import AnnotationLog, PassthroughRecorder, can_passthrough
+from .rollups import RollupBuffer, label_counts
+from .rules import RuleEngine
+from .threads import thread_budget
+from .tracking import DetectionScheduler
+
+logger = logging.getLogger('custom_logger')
+
+
+def camera_group_name(camera_id):
+    return f'camera_{camera_id}'
+
+
+# Nothing at module level imports cv2, torch or ultralytics: processes that
+# only serve REST or relay frames never pay their startup time or memory.
+
+def preload_ml_stack():
+    """Import OpenCV and the detector up front, for worker and stream processes that run pipelines."""
+    import cv2  # noqa: F401
+    import ultralytics  # noqa: F401
+    thread_budget.apply()
+
+
+def load_model(weights='yolov8s.pt'):
+    from ultralytics import YOLO
+    return YOLO(weights)
+
+
+def open_capture(source):
+    """Open a camera source; numeric sources are local device indexes."""
+    import cv2
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+def detection_result(detections):
+    """Return the detections in the readable format stored on DetectedFrame."""
+    return "\n".join(f"Label: {label}, Confidence: {confidence:.2f}"
+                     for label, confidence, *_ in detections)
+
+
+class CameraPipeline:
+    """Capture, detect, persist and publish frames for a single camera.
+
+    Frames are sent to the camera's channel layer group rather than to a
+    socket, so a viewer connected to any process sharing the channel layer
+    receives them no matter which process runs the pipeline.
+    """
+
+    frame_interval = 0.1  # Seconds slept per frame at full quality; controls frame rate
+
+    def __init__(self, camera_id, lease=None):
+        self.camera_id = camera_id
+        self.lease = lease  # Set when running under a cluster ownership lease
+        self.log = camera_logger(logger, camera_id)  # Sampled per-frame lines
+        self.group_name = camera_group_name(camera_id)
+        self.channel_layer = get_channel_layer()
+        self.events = EventPublisher(self.channel_layer, camera_id)
+        self.rules = RuleEngine(camera_id, events=self.events)
+        self.clips = ClipRecorder(camera_id)  # Pre-event ring buffer; alerts cut clips from it
+        self.rollups = RollupBuffer()  # Per-minute and per-hour class counts for analytics
+        self.running = False
+        self.thread = None
+        self.writer = None
+        self.backend = None
+        self.scheduler = None
+        self.costs = None
+        self.histograms = {}
+        self.degradation = LEVELS[0]
+        self.seq = 0  # Frames published by this pipeline
+        self.hls = None
+        self.recorder = None  # Passthrough recording, in place of the annotated writer
+        self.annotations = None
+
+        output_dir = os.path.join(settings.MEDIA_ROOT, 'detected_frames')
+        self.output_path = os.path.join(output_dir, f'output_camera_{camera_id}.mp4')
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True  # Daemonize thread
+        self.thread.start()
+        logger.info(f"Started pipeline thread for Camera ID {self.camera_id}")
+
+    def stop(self, wait=False):
+        self.running = False
+        if wait and self.thread is not None:
+            self.thread.join(timeout=30)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def publish(self, message):
+        """Send a message to every consumer subscribed to this camera."""
+        async_to_sync(self.channel_layer.group_send)(self.group_name, message)
+
+    def run(self):
+        logger.info(f"Starting video stream for Camera ID {self.camera_id}")
+        cap = None
+        thread_budget.acquire()
+
+        try:
+            import cv2
+            thread_budget.apply()
+            camera = self.get_camera()
+
+            # Initialize the camera's inference backend
+            self.backend = self.load_backend(camera)
+            self.scheduler = DetectionScheduler(self.backend, camera.detection_interval)
+            logger.debug(f"{self.backend.name} backend initialized at {camera.detector_input_size}px, "
+                         f"detecting every {camera.detection_interval} frames")
+            self.costs = governor.register(self.camera_id, camera.priority)
+
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+            if camera.hls_enabled:
+                self.start_hls()
+            cap = self.open_source(camera)
+
+            recording_mode = self.recording_mode(camera)
+            if recording_mode == 'passthrough':
+                self.start_passthrough(camera)
+            elif recording_mode == 'annotated':
+                # Initialize video writer
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                self.writer = cv2.VideoWriter(self.output_path, fourcc, 20.0,
+                                              (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                               int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+                logger.debug(f"Video writer initialized with output path: {self.output_path}")
+
+            while self.running:
+                mark = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    logger.error(f"Failed to read frame from source {camera.source}")
+                    frames_dropped_total.labels(self.camera_id, 'read_failed').inc()
+                    break
+                captured = time.time()
+                mark = self.timed('capture', mark)
+
+                # Never run inference once ownership may have passed to another worker
+                if self.lease is not None and not self.lease.is_held():
+                    frames_dropped_total.labels(self.camera_id, 'lease_lost').inc()
+                    logger.warning(f"Lease for Camera ID {self.camera_id} no longer held, stopping pipeline")
+                    break
+
+                # Shed or restore work as the node's CPU governor decides
+                degradation = governor.degradation(self.camera_id)
+                if degradation != self.degradation:
+                    self.apply_degradation(camera, degradation)
+
+                # Perform object detection, or track the last detections between detector runs
+                detections = self.scheduler.detect(frame)
+                now = time.perf_counter()
+                self.record('inference', self.scheduler.inference_seconds)
+                self.record('gate', now - mark - self.scheduler.inference_seconds)  # Scene check and tracking
+                frames_total.labels(self.camera_id, 'detected' if self.scheduler.detected else 'tracked').inc()
+                mark = now
+                annotated_frame = draw_detections(frame, detections)
+                self.log.debug("Object detection and annotation complete")
+                mark = self.timed('annotate', mark)
+
+                # Publish detections for event subscribers and evaluate alert rules
+                self.events.publish_detections(detections)
+                alerts = self.rules.process(detections)
+                mark = self.timed('analytics', mark)
+
+                # Create DetectedFrame entry in the database
+                detected_frame = DetectedFrame(
+                    camera=camera,
+                    frame_image=self.save_frame_to_file(annotated_frame),
+                    detection_result=self.get_detection_result(detections)
+                )
+                detected_frame.save()
+                self.rollups.add(self.camera_id, detected_frame.timestamp, label_counts(detections))
+                if self.rollups.due():
+                    self.flush_rollups()
+                self.log.debug("Detection saved to the database")
+                mark = self.timed('persist', mark)
+
+                # Write frame to video file, or only its detections beside the passthrough recording
+                if self.writer is not None:
+                    self.writer.write(annotated_frame)
+                    self.log.debug("Frame written to video file")
+                elif self.recorder is not None:
+                    self.recorder.check()
+                    self.annotations.write(captured, detections)
+                mark = self.timed('record', mark)
+
+                # Encode frame to base64 for sending over WebSocket
+                _, buffer = cv2.imencode('.jpg', annotated_frame)
+                frame_base64 = base64.b64encode(buffer).decode('utf-8')
+                jpeg = buffer.tobytes()
+                self.seq += 1
+                # Shared by the lease holder, for viewers, snapshots and walls in every other process
+                latest_frames.put(LatestFrame(self.camera_id, self.seq, captured, jpeg, frame_base64, detections),
+                                  share=self.lease is not None)
+                if self.hls is not None:
+                    self.hls.write(jpeg)  # Never blocks; ffmpeg encodes once for every HLS player
+                self.clips.add(captured, jpeg)
+                for alert in alerts:
+                    self.clips.trigger(captured, alert=alert, detected_frame=detected_frame)
+                mark = self.timed('encode', mark)
+
+                self.publish({
+                    'type': 'stream.frame',
+                    'frame': frame_base64,
+                    'ts': captured,  # Lets viewers measure end-to-end latency
+                })
+                self.log.debug("Frame published to camera group %s", self.group_name)
+                self.timed('send', mark)
+                self.costs.frame_done()
+
+                time.sleep(self.frame_interval * self.degradation.frame_delay)
+
+        except Exception as e:
+            logger.error(f"Error in pipeline for Camera ID {self.camera_id}: {str(e)}")
+        finally:
+            self.running = False
+            latest_frames.discard(self.camera_id)
+            governor.unregister(self.camera_id)
+            thread_budget.release()
+            if cap is not None and cap.isOpened():
+                cap.release()
+                logger.debug("Capture resource released")
+            if self.writer:
+                self.writer.release()
+                logger.info("Video writer released")
+            if self.hls is not None:
+                self.hls.close()
+            if self.recorder is not None:
+                self.recorder.close()
+                self.annotations.close()
+            self.clips.flush()
+            self.flush_rollups()
+            if isinstance(self.backend, CascadeBackend):
+                logger.info(f"Cascade for Camera ID {self.camera_id}: {self.backend.stats()}")
+            self.publish({'type': 'stream.end'})
+            connection.close()
+
+    def flush_rollups(self):
+        try:
+            self.rollups.flush()
+        except Exception as e:
+            # Kept buffered and retried on the next flush; the frames themselves are saved
+            logger.error(f"Failed to update detection rollups for Camera ID {self.camera_id}: {str(e)}")
+
+    def start_hls(self):
+        hls = HlsWriter(self.camera_id)
+        try:
+            hls.start()
+        except OSError as e:
+            logger.error(f"HLS disabled for Camera ID {self.camera_id}: {str(e)}")
+            return
+        self.hls = hls
+
+    def recording_mode(self, camera):
+        if camera.recording_mode == 'passthrough' and not can_passthrough(camera.source):
+            logger.warning(f"Camera ID {self.camera_id} source {camera.source} cannot be remuxed; "
+                           f"recording annotated frames instead")
+            return 'annotated'
+        return camera.recording_mode
+
+    def start_passthrough(self, camera):
+        recorder = PassthroughRecorder(self.camera_id, camera.source)
+        try:
+            recorder.start()
+        except OSError as e:
+            logger.error(f"Passthrough recording disabled for Camera ID {self.camera_id}: {str(e)}")
+            return
+        self.recorder = recorder
+        self.annotations = AnnotationLog(self.camera_id)
+
+    def open_source(self, camera):
+        return open_capture(camera.source)
+
+    def load_backend(self, camera, input_size=None):
+        return camera_backend(camera, input_size)
+
+    def timed(self, stage, started):
+        """Record the time since ``started`` against a stage and return the current time."""
+        now = time.perf_counter()
+        self.record(stage, now - started)
+        return now
+
+    def record(self, stage, seconds):
+        self.costs.record(stage, seconds)
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = stage_seconds.labels(self.camera_id, stage)
+        histogram.observe(seconds)
+
+    def apply_degradation(self, camera, degradation):
+        input_size = max(32, int(camera.detector_input_size * degradation.input_scale) // 32 * 32)
+        if input_size != self.backend.input_size:
+            try:
+                # Torch takes the size per call, so no weights are reloaded on the frame thread
+                self.backend = self.scheduler.backend = self.backend.resized(input_size)
+            except (ImportError, OSError) as e:
+                logger.warning(f"Keeping {self.backend.input_size}px model for Camera ID {self.camera_id}: {str(e)}")
+        self.scheduler.interval = camera.detection_interval * degradation.interval
+        if isinstance(self.backend, CascadeBackend):
+            self.backend.escalate = degradation.escalate
+        self.degradation = degradation
+        logger.info(f"Camera ID {self.camera_id} now detecting every {self.scheduler.interval} frames "
+                    f"at {self.backend.input_size}px")
+
+    def get_camera(self):
+        logger.debug(f"Fetching camera information for Camera ID {self.camera_id}")
+        return Camera.objects.get(id=self.camera_id)
+
+    def get_detection_result(self, detections):
+        return detection_result(detections)
+
+    def save_frame_to_file(self, frame):
+        """Save the frame as an image and return the image path."""
+        import cv2
+        output_dir = os.path.join(settings.MEDIA_ROOT, 'detected_frames')
+        os.makedirs(output_dir, exist_ok=True)
+
+        timestamp = time.time()
+        frame_filename = f"frame_{timestamp}.jpg"
+        frame_path = os.path.join(output_dir, frame_filename)
+
+        cv2.imwrite(frame_path, frame)
+        return frame_path
+
+
+def local_lease(camera_id):
+    """In local mode, the lease a stream process takes before running a camera.
+
+    Stream processes sharing a channel layer would otherwise each run the
+    camera for their own viewers, doubling inference, frames and rows.
+    Sharded workers pass the lease they already hold instead.
+    """
+    if settings.CCTV_PIPELINE_MODE != 'local':
+        return None
+    return Lease(camera_id, f'{settings.CCTV_WORKER_NAME}:{os.getpid()}')
+
+
+class PipelineRegistry:
+    """Keeps at most one running pipeline per camera in this process.
+
+    With a ``lease_factory``, a pipeline started without a lease first takes
+    one, and is not started while another process holds it; that process's
+    frames reach local viewers through the channel layer. A maintenance
+    thread, running while anything is leased or watched, renews the leases
+    and starts the cameras local viewers are still waiting on.
+    """
+
+    def __init__(self, pipeline_factory=CameraPipeline, starts=pipeline_starts_total, lease_factory=None):
+        self.pipeline_factory = pipeline_factory  # Called as factory(camera_id, lease=lease)
+        self.starts = starts
+        self.lease_factory = lease_factory
+        self.lock = threading.Lock()
+        self.pipelines = {}
+        self.viewers = {}
+        self.leases = {}  # Taken by this registry through lease_factory
+        self.held = set()  # Wanted without a viewer; see hold()
+        self.maintainer = None
+
+    def start(self, camera_id, lease=None):
+        with self.lock:
+            pipeline = self.pipelines.get(camera_id)
+            if pipeline is None or not pipeline.is_alive():
+                if lease is None and self.lease_factory is not None:
+                    lease = self.leases.get(camera_id) or self.lease_factory(camera_id)
+                    if lease is not None:
+                        self.keep_maintained()
+                        if not lease.acquire():
+                            return None
+                        self.leases[camera_id] = lease
+                pipeline = self.pipeline_factory(camera_id, lease=lease)
+                self.pipelines[camera_id] = pipeline
+                pipeline.start()
+                self.starts.labels(camera_id).inc()
+            return pipeline
+
+    def stop(self, camera_id, wait=False):
+        with self.lock:
+            self.viewers.pop(camera_id, None)
+        self.halt(camera_id, wait=wait)
+
+    def halt(self, camera_id, wait=False):
+        """Stop the pipeline and hand back its lease, keeping the camera's viewers."""
+        with self.lock:
+            pipeline = self.pipelines.pop(camera_id, None)
+            lease = self.leases.pop(camera_id, None)
+        if pipeline:
+            pipeline.stop(wait=wait)
+            logger.info(f"Stopped pipeline for Camera ID {camera_id}")
+        if lease is not None:
+            lease.release()
+
+    def stop_all(self, wait=False):
+        for camera_id in list(self.pipelines):
+            self.stop(camera_id, wait=wait)
+
+    def running_cameras(self):
+        with self.lock:
+            return {camera_id for camera_id, pipeline in self.pipelines.items() if pipeline.is_alive()}
+
+    def acquire(self, camera_id):
+        """Register a local viewer, starting the pipeline for the first one."""
+        with self.lock:
+            self.viewers[camera_id] = self.viewers.get(camera_id, 0) + 1
+        return self.start(camera_id)
+
+    def release(self, camera_id):
+        """Drop a local viewer, stopping the pipeline after the last one leaves."""
+        with self.lock:
+            remaining = self.viewers.get(camera_id, 0) - 1
+            if remaining > 0:
+                self.viewers[camera_id] = remaining
+                return
+        self.stop(camera_id)
+
+    def hold(self, ids):
+        """Keep exactly these pipelines wanted here without a viewer, for outputs nobody watches live."""
+        wanted = set(ids)
+        for key in wanted - self.held:
+            self.acquire(key)
+        for key in self.held - wanted:
+            self.release(key)
+        self.held = wanted
+
+    def maintain(self):
+        """Renew leases taken here, and start cameras with local viewers that are not running here."""
+        for camera_id, lease in list(self.leases.items()):
+            if not lease.renew():
+                self.halt(camera_id)
+        running = self.running_cameras()
+        for camera_id in [camera_id for camera_id, count in list(self.viewers.items()) if count > 0]:
+            if camera_id not in running:
+                self.start(camera_id)
+
+    def keep_maintained(self):
+        """Run maintain() every third of a lease TTL for as long as anything is leased or watched."""
+        if self.maintainer is None or not self.maintainer.is_alive():
+            self.maintainer = threading.Thread(target=self.run_maintenance, name='pipeline-leases', daemon=True)
+            self.maintainer.start()
+
+    def run_maintenance(self):
+        try:
+            while True:
+                time.sleep(settings.CCTV_LEASE_TTL / 3)
+                with self.lock:
+                    if not self.leases and not self.viewers:
+                        self.maintainer = None
+                        return
+                try:
+                    self.maintain()
+                except Exception as e:
+                    logger.error(f"Pipeline lease maintenance failed: {str(e)}")
+        finally:
+            connection.close()
+
+
+def channel_queue_depth():
+    """Messages waiting in the in-memory channel layer; Redis layers are monitored in Redis."""
+    channel_layer = get_channel_layer()
+    queues = getattr(channel_layer, 'channels', None)
+    if not isinstance(queues, dict):
+        return {}
+    return {(): sum(queue.qsize() for queue in list(queues.values()))}
+
+
+registry = PipelineRegistry(lease_factory=local_lease)
+
+metrics.gauge('cctv_pipelines_running', "Camera pipelines running in this process.",
+              callback=lambda: {(): len(registry.running_cameras())})
+metrics.gauge('cctv_stream_viewers', "Local viewers holding each camera's pipeline.", ('camera',),
+              callback=lambda: {(camera_id,): count for camera_id, count in list(registry.viewers.items())})
+metrics.gauge('cctv_channel_queue_depth', "Messages queued in the channel layer.", callback=channel_queue_depth)
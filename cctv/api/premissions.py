@@ -1,24 +1,23 @@
 from rest_framework import permissions
+from .acl import can_view_wall, get_camera_acl
 from .models import User
 
 class CanViewCamera(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        # Super Admin or Admin can view any camera
-        if request.user.role in ['SUPER_ADMIN', 'ADMIN']:
-            return True
-        # Check specific camera permission for the user
-        return obj.camerapermission_set.filter(user=request.user, can_view=True).exists()
+        # Super Admin or Admin can view any camera, users need a view permission;
+        # resolved once per user and cached, so this is a set lookup
+        return get_camera_acl(request.user).can_view(obj.id)
 
 class CanEditCamera(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        # Only Super Admin can edit any camera
-        if request.user.role == 'SUPER_ADMIN':
-            return True
-        # Admin can edit only their own cameras
-        if request.user.role == 'ADMIN':
-            return obj.created_by == request.user
-        return False
+        # Super Admin can edit any camera, Admin only their own cameras
+        return get_camera_acl(request.user).can_edit(obj.id)
     
+class CanViewWall(permissions.BasePermission):
+    def has_object_permission(self, request, view, obj):
+        # Every camera on the wall must be viewable
+        return can_view_wall(request.user, obj.id)
+
 class IsSuperAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.role == 'SUPER_ADMIN'
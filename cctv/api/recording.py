@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = '%Y%m%d-%H%M%S.mp4'
+
+
+def recording_directory(camera_id):
+    return os.path.join(settings.MEDIA_ROOT, 'recordings', str(camera_id))
+
+
+def can_passthrough(source):
+    """Only compressed streams and files can be remuxed; local devices deliver raw frames."""
+    return not (isinstance(source, int) or str(source).isdigit())
+
+
+def passthrough_command(source, output_dir):
+    """ffmpeg copying the source's video bitstream into wall-clock named MP4 segments, without decoding."""
+    command = [settings.CCTV_FFMPEG, '-hide_banner', '-loglevel', 'error']
+    if str(source).startswith('rtsp://'):
+        command += ['-rtsp_transport', 'tcp']
+    return command + [
+        '-i', str(source), '-map', '0:v', '-c', 'copy',
+        '-f', 'segment', '-segment_time', str(settings.CCTV_RECORDING_SEGMENT_SECONDS),
+        '-segment_format', 'mp4', '-segment_format_options', 'movflags=+faststart',
+        '-reset_timestamps', '1', '-strftime', '1',
+        os.path.join(output_dir, SEGMENT_PATTERN),
+    ]
+
+
+class PassthroughRecorder:
+    """Records a camera by remuxing its compressed stream into segment files with ffmpeg.
+
+    Nothing is decoded or encoded, so recording costs next to no CPU and
+    keeps the camera's original quality. ffmpeg holds its own connection
+    to the camera and is restarted, at most every ``restart_interval``
+    seconds, if it exits.
+    """
+
+    restart_interval = 5
+
+    def __init__(self, camera_id, source, command=None):
+        self.camera_id = camera_id
+        self.output_dir = recording_directory(camera_id)
+        self.command = command or passthrough_command(source, self.output_dir)
+        self.process = None
+        self.started_at = 0
+        self.restarts = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, 'ffmpeg.log'), 'ab') as log:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                            stderr=log)
+        self.started_at = time.monotonic()
+        logger.info(f"Recording Camera ID {self.camera_id} without re-encoding to {self.output_dir}")
+
+    def check(self):
+        """Restart ffmpeg if it has exited; called once per pipeline frame, so it must stay cheap."""
+        if self.process.poll() is None or time.monotonic() - self.started_at < self.restart_interval:
+            return
+        logger.warning(f"ffmpeg recording Camera ID {self.camera_id} exited with {self.process.returncode}, "
+                       f"restarting; see {self.output_dir}/ffmpeg.log")
+        self.restarts += 1
+        self.start()
+
+    def close(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGINT)  # ffmpeg finishes the open segment
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class AnnotationLog:
+    """Detections stored beside passthrough segments as JSON lines, one file per hour.
+
+    Each line holds a capture time and the detections drawn on that frame;
+    segments are named by their start time, so players overlay boxes by
+    matching timestamps instead of the boxes being burnt into the video.
+    """
+
+    def __init__(self, camera_id):
+        self.output_dir = recording_directory(camera_id)
+        self.file = None
+        self.hour = None
+
+    def write(self, ts, detections):
+        if not detections:
+            return
+        hour = time.strftime('%Y%m%d-%H', time.localtime(ts))
+        if hour != self.hour:
+            self.close()
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.file = open(os.path.join(self.output_dir, f'annotations-{hour}.jsonl'), 'a', buffering=1)
+            self.hour = hour
+        self.file.write(json.dumps({'ts': round(ts, 3), 'detections': detections}, separators=(',', ':')) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.hour = None
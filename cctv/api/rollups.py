@@ -0,0 +1,158 @@
+import logging
+import re
+import time
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncDay
+from .models import DetectionRollup
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('minute', 'hour')
+# Lines of DetectedFrame.detection_result, as written by pipeline.detection_result
+RESULT_LINE = re.compile(r'^Label: (.*), Confidence: ', re.MULTILINE)
+
+
+def bucket_start(ts, period):
+    """The UTC start of the minute or hour holding ``ts``."""
+    ts = ts.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    return ts.replace(minute=0) if period == 'hour' else ts
+
+
+def label_counts(detections):
+    return Counter(detection[0] for detection in detections)
+
+
+def parse_detection_result(text):
+    """Label counts of a stored detection result, for frames saved before rollups existed."""
+    return Counter(RESULT_LINE.findall(text))
+
+
+class RollupBuffer:
+    """Collects per-minute and per-hour rollups in memory and merges them into the database in one go.
+
+    Pipelines add every saved frame and flush every CCTV_ROLLUP_FLUSH_SECONDS,
+    so a camera costs a handful of row updates per flush rather than a
+    write per frame. Merging adds to existing rows, so buffers of several
+    processes, or several flushes of one, may cover the same buckets.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = settings.CCTV_ROLLUP_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.pending = {}  # (camera id, period, start, label) -> [frames, total, min, max]
+        self.flushed_at = time.monotonic()
+
+    def add(self, camera_id, ts, counts):
+        for period in PERIODS:
+            start = bucket_start(ts, period)
+            for label, count in counts.items():
+                stats = self.pending.get((camera_id, period, start, label))
+                if stats is None:
+                    self.pending[(camera_id, period, start, label)] = [1, count, count, count]
+                else:
+                    stats[0] += 1
+                    stats[1] += count
+                    stats[2] = min(stats[2], count)
+                    stats[3] = max(stats[3], count)
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= self.flush_interval
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not self.pending:
+            return
+        with transaction.atomic():
+            merge(self.pending)
+        self.pending = {}
+
+
+def merge(pending):
+    """Add buffered stats to their rollup rows, creating the rows that do not exist yet."""
+    starts = [key[2] for key in pending]
+    existing = set(DetectionRollup.objects.filter(
+        camera_id__in={key[0] for key in pending}, start__gte=min(starts), start__lte=max(starts),
+    ).values_list('camera_id', 'period', 'start', 'label'))
+    created = []
+    for key, stats in pending.items():
+        if key in existing:
+            update(key, stats)
+        else:
+            created.append((key, stats))
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            DetectionRollup.objects.bulk_create([rollup(key, stats) for key, stats in created], batch_size=1000)
+    except IntegrityError:
+        # Another process created some of these rows since they were read
+        for key, stats in created:
+            if not update(key, stats):
+                rollup(key, stats).save()
+
+
+def rollup(key, stats):
+    camera_id, period, start, label = key
+    frames, total, low, high = stats
+    return DetectionRollup(camera_id=camera_id, period=period, start=start, label=label, frames=frames,
+                           total=total, min_count=low, max_count=high)
+
+
+def update(key, stats):
+    camera_id, period, start, label = key
+    frames, total, low, high = stats
+    return DetectionRollup.objects.filter(camera_id=camera_id, period=period, start=start, label=label).update(
+        frames=F('frames') + frames, total=F('total') + total,
+        min_count=Least(F('min_count'), low), max_count=Greatest(F('max_count'), high))
+
+
+def rollup_series(rollups, period):
+    """Rows of per-camera, per-class stats; days are summed from hourly rollups at query time."""
+    if period == 'day':
+        rows = (rollups.filter(period='hour').annotate(day=TruncDay('start', tzinfo=dt_timezone.utc))
+                .values('camera_id', 'label', 'day')
+                .annotate(frames_sum=Sum('frames'), total_sum=Sum('total'), low=Min('min_count'),
+                          high=Max('max_count'))
+                .order_by('day', 'camera_id', 'label'))
+        rows = [(row['camera_id'], row['label'], row['day'], row['frames_sum'], row['total_sum'], row['low'],
+                 row['high']) for row in rows]
+    else:
+        rows = (rollups.filter(period=period).order_by('start', 'camera_id', 'label')
+                .values_list('camera_id', 'label', 'start', 'frames', 'total', 'min_count', 'max_count'))
+    return [{
+        'camera': camera_id, 'label': label, 'start': start, 'frames': frames, 'total': total,
+        'min': low, 'max': high, 'average': round(total / frames, 3) if frames else 0.0,
+    } for camera_id, label, start, frames, total, low, high in rows]
+
+
+def rebuild(frames, since, until, camera_id=None, chunk=50000):
+    """Recompute the rollups between two hour boundaries from stored detected frames."""
+    rollups = DetectionRollup.objects.filter(start__gte=since, start__lt=until)
+    if camera_id is not None:
+        rollups = rollups.filter(camera_id=camera_id)
+    buffer = RollupBuffer()
+    count = 0
+    with transaction.atomic():
+        rollups.delete()
+        for frame_camera_id, timestamp, result in frames.values_list(
+                'camera_id', 'timestamp', 'detection_result').iterator(chunk_size=2000):
+            counts = parse_detection_result(result)
+            if counts:
+                buffer.add(frame_camera_id, timestamp, counts)
+            count += 1
+            if len(buffer.pending) >= chunk:
+                buffer.flush()
+        buffer.flush()
+    return count
+
+
+def hour_floor(ts):
+    return bucket_start(ts, 'hour')
+
+
+def hour_ceil(ts):
+    floor = hour_floor(ts)
+    return floor if floor == ts else floor + timedelta(hours=1)
@@ -0,0 +1,167 @@
+import time
+import logging
+from collections import defaultdict, deque
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import Alert, AlertRule
+
+logger = logging.getLogger(__name__)
+
+# Share of batches in a rule's window that must satisfy it, so a detector
+# missing an object for a frame or two does not restart the window.
+SATISFIED_RATIO = 0.8
+# Seconds between checks for rules added or changed through the admin or API.
+RELOAD_INTERVAL = 15.0
+
+
+class RuleState:
+    """Sliding window and alarm state for one rule."""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.samples = deque()  # (timestamp, satisfied) for the last rule.duration seconds
+        self.satisfied = 0
+        self.started = None
+        self.firing = False
+        self.last_fired = None
+        self.last_matches = []
+
+    @property
+    def idle(self):
+        return self.satisfied == 0 and not self.firing
+
+    def in_schedule(self, now):
+        start, end = self.rule.active_from, self.rule.active_until
+        if start is None and end is None:
+            return True
+        if start is None:
+            return now < end
+        if end is None:
+            return now >= start
+        if start <= end:
+            return start <= now < end
+        return now >= start or now < end  # Window wraps past midnight
+
+    def in_zone(self, detection):
+        if not self.rule.zone:
+            return True
+        x1, y1, x2, y2 = self.rule.zone
+        center_x = (detection[2] + detection[4]) / 2
+        center_y = (detection[3] + detection[5]) / 2
+        return x1 <= center_x <= x2 and y1 <= center_y <= y2
+
+    def update(self, ts, detections, local_time):
+        """Add one batch to the window; return True when the rule should fire."""
+        matches = [detection for detection in detections if self.in_zone(detection)]
+        satisfied = len(matches) >= self.rule.min_count and self.in_schedule(local_time)
+        if satisfied:
+            self.last_matches = matches
+
+        if self.started is None:
+            self.started = ts
+        self.samples.append((ts, satisfied))
+        self.satisfied += satisfied
+        horizon = ts - self.rule.duration
+        while len(self.samples) > 1 and self.samples[0][0] < horizon:
+            _, old = self.samples.popleft()
+            self.satisfied -= old
+
+        holding = (
+            ts - self.started >= self.rule.duration
+            and self.satisfied >= SATISFIED_RATIO * len(self.samples)
+        )
+        fired = False
+        if holding and not self.firing:
+            # One alert per episode, and none within the cooldown of the previous one
+            if self.last_fired is None or ts - self.last_fired >= self.rule.cooldown:
+                self.firing = True
+                self.last_fired = ts
+                fired = True
+        elif not holding:
+            self.firing = False
+
+        if self.idle:
+            self.samples.clear()
+            self.started = None
+        return fired
+
+
+class RuleEngine:
+    """Evaluates one camera's alert rules incrementally on each detection batch.
+
+    Rules are indexed by class label, so a batch only touches the rules whose
+    label appears in it plus the rules still holding window state from
+    earlier batches; rules for absent classes cost nothing.
+    """
+
+    def __init__(self, camera_id, events=None):
+        self.camera_id = camera_id
+        self.events = events
+        self.index = {}
+        self.active = set()
+        self.signature = None
+        self.checked_at = 0.0
+
+    def set_rules(self, rules):
+        previous = {state.rule.id: state for states in self.index.values() for state in states}
+        index = defaultdict(list)
+        for rule in rules:
+            state = previous.get(rule.id)
+            if state is None or state.rule.label != rule.label:
+                state = RuleState(rule)
+            state.rule = rule
+            index[rule.label].append(state)
+        self.index = dict(index)
+        kept = {id(state) for states in self.index.values() for state in states}
+        self.active = {state for state in self.active if id(state) in kept}
+
+    def reload(self, force=False):
+        """Pick up rule changes, checking the database at most every RELOAD_INTERVAL."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < RELOAD_INTERVAL:
+            return
+        self.checked_at = now
+        rules = AlertRule.objects.filter(camera_id=self.camera_id, is_active=True)
+        signature = rules.aggregate(count=Count('id'), updated=Max('updated_at'))
+        if signature != self.signature:
+            self.set_rules(list(rules))
+            self.signature = signature
+            logger.info(f"Loaded {signature['count']} alert rules for Camera ID {self.camera_id}")
+
+    def evaluate(self, detections, ts=None, local_time=None):
+        """Update the windows touched by one batch and return the rule states that fired."""
+        ts = time.time() if ts is None else ts
+        local_time = local_time or timezone.localtime().time()
+
+        by_label = defaultdict(list)
+        for detection in detections:
+            if detection[0] in self.index:
+                by_label[detection[0]].append(detection)
+
+        candidates = set(self.active)
+        for label in by_label:
+            candidates.update(self.index[label])
+
+        fired = []
+        for state in candidates:
+            if state.update(ts, by_label.get(state.rule.label, ()), local_time):
+                fired.append(state)
+            if state.idle:
+                self.active.discard(state)
+            else:
+                self.active.add(state)
+        return fired
+
+    def process(self, detections):
+        """Evaluate one batch and return the alerts it raised."""
+        self.reload()
+        return [self.raise_alert(state) for state in self.evaluate(detections)]
+
+    def raise_alert(self, state):
+        rule = state.rule
+        detail = {'count': len(state.last_matches), 'detections': state.last_matches}
+        alert = Alert.objects.create(rule=rule, camera_id=self.camera_id, detail=detail)
+        logger.warning(f"Alert '{rule.name}' raised on Camera ID {self.camera_id}")
+        if self.events is not None:
+            self.events.publish('alert', alert=alert.id, rule=rule.id, name=rule.name, detail=detail)
+        return alert
@@ -1,5 +1,10 @@
+import os
 from rest_framework import serializers
-from .models import Camera, CameraPermission
+from .acl import get_camera_acl
+from .batch import create_job, job_progress, resolve_analysis_path
+from .hls import hls_playlist_url
+from .mosaic import wall_frame_id
+from .models import AnalysisJob, Camera, CameraPermission, EventClip, VideoWall
 from .models import User
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
@@ -57,11 +62,134 @@ class UserLoginSerializer(serializers.Serializer):
 class CameraSerializer(serializers.ModelSerializer):
     class Meta:
         model = Camera
-        fields = ['id', 'name',  'is_public', 'created_by', 'created_at', 'updated_at']
+        fields = ['id', 'name',  'is_public', 'priority', 'detector_backend', 'detector_input_size', 'detection_interval',
+                  'screening_weights', 'escalation_labels', 'escalation_confidence', 'escalation_budget',
+                  'hls_enabled', 'hls_playlist', 'recording_mode', 'created_by', 'created_at', 'updated_at']
         read_only_fields = ['created_by', 'created_at', 'updated_at']
 
+    hls_playlist = serializers.SerializerMethodField()
+
+    def get_hls_playlist(self, obj):
+        return hls_playlist_url(obj.id) if obj.hls_enabled else None
+
+    def validate_detector_input_size(self, value):
+        if value < 32 or value % 32:
+            raise serializers.ValidationError("Input size must be a positive multiple of 32.")
+        return value
+
+    def validate_detection_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Detection interval must be at least 1 frame.")
+        return value
+
+    def validate_escalation_labels(self, value):
+        if not isinstance(value, list) or not all(isinstance(label, str) for label in value):
+            raise serializers.ValidationError("Escalation labels must be a list of class names.")
+        return value
+
+    def validate_escalation_budget(self, value):
+        if not 0 <= value <= 1:
+            raise serializers.ValidationError("Escalation budget must be between 0 and 1.")
+        return value
+
+    def create(self, validated_data):
+        # Set by id so stateless token users work without loading the row
+        validated_data['created_by_id'] = self.context['request'].user.id
+        return super().create(validated_data)
+
+class EventClipSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EventClip
+        fields = ['id', 'camera', 'alert', 'detected_frame', 'status', 'started_at', 'triggered_at', 'ended_at',
+                  'frames', 'file']
+        read_only_fields = fields
+
+class RollupQuerySerializer(serializers.Serializer):
+    """Query parameters of the detection rollups endpoint."""
+    period = serializers.ChoiceField(choices=['minute', 'hour', 'day'], default='hour')
+    camera = serializers.IntegerField(required=False)
+    label = serializers.CharField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'until' in attrs and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'since': 'Must be before until.'})
+        return attrs
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnalysisJob
+        fields = ['id', 'camera', 'path', 'stride', 'batch_size', 'processes', 'status', 'error', 'progress',
+                  'created_by', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['status', 'error', 'created_by', 'created_at', 'started_at', 'finished_at']
+
+    progress = serializers.SerializerMethodField()
+
+    def get_progress(self, obj):
+        return job_progress(obj)
+
+    def validate_camera(self, value):
+        if not get_camera_acl(self.context['request'].user).can_edit(value.id):
+            raise serializers.ValidationError("You can only analyse footage for cameras you can edit.")
+        return value
+
+    def validate_path(self, value):
+        try:
+            return resolve_analysis_path(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_stride(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Stride must be at least 1 frame.")
+        return value
+
+    def validate_batch_size(self, value):
+        if not 1 <= value <= 64:
+            raise serializers.ValidationError("Batch size must be from 1 to 64 frames.")
+        return value
+
+    def validate_processes(self, value):
+        if not 1 <= value <= (os.cpu_count() or 1):
+            raise serializers.ValidationError("Processes must be from 1 to the number of CPUs.")
+        return value
+
+    def create(self, validated_data):
+        try:
+            return create_job(created_by_id=self.context['request'].user.id, **validated_data)
+        except ValueError as e:
+            raise serializers.ValidationError({'path': str(e)})
+
+class VideoWallSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoWall
+        fields = ['id', 'name', 'cameras', 'width', 'height', 'fps', 'hls_enabled', 'hls_playlist',
+                  'created_by', 'created_at', 'updated_at']
+        read_only_fields = ['created_by', 'created_at', 'updated_at']
+
+    hls_playlist = serializers.SerializerMethodField()
+
+    def get_hls_playlist(self, obj):
+        return hls_playlist_url(wall_frame_id(obj.id)) if obj.hls_enabled else None
+
+    def validate_width(self, value):
+        if not 160 <= value <= 7680:
+            raise serializers.ValidationError("Width must be from 160 to 7680 pixels.")
+        return value
+
+    def validate_height(self, value):
+        if not 90 <= value <= 4320:
+            raise serializers.ValidationError("Height must be from 90 to 4320 pixels.")
+        return value
+
+    def validate_fps(self, value):
+        if not 0 < value <= 30:
+            raise serializers.ValidationError("Frame rate must be above 0 and at most 30.")
+        return value
+
     def create(self, validated_data):
-        validated_data['created_by'] = self.context['request'].user
+        validated_data['created_by_id'] = self.context['request'].user.id
         return super().create(validated_data)
 
 class CameraPermissionSerializer(serializers.ModelSerializer):
@@ -0,0 +1,66 @@
+import bisect
+import hashlib
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """Consistent hash ring mapping camera ids to worker names.
+
+    Each worker is placed on the ring many times (``replicas``) so cameras
+    spread evenly, and adding or removing a worker only moves the cameras
+    that hashed to that worker.
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.keys = []
+        self.owners = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def hash_key(key):
+        return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+    @property
+    def nodes(self):
+        return sorted(set(self.owners.values()))
+
+    def add_node(self, node):
+        for replica in range(self.replicas):
+            point = self.hash_key(f'{node}#{replica}')
+            if point in self.owners:
+                continue
+            bisect.insort(self.keys, point)
+            self.owners[point] = node
+
+    def remove_node(self, node):
+        for replica in range(self.replicas):
+            point = self.hash_key(f'{node}#{replica}')
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.keys.remove(point)
+
+    def get_node(self, key):
+        """Return the worker that owns ``key``, or None for an empty ring."""
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self.hash_key(key)) % len(self.keys)
+        return self.owners[self.keys[index]]
+
+
+def get_ring():
+    return HashRing(settings.CCTV_WORKERS)
+
+
+def get_worker_for_camera(camera_id):
+    return get_ring().get_node(camera_id)
+
+
+def is_local_camera(camera_id, worker_name=None):
+    """Check whether this worker should run the pipeline for ``camera_id``."""
+    worker_name = worker_name or settings.CCTV_WORKER_NAME
+    return get_worker_for_camera(camera_id) == worker_name
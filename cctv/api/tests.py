@@ -1,4 +1,5 @@
 import asyncio
+import time
 import base64
 import json
 import cv2
@@ -7,72 +8,1349 @@ from unittest.mock import patch, MagicMock, AsyncMock
 from channels.testing import WebsocketCommunicator
 from django.test import TransactionTestCase
 from channels.routing import URLRouter
-from django.urls import re_path
+from django.urls import path, re_path
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
 import os
+import subprocess
+import sys
+import tempfile
 import logging
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 
-from .consumer import VideoStreamConsumer, CameraStreamConsumer
-from .models import Camera
+from .batch import BatchAnalyzer, create_job
+from .clips import ClipRecorder, ClipWriter, FrameRing, PendingClip
+from .consumer import VideoStreamConsumer, DetectionEventConsumer
+from .events import EventPublisher
+from .framecache import LatestFrame, LatestFrames, latest_frame_key, latest_frames, snapshot_variants
+from .governor import LEVELS, CpuGovernor, governor_cache_key
+from .hls import HlsWriter, hls_playlist_url
+from .inference import CascadeBackend, OnnxBackend, agreement, load_backend, match_detections
+from .models import (Alert, AlertRule, AnalysisJob, Camera, CameraLease, CameraPermission, DetectedFrame,
+                     DetectionRollup, EventClip, PipelineWorker, VideoWall)
+from .rules import RuleEngine
+from .acl import get_camera_acl
+from .authentication import get_tokens_for_user
+from .bench import BenchPipeline, StubBackend, SyntheticCapture, run_benchmark
+from .jwtMiddleware import JWTAuthMiddleware, TokenCache, authenticate_token, token_cache
+from .holders import HlsHolder
+from .leases import CacheLease, Lease, heartbeat_worker, live_workers
+from .livestream import feeds, mjpeg_part, mjpeg_stream
+from .loadtest import InProcessClient, InProcessProbe, LoadTest, publish_frames
+from .logqueue import AsyncQueueHandler, CameraLogSampler, camera_logger
+from .metrics import Histogram, MetricsRegistry, metrics_cache_key, serve_metrics
+from .mosaic import WallPipeline, grid, wall_frame_id
+from .pipeline import CameraPipeline, PipelineRegistry, camera_group_name, detection_result
+from .recording import AnnotationLog, PassthroughRecorder, passthrough_command
+from .rollups import RollupBuffer, label_counts
+from .sharding import HashRing
+from .threads import ThreadBudget, parse_cpu_list
+from .tracking import DetectionScheduler
+from .views import mjpeg_view
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-@patch('cv2.VideoCapture')
-@patch('cv2.VideoWriter')
-@patch('ultralytics.YOLO')
-async def test_video_recording(self, mock_yolo, mock_video_writer, mock_video_capture):
-    """Test video recording functionality"""
-    # Mock video capture
-    mock_cap = MagicMock()
-    mock_cap.isOpened.return_value = True
-    mock_cap.read.return_value = (True, np.zeros((480, 640, 3), dtype=np.uint8))
-    mock_cap.get.side_effect = lambda x: 640 if x == cv2.CAP_PROP_FRAME_WIDTH else 480
-    mock_video_capture.return_value = mock_cap
-
-    # Mock YOLO model
-    mock_model = MagicMock()
-    mock_model.return_value = [MagicMock(plot=lambda: np.zeros((480, 640, 3), dtype=np.uint8))]
-    mock_yolo.return_value = mock_model
-
-    # Mock video writer
-    mock_writer = MagicMock()
-    mock_video_writer.return_value = mock_writer
-
-    # Connect to WebSocket
-    communicator = self.create_communicator()
-    connected, _ = await communicator.connect()
-    self.assertTrue(connected)
-
-    try:
-        # Wait for some frames to be processed
-        for _ in range(5):  # Try to receive 5 frames
-            try:
-                response = await communicator.receive_json_from(timeout=2.0)
-                self.assertIn('frame', response)
-                logger.info(f"Received frame: {response}")
-            except asyncio.TimeoutError:
-                logger.error("Timeout waiting for frames")
-                self.fail("Timeout waiting for frames")
-
-        # Verify video writer was called
-        mock_writer.write.assert_called()
-        logger.info(f"Video writer write call count: {mock_writer.write.call_count}")
-
-    finally:
+class PipelineRecordingTest(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Gate', created_by=admin)
+        self.channel_layer = InMemoryChannelLayer()
+
+    def test_frames_are_detected_recorded_and_published(self):
+        capture = SyntheticCapture(320, 240, frames=5)
+        pipeline = BenchPipeline(self.camera.id, lambda camera: capture, StubBackend())
+        pipeline.channel_layer = pipeline.events.channel_layer = self.channel_layer
+        viewer = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(camera_group_name(self.camera.id), viewer)
+
+        pipeline.running = True
+        pipeline.run()  # In this thread, until the capture runs out
+
+        self.assertFalse(capture.isOpened())
+        self.assertGreater(os.path.getsize(pipeline.output_path), 0)
+        results = DetectedFrame.objects.filter(camera=self.camera).values_list('detection_result', flat=True)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result.startswith('Label: person') for result in results))
+        messages = [async_to_sync(self.channel_layer.receive)(viewer)['type'] for _ in range(6)]
+        self.assertEqual(messages, ['stream.frame'] * 5 + ['stream.end'])
+        self.assertEqual(len(pipeline.samples['send']), 5)
+
+    @override_settings(CCTV_PROCESS_ROLE='stream')
+    def test_leased_pipeline_shares_latest_frames_with_other_processes(self):
+        cache.clear()
+        lease = Lease(self.camera.id, 'stream-1')
+        self.assertTrue(lease.acquire())
+        pipeline = BenchPipeline(self.camera.id, lambda camera: SyntheticCapture(320, 240, frames=3), StubBackend(),
+                                 lease=lease)
+        pipeline.channel_layer = pipeline.events.channel_layer = self.channel_layer
+        pipeline.running = True
+        with patch.object(latest_frames, 'discard'):  # Keep the frame the pipeline leaves on exit
+            pipeline.run()
+        self.addCleanup(latest_frames.discard, self.camera.id)
+
+        with override_settings(CCTV_PROCESS_ROLE='web'):
+            shared = LatestFrames().get(self.camera.id)  # A web process holds nothing in memory
+        self.assertIsNotNone(shared)
+        self.assertEqual(shared.jpeg[:2], b'\xff\xd8')
+
+    def test_benchmark_reports_stages_and_viewer_latency(self):
+        results = run_benchmark([self.camera], lambda camera: SyntheticCapture(320, 240, frames=10), StubBackend(),
+                                viewers=2, seconds=30, channel_layer=self.channel_layer)
+        self.assertEqual(results['frames'], 10)
+        self.assertEqual(results['stages']['persist']['count'], 10)
+        self.assertEqual(results['viewer_latency']['count'], 20)
+        self.assertGreater(results['rss_mb'], 0)
+
+
+class HashRingTest(SimpleTestCase):
+    def test_cameras_spread_over_all_workers(self):
+        ring = HashRing(['worker-1', 'worker-2', 'worker-3'])
+        owners = {ring.get_node(camera_id) for camera_id in range(300)}
+        self.assertEqual(owners, {'worker-1', 'worker-2', 'worker-3'})
+
+    def test_removing_worker_only_moves_its_cameras(self):
+        ring = HashRing(['worker-1', 'worker-2', 'worker-3'])
+        before = {camera_id: ring.get_node(camera_id) for camera_id in range(300)}
+        ring.remove_node('worker-2')
+        for camera_id, owner in before.items():
+            if owner != 'worker-2':
+                self.assertEqual(ring.get_node(camera_id), owner)
+            else:
+                self.assertIn(ring.get_node(camera_id), ['worker-1', 'worker-3'])
+
+    def test_empty_ring_has_no_owner(self):
+        self.assertIsNone(HashRing().get_node(7))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PipelinePublishTest(SimpleTestCase):
+    def test_frames_reach_every_subscribed_viewer(self):
+        channel_layer = get_channel_layer()
+        viewers = [async_to_sync(channel_layer.new_channel)() for _ in range(2)]
+        for channel in viewers:
+            async_to_sync(channel_layer.group_add)(camera_group_name(7), channel)
+
+        CameraPipeline(7).publish({'type': 'stream.frame', 'frame': 'abc'})
+
+        for channel in viewers:
+            message = async_to_sync(channel_layer.receive)(channel)
+            self.assertEqual(message, {'type': 'stream.frame', 'frame': 'abc'})
+
+
+class OnnxBackendTest(SimpleTestCase):
+    def setUp(self):
+        # Exercise pre/post-processing without loading a model file
+        self.backend = OnnxBackend.__new__(OnnxBackend)
+        self.backend.input_size = 640
+        self.backend.names = {0: 'person', 1: 'car'}
+
+    def test_letterbox_pads_to_square(self):
+        tensor, scale, padding = self.backend.preprocess(np.zeros((480, 640, 3), dtype=np.uint8))
+        self.assertEqual(tensor.shape, (1, 3, 640, 640))
+        self.assertEqual((scale, padding), (1.0, (0, 80)))
+        self.assertAlmostEqual(float(tensor[0, 0, 0, 0]), 114 / 255, places=5)
+
+    def test_postprocess_maps_boxes_to_frame_and_suppresses_overlaps(self):
+        output = np.zeros((1, 6, 3), dtype=np.float32)
+        output[0, :, 0] = [320, 320, 100, 50, 0.9, 0.0]  # person
+        output[0, :, 1] = [322, 320, 100, 50, 0.6, 0.0]  # duplicate of the person
+        output[0, :, 2] = [100, 200, 40, 40, 0.1, 0.2]  # below the threshold
+        detections = self.backend.postprocess(output, 1.0, (0, 80), (480, 640, 3))
+        self.assertEqual(detections, [['person', 0.9, 270, 215, 370, 265]])
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            load_backend('tensorrt')
+
+
+class BackendAgreementTest(SimpleTestCase):
+    def test_matches_same_label_overlapping_boxes(self):
+        reference = [['person', 0.9, 0, 0, 100, 100], ['car', 0.8, 200, 200, 300, 300]]
+        candidate = [['person', 0.85, 5, 5, 100, 100], ['person', 0.4, 200, 200, 300, 300]]
+        self.assertEqual(match_detections(reference, candidate), (1, 1, 1))
+        self.assertEqual(agreement([reference], [candidate]), {'precision': 0.5, 'recall': 0.5, 'f1': 0.5})
+
+
+class CascadeBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.screen = MagicMock(input_size=640)
+        self.full = MagicMock(input_size=640)
+        self.full.detect.return_value = [['person', 0.95, 0, 0, 10, 10]]
+
+    def test_escalates_high_value_and_ambiguous_frames_only(self):
+        cascade = CascadeBackend(self.screen, self.full, labels=['person'], confidence=0.5, budget=1.0)
+        batches = [
+            [['car', 0.9, 0, 0, 10, 10]],
+            [['person', 0.9, 0, 0, 10, 10]],
+            [['dog', 0.3, 0, 0, 10, 10]],
+            [],
+        ]
+        self.screen.detect.side_effect = batches
+        results = [cascade.detect(None) for _ in batches]
+        self.assertEqual(results[0], batches[0])
+        self.assertEqual(results[1], [['person', 0.95, 0, 0, 10, 10]])
+        self.assertEqual(self.full.detect.call_count, 2)
+        self.assertEqual(cascade.stats()['by_reason'], {'label': 1, 'ambiguous': 1})
+
+    def test_budget_caps_escalation_rate(self):
+        cascade = CascadeBackend(self.screen, self.full, labels=['person'], budget=0.1)
+        self.screen.detect.return_value = [['person', 0.9, 0, 0, 10, 10]]
+        for _ in range(100):
+            cascade.detect(None)
+        self.assertLessEqual(self.full.detect.call_count, 11)
+        self.assertEqual(cascade.over_budget, 100 - self.full.detect.call_count)
+
+    def test_resizing_keeps_the_cascade_and_its_statistics(self):
+        cascade = CascadeBackend(StubBackend(640), StubBackend(640), labels=['person'])
+        screen = cascade.screen
+        cascade.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        self.assertIs(cascade.resized(320), cascade)
+        self.assertEqual((cascade.input_size, cascade.screen.input_size, cascade.full.input_size), (320, 320, 320))
+        self.assertEqual(screen.input_size, 640)  # Other cameras sharing the model keep their size
+        self.assertEqual(cascade.stats()['frames'], 1)
+
+    def test_failed_resize_leaves_both_models_at_the_old_size(self):
+        cascade = CascadeBackend(StubBackend(640), StubBackend(640))
+        screen, full = cascade.screen, cascade.full
+        with patch.object(full, 'resized', side_effect=FileNotFoundError("no 320px export")):
+            with self.assertRaises(FileNotFoundError):
+                cascade.resized(320)
+        self.assertIs(cascade.screen, screen)
+        self.assertIs(cascade.full, full)
+        self.assertEqual(cascade.input_size, 640)
+
+
+class DetectionSchedulerTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.background = rng.randint(0, 60, (480, 640, 3), dtype=np.uint8)
+        self.texture = rng.randint(0, 255, (80, 80, 3), dtype=np.uint8)
+        self.backend = MagicMock(name='backend')
+        self.backend.name = 'stub'
+        self.backend.detect.side_effect = lambda frame: [['person', 0.9, *self.box]]
+
+    def frame(self, index):
+        # A textured square moving 5 pixels right per frame
+        frame = self.background.copy()
+        x = 100 + 5 * index
+        frame[200:280, x:x + 80] = self.texture
+        self.box = [x, 200, x + 80, 280]
+        return frame
+
+    def test_tracks_boxes_between_detector_runs(self):
+        scheduler = DetectionScheduler(self.backend, interval=5)
+        for index in range(10):
+            detections = scheduler.detect(self.frame(index))
+            self.assertEqual(detections[0][0], 'person')
+            for tracked, expected in zip(detections[0][2:], self.box):
+                self.assertLessEqual(abs(tracked - expected), 3)
+        self.assertEqual(self.backend.detect.call_count, 2)
+        self.assertEqual(scheduler.stats()['inference_ratio'], 0.2)
+
+    def test_scene_change_runs_detector_early(self):
+        scheduler = DetectionScheduler(self.backend, interval=10)
+        scheduler.detect(self.frame(0))
+        scheduler.detect(self.frame(1))
+        scheduler.detect(np.full((480, 640, 3), 255, dtype=np.uint8))
+        self.assertEqual(self.backend.detect.call_count, 2)
+        self.assertEqual(scheduler.resyncs, 1)
+
+    def test_interval_of_one_detects_every_frame(self):
+        scheduler = DetectionScheduler(self.backend, interval=1)
+        for index in range(3):
+            scheduler.detect(self.frame(index))
+        self.assertEqual(self.backend.detect.call_count, 3)
+
+
+class CpuGovernorTest(SimpleTestCase):
+    def setUp(self):
+        # A long interval keeps the background tick out of the way; steps are driven by hand
+        self.governor = CpuGovernor(budget=4, interval=3600, node='node-a')
+        for camera_id, priority, cost in [(1, 2, 0.5), (2, 0, 0.2), (3, 0, 0.9), (4, 1, 0.9)]:
+            costs = self.governor.register(camera_id, priority)
+            costs.record('detect', cost / 10)
+            costs.frame_period = 0.1
+
+    def test_degrades_low_priority_expensive_cameras_first(self):
+        order = [self.governor.step(1.2)['camera'] for _ in range(3)]
+        self.assertEqual(order, [3, 3, 3])
+        for _ in range(4):
+            self.governor.step(1.2)
+        levels = {camera_id: load.level for camera_id, load in self.governor.cameras.items()}
+        self.assertEqual(levels[1], 0)  # High priority keeps full rate
+        self.assertEqual(levels[3], len(LEVELS) - 1)
+        self.assertEqual(levels[2], 3)
+        self.assertEqual(levels[4], 0)
+
+    def test_restores_high_priority_first_with_hysteresis(self):
+        self.governor.cameras[2].level = 2
+        self.governor.cameras[4].level = 1
+        self.assertIsNone(self.governor.step(0.8))
+        self.assertEqual(self.governor.step(0.5)['camera'], 4)
+        self.assertEqual(self.governor.degradation(4), LEVELS[0])
+        self.assertEqual(self.governor.snapshot()['headroom_cores'], 2.0)
+
+
+class GovernorViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='root@example.com', password='secret', role='SUPER_ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': f"Bearer {get_tokens_for_user(user)['access']}"}
+
+    def test_reports_node_snapshots_to_super_admins(self):
+        heartbeat_worker('node-a')
+        snapshot = CpuGovernor(budget=2, interval=3600, node='node-a').snapshot()
+        cache.set(governor_cache_key('node-a'), snapshot)
+        response = self.client.get('/api/stats/governor/', **self.bearer(self.admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node['node'] for node in response.json()['nodes']], ['node-a'])
+        self.assertEqual(self.client.get('/api/stats/governor/', **self.bearer(self.viewer)).status_code, 403)
+
+
+class ThreadBudgetTest(SimpleTestCase):
+    def test_splits_cores_between_running_pipelines(self):
+        budget = ThreadBudget(cores=8, enabled=True)
+        self.assertEqual(budget.per_pipeline, 8)
+        for _ in range(3):
+            budget.acquire()
+        self.assertEqual(budget.per_pipeline, 2)
+        self.assertEqual(cv2.getNumThreads(), 2)
+        for _ in range(16):
+            budget.acquire()
+        self.assertEqual(budget.per_pipeline, 1)
+        for _ in range(19):
+            budget.release()
+        self.assertEqual(budget.per_pipeline, 8)
+
+    def test_onnx_sessions_get_one_share_without_spinning(self):
+        budget = ThreadBudget(cores=8, enabled=True)
+        for _ in range(4):
+            budget.acquire()
+        options = budget.session_options()
+        self.assertEqual(options.intra_op_num_threads, 2)
+        self.assertEqual(options.get_session_config_entry('session.intra_op.allow_spinning'), '0')
+        self.assertEqual(ThreadBudget(cores=8, enabled=False).session_options().intra_op_num_threads, 0)
+
+    def test_parses_cpu_lists(self):
+        self.assertEqual(parse_cpu_list('0-3,8, 10'), {0, 1, 2, 3, 8, 10})
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_histogram_quantiles_interpolate_within_buckets(self):
+        histogram = Histogram(buckets=(0.01, 0.02, 0.05))
+        for value in [0.005] * 50 + [0.015] * 49 + [0.04]:
+            histogram.observe(value)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.01)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.02)
+        self.assertEqual(histogram.counts, [50, 49, 1, 0])
+
+    def test_renders_prometheus_text(self):
+        registry = MetricsRegistry(enabled=True)
+        stages = registry.histogram('stage_seconds', "Stage time.", ('camera', 'stage'), buckets=(0.01, 0.1))
+        drops = registry.counter('drops_total', "Drops.", ('camera',))
+        registry.gauge('viewers', "Viewers.", callback=lambda: {(): 3})
+        stages.labels(7, 'inference').observe(0.05)
+        drops.labels(7).inc(2)
+        text = registry.render()
+        self.assertIn('# TYPE stage_seconds histogram', text)
+        self.assertIn('stage_seconds_bucket{camera="7",stage="inference",le="0.01"} 0', text)
+        self.assertIn('stage_seconds_bucket{camera="7",stage="inference",le="+Inf"} 1', text)
+        self.assertIn('drops_total{camera="7"} 2', text)
+        self.assertIn('viewers 3', text)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['stage_seconds'][0]['count'], 1)
+        self.assertEqual(snapshot['viewers'], [{'labels': {}, 'value': 3}])
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry(enabled=False)
+        stages = registry.histogram('stage_seconds', "Stage time.", ('stage',))
+        stages.labels('capture').observe(0.01)
+        self.assertEqual(registry.snapshot(), {'stage_seconds': []})
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='root@example.com', password='secret', role='SUPER_ADMIN')
+
+    @override_settings(CCTV_METRICS_TOKEN='scrape-token')
+    def test_scrape_endpoint_requires_token_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE cctv_stage_seconds histogram', response.content)
+
+    @override_settings(CCTV_METRICS_TOKEN='scrape-token')
+    def test_worker_metrics_port_requires_token_when_set(self):
+        server = serve_metrics(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with self.assertRaises(HTTPError) as refused:
+            urlopen(url, timeout=5)
+        self.assertEqual(refused.exception.code, 401)
+        with urlopen(Request(url, headers={'Authorization': 'Bearer scrape-token'}), timeout=5) as response:
+            self.assertIn(b'# TYPE cctv_stage_seconds histogram', response.read())
+
+    def test_admin_endpoint_includes_worker_snapshots(self):
+        heartbeat_worker('node-a')
+        cache.set(metrics_cache_key('node-a'), {'node': 'node-a', 'metrics': {}})
+        access = get_tokens_for_user(self.admin)['access']
+        response = self.client.get('/api/stats/metrics/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cctv_frames_total', response.json()['local'])
+        self.assertEqual(response.json()['nodes'][0]['node'], 'node-a')
+
+
+class LogQueueTest(SimpleTestCase):
+    def record(self, msg, created, camera=None):
+        record = logging.LogRecord('api.pipeline', logging.DEBUG, __file__, 1, msg, (), None)
+        record.created = created
+        if camera is not None:
+            record.camera = camera
+        return record
+
+    def test_sampler_thins_repeats_per_camera(self):
+        sampler = CameraLogSampler(interval=1.0)
+        self.assertTrue(sampler.filter(self.record("Frame read", 0.0, camera=1)))
+        self.assertFalse(sampler.filter(self.record("Frame read", 0.2, camera=1)))
+        self.assertFalse(sampler.filter(self.record("Frame read", 0.4, camera=1)))
+        self.assertTrue(sampler.filter(self.record("Frame read", 0.3, camera=2)))
+        self.assertTrue(sampler.filter(self.record("Frame read", 0.5)))
+        passed = self.record("Frame read", 1.1, camera=1)
+        self.assertTrue(sampler.filter(passed))
+        self.assertEqual(passed.getMessage(), "Frame read (2 similar messages suppressed)")
+        self.assertEqual(sampler.total_suppressed, 2)
+
+    def test_full_queue_drops_without_blocking(self):
+        import queue
+        handler = AsyncQueueHandler(queue.Queue(1))
+        handler.handle(self.record("first", 0.0))
+        started = time.monotonic()
+        handler.handle(self.record("second", 0.0))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(handler.dropped, 1)
+
+    def test_records_are_formatted_by_the_listener(self):
+        import queue
+        from logging.handlers import BufferingHandler, QueueListener
+
+        class Lazy:
+            formatted = 0
+
+            def __str__(self):
+                Lazy.formatted += 1
+                return 'lazy'
+
+        target = BufferingHandler(10)
+        handler = AsyncQueueHandler(queue.Queue())
+        listener = QueueListener(handler.queue, target)
+        logger = logging.getLogger('api.tests.logqueue')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        try:
+            camera_logger(logger, 5).debug("Frame %s", Lazy())
+            self.assertEqual(Lazy.formatted, 0)
+            listener.start()
+            listener.stop()
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(target.buffer[0].camera, 5)
+        self.assertEqual(target.format(target.buffer[0]), "Frame lazy")
+
+
+class IdlePipeline:
+    def __init__(self, camera_id, lease=None):
+        self.lease = lease
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+
+    def stop(self, wait=False):
+        self.alive = False
+
+    def is_alive(self):
+        return self.alive
+
+
+class CameraLeaseTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Gate', created_by=owner)
+
+    def test_only_one_worker_holds_a_camera(self):
+        first = Lease(self.camera.id, 'worker-1')
+        second = Lease(self.camera.id, 'worker-2')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(first.is_held())
+        self.assertFalse(second.is_held())
+        self.assertEqual(CameraLease.objects.get(camera=self.camera).owner, 'worker-1')
+
+    def test_expired_lease_fails_over_and_old_owner_cannot_renew(self):
+        first = Lease(self.camera.id, 'worker-1')
+        self.assertTrue(first.acquire())
+        CameraLease.objects.filter(camera=self.camera).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        second = Lease(self.camera.id, 'worker-2')
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.renew())
+        self.assertFalse(first.is_held())
+        self.assertTrue(second.renew())
+
+    def test_release_frees_camera_immediately(self):
+        first = Lease(self.camera.id, 'worker-1')
+        first.acquire()
+        first.release()
+        self.assertTrue(Lease(self.camera.id, 'worker-2').acquire())
+
+    @patch.object(PipelineRegistry, 'keep_maintained')
+    def test_stream_processes_run_a_camera_once_and_take_over_when_it_stops(self, _):
+        first = PipelineRegistry(IdlePipeline, lease_factory=lambda camera_id: Lease(camera_id, 'stream-1'))
+        second = PipelineRegistry(IdlePipeline, lease_factory=lambda camera_id: Lease(camera_id, 'stream-2'))
+        self.assertIsNotNone(first.acquire(self.camera.id))
+        self.assertIsNone(second.acquire(self.camera.id))  # Its viewer gets stream-1's frames
+        second.maintain()
+        self.assertEqual(second.running_cameras(), set())
+
+        first.release(self.camera.id)
+        second.maintain()
+        self.assertEqual(second.running_cameras(), {self.camera.id})
+        self.assertEqual(CameraLease.objects.get(camera=self.camera).owner, 'stream-2')
+
+    @patch.object(PipelineRegistry, 'keep_maintained')
+    def test_hls_outputs_run_without_viewers(self, _):
+        cameras = PipelineRegistry(IdlePipeline)
+        wall_registry = PipelineRegistry(IdlePipeline)
+        wall = VideoWall.objects.create(name='Lobby', hls_enabled=True, created_by=self.camera.created_by)
+        Camera.objects.filter(id=self.camera.id).update(hls_enabled=True)
+        holder = HlsHolder(cameras, wall_registry)
+        holder.sync()
+        self.assertEqual((cameras.running_cameras(), wall_registry.running_cameras()), ({self.camera.id}, {wall.id}))
+
+        cameras.acquire(self.camera.id)  # A live viewer outlasts HLS being turned off
+        Camera.objects.filter(id=self.camera.id).update(hls_enabled=False)
+        holder.sync()
+        self.assertEqual(cameras.running_cameras(), {self.camera.id})
+        cameras.release(self.camera.id)
+        self.assertEqual(cameras.running_cameras(), set())
+
+    def test_cache_leases_keep_a_wall_to_one_process(self):
+        cache.clear()
+        first, second = CacheLease('wall-1', 'stream-1'), CacheLease('wall-1', 'stream-2')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(first.renew())
+        first.release()
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.renew())
+
+    def test_dead_workers_leave_the_ring(self):
+        heartbeat_worker('worker-1')
+        heartbeat_worker('worker-2')
+        PipelineWorker.objects.filter(name='worker-2').update(
+            heartbeat_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.assertEqual(live_workers(), ['worker-1'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DetectionEventConsumerTest(TransactionTestCase):
+    def setUp(self):
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.gate = Camera.objects.create(name='Gate', created_by=admin)
+        self.yard = Camera.objects.create(name='Yard', created_by=admin)
+        CameraPermission.objects.create(user=self.viewer, camera=self.gate, can_view=True)
+
+    def create_communicator(self, path='/ws/events/'):
+        application = URLRouter([re_path(r'^ws/events/$', DetectionEventConsumer.as_asgi())])
+        communicator = WebsocketCommunicator(application, path)
+        communicator.scope['user'] = self.viewer
+        return communicator
+
+    async def test_subscriber_only_receives_events_for_viewable_cameras(self):
+        communicator = self.create_communicator()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        subscribed = await communicator.receive_json_from()
+        self.assertEqual(subscribed['cameras'], [self.gate.id])
+
+        channel_layer = get_channel_layer()
+        await database_sync_to_async(EventPublisher(channel_layer, self.yard.id).publish_detections)(
+            [['person', 0.9, 0, 0, 10, 10]]
+        )
+        await database_sync_to_async(EventPublisher(channel_layer, self.gate.id).publish_detections)(
+            [['car', 0.8, 5, 5, 50, 50]]
+        )
+
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['camera'], self.gate.id)
+        self.assertEqual(event['detections'], [['car', 0.8, 5, 5, 50, 50]])
+        self.assertTrue(await communicator.receive_nothing())
         await communicator.disconnect()
 
-        # Wait for a short time to allow for cleanup
-        await asyncio.sleep(0.1)
+    async def test_requested_cameras_are_limited_to_viewable_ones(self):
+        communicator = self.create_communicator(f'/ws/events/?cameras={self.gate.id},{self.yard.id}')
+        await communicator.connect()
+        subscribed = await communicator.receive_json_from()
+        self.assertEqual(subscribed['cameras'], [self.gate.id])
+        await communicator.disconnect()
+
+
+class EventPublisherTest(SimpleTestCase):
+    def test_repeated_empty_batches_are_published_once(self):
+        channel_layer = MagicMock()
+        channel_layer.group_send = AsyncMock()
+        publisher = EventPublisher(channel_layer, 3)
+        publisher.publish_detections([])
+        publisher.publish_detections([])
+        publisher.publish_detections([['person', 0.5, 0, 0, 1, 1]])
+        publisher.publish_detections([])
+        self.assertEqual(channel_layer.group_send.await_count, 3)
+
+
+class RuleEngineTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Car park', created_by=owner)
+        self.night = dt_time(23, 0)
+
+    def engine_with(self, **rule_fields):
+        rule = AlertRule.objects.create(camera=self.camera, **rule_fields)
+        engine = RuleEngine(self.camera.id)
+        engine.reload(force=True)
+        return rule, engine
+
+    def test_person_in_zone_after_hours(self):
+        rule, engine = self.engine_with(
+            name='Night intruder', label='person', zone=[0, 0, 100, 100], active_from=dt_time(22, 0)
+        )
+        outside_zone = [['person', 0.9, 200, 200, 260, 300]]
+        inside_zone = [['person', 0.9, 10, 10, 50, 90]]
+        self.assertEqual(engine.evaluate(inside_zone, ts=0, local_time=dt_time(21, 0)), [])
+        self.assertEqual(engine.evaluate(outside_zone, ts=1, local_time=self.night), [])
+        fired = engine.evaluate(inside_zone, ts=2, local_time=self.night)
+        self.assertEqual([state.rule for state in fired], [rule])
+        # The same episode does not fire again
+        self.assertEqual(engine.evaluate(inside_zone, ts=3, local_time=self.night), [])
+
+    def test_count_must_hold_for_the_whole_window(self):
+        rule, engine = self.engine_with(name='Busy', label='car', min_count=6, duration=120, cooldown=0)
+        cars = [['car', 0.8, i, i, i + 10, i + 10] for i in range(6)]
+        for ts in range(0, 120, 10):
+            self.assertEqual(engine.evaluate(cars, ts=ts, local_time=self.night), [])
+        fired = engine.evaluate(cars, ts=120, local_time=self.night)
+        self.assertEqual([state.rule for state in fired], [rule])
+
+    def test_unrelated_classes_do_not_touch_rules(self):
+        _, engine = self.engine_with(name='Busy', label='car', min_count=2, duration=60)
+        engine.evaluate([['person', 0.9, 0, 0, 10, 10]], ts=0, local_time=self.night)
+        self.assertEqual(engine.active, set())
+
+    def test_process_records_one_alert_per_episode(self):
+        _, engine = self.engine_with(name='Any person', label='person')
+        person = [['person', 0.9, 0, 0, 10, 10]]
+        engine.process(person)
+        engine.process(person)
+        self.assertEqual(Alert.objects.filter(camera=self.camera).count(), 1)
+
+
+class CameraACLTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.gate = Camera.objects.create(name='Gate', created_by=self.admin)
+        self.yard = Camera.objects.create(name='Yard', created_by=self.admin)
+        CameraPermission.objects.create(user=self.viewer, camera=self.gate, can_view=True)
+
+    def fresh(self, user):
+        return User.objects.get(id=user.id)
+
+    def test_cached_acl_needs_no_queries(self):
+        get_camera_acl(self.fresh(self.viewer))
+        viewer = self.fresh(self.viewer)
+        with self.assertNumQueries(0):
+            acl = get_camera_acl(viewer)
+            self.assertTrue(acl.can_view(self.gate.id))
+            self.assertFalse(acl.can_view(self.yard.id))
+            self.assertFalse(acl.can_edit(self.gate.id))
+
+    def test_roles(self):
+        other_admin = User.objects.create_user(email='other@example.com', password='secret', role='ADMIN')
+        acl = get_camera_acl(other_admin)
+        self.assertEqual(acl.viewable, {self.gate.id, self.yard.id})
+        self.assertEqual(acl.editable, set())
+        self.assertEqual(get_camera_acl(self.admin).editable, {self.gate.id, self.yard.id})
+
+    def test_permission_change_invalidates_user(self):
+        get_camera_acl(self.fresh(self.viewer))
+        CameraPermission.objects.create(user=self.viewer, camera=self.yard, can_view=True)
+        self.assertTrue(get_camera_acl(self.fresh(self.viewer)).can_view(self.yard.id))
+
+    def test_new_camera_invalidates_every_user(self):
+        get_camera_acl(self.fresh(self.admin))
+        lobby = Camera.objects.create(name='Lobby', created_by=self.admin)
+        self.assertTrue(get_camera_acl(self.fresh(self.admin)).can_edit(lobby.id))
+
+    def test_camera_list_uses_acl(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get('/api/cameras/')
+        self.assertEqual([camera['id'] for camera in response.json()], [self.gate.id])
+        self.assertEqual(self.client.get(f'/api/cameras/{self.yard.id}/').status_code, 404)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class VideoStreamPermissionTest(TransactionTestCase):
+    async def test_viewer_without_permission_is_rejected(self):
+        viewer = await database_sync_to_async(self.create_viewer)()
+        application = URLRouter([re_path(r'^ws/stream/(?P<camera_id>\d+)/$', VideoStreamConsumer.as_asgi())])
+        communicator = WebsocketCommunicator(application, f'/ws/stream/{self.camera.id}/')
+        communicator.scope['user'] = viewer
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+    def create_viewer(self):
+        cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Gate', created_by=admin)
+        return User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CCTV_PROCESS_ROLE='web')
+class StreamLoadTest(TransactionTestCase):
+    async def test_viewers_receive_frames_and_leave_nothing_behind(self):
+        camera_ids, token = await database_sync_to_async(self.create_cameras)()
+        application = JWTAuthMiddleware(URLRouter([
+            path('ws/stream/<int:camera_id>/', VideoStreamConsumer.as_asgi()),
+        ]))
+        channel_layer = get_channel_layer()
+        load = LoadTest(lambda camera_id: InProcessClient(camera_id, token, application), camera_ids, 6,
+                        InProcessProbe(channel_layer, camera_ids), duration=1, connect_rate=1000,
+                        report_interval=0.5, churn=0.5, settle=0.2)
+        feeder = asyncio.create_task(publish_frames(channel_layer, camera_ids, 'frame', fps=20))
+        try:
+            report = await load.run()
+        finally:
+            feeder.cancel()
+
+        self.assertEqual(report['refused'], {})
+        self.assertEqual(report['connect']['count'], 6 + 3 * len(report['timeline']))
+        self.assertGreater(report['client_fps']['mean'], 5)
+        self.assertGreater(report['timeline'][0]['latency']['count'], 0)
+        self.assertEqual(report['final']['group_members'], 0)
+        self.assertNotIn('group_members', report['leaks'])
+        self.assertNotIn('db_connections', report['leaks'])
+
+    def create_cameras(self):
+        cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        cameras = [Camera.objects.create(name=f'Camera {index}', created_by=admin).id for index in range(2)]
+        return cameras, get_tokens_for_user(admin)['access']
+
+
+class LatestFrameTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def frame(self, camera_id=7, seq=1, ts=None):
+        return LatestFrame(camera_id, seq, time.time() if ts is None else ts, b'jpeg', 'anBlZw==', [['person', 0.9, 1, 2, 3, 4]])
+
+    def test_workers_share_frames_through_the_cache_at_most_every_interval(self):
+        frames = LatestFrames(ttl=10, share_interval=1)
+        first = self.frame(seq=1)
+        frames.put(first, share=True)
+        frames.put(first._replace(seq=2, ts=first.ts + 0.5), share=True)
+        self.assertEqual(frames.get(7).seq, 2)
+        self.assertEqual(LatestFrames().get(7).seq, 1)  # Another process sees the shared copy
+        frames.discard(7)
+        self.assertIsNone(frames.get(7))
+        self.assertIsNone(cache.get(latest_frame_key(7)))
+
+    def test_stale_frames_are_not_served(self):
+        frames = LatestFrames(ttl=10)
+        frames.put(self.frame(ts=time.time() - 11), share=False)
+        self.assertIsNone(frames.get(7))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CCTV_PROCESS_ROLE='web')
+class FirstFrameTest(TransactionTestCase):
+    async def test_new_viewer_gets_latest_frame_on_accept(self):
+        camera_id, token = await database_sync_to_async(self.create_camera)()
+        latest_frames.put(LatestFrame(camera_id, 3, time.time(), b'jpeg', 'anBlZw==', [['car', 0.8, 0, 0, 5, 5]]))
+        self.addCleanup(latest_frames.discard, camera_id)
+        application = JWTAuthMiddleware(URLRouter([
+            path('ws/stream/<int:camera_id>/', VideoStreamConsumer.as_asgi()),
+        ]))
+        communicator = WebsocketCommunicator(application, f'/ws/stream/{camera_id}/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['frame'], 'anBlZw==')
+        self.assertTrue(message['cached'])
+        self.assertEqual(message['detections'], [['car', 0.8, 0, 0, 5, 5]])
+        await communicator.disconnect()
+
+    def create_camera(self):
+        cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        camera = Camera.objects.create(name='Gate', created_by=admin)
+        return camera.id, get_tokens_for_user(admin)['access']
+
+
+class SnapshotViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.camera = Camera.objects.create(name='Gate', created_by=self.admin)
+        _, jpeg = cv2.imencode('.jpg', np.full((360, 640, 3), 128, dtype=np.uint8))
+        latest_frames.put(LatestFrame(self.camera.id, 4, time.time(), jpeg.tobytes(), '', []), share=False)
+        self.addCleanup(latest_frames.discard, self.camera.id)
+        self.url = f'/api/cameras/{self.camera.id}/snapshot/'
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(user)['access']}
+
+    def test_unchanged_frame_revalidates_without_queries(self):
+        headers = self.bearer(self.admin)
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+
+    def test_resized_variants_are_cached(self):
+        from PIL import Image
+        headers = self.bearer(self.admin)
+        response = self.client.get(self.url + '?width=160', **headers)
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (160, 90))
+        hits = snapshot_variants.hits
+        self.client.get(self.url + '?width=160', **headers)
+        self.assertEqual(snapshot_variants.hits, hits + 1)
+        self.assertEqual(self.client.get(self.url + '?width=huge', **headers).status_code, 400)
+
+    def test_viewers_need_permission(self):
+        self.assertEqual(self.client.get(self.url, **self.bearer(self.viewer)).status_code, 404)
+        CameraPermission.objects.create(user=self.viewer, camera=self.camera, can_view=True)
+        self.assertEqual(self.client.get(self.url, **self.bearer(self.viewer)).status_code, 200)
+
+    def test_camera_without_recent_frame(self):
+        latest_frames.discard(self.camera.id)
+        self.assertEqual(self.client.get(self.url, **self.bearer(self.admin)).status_code, 404)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CCTV_PROCESS_ROLE='web')
+class MjpegStreamTest(TransactionTestCase):
+    async def test_viewers_share_one_feed_starting_from_the_latest_frame(self):
+        camera_id = await database_sync_to_async(self.create_camera)()
+        latest_frames.put(LatestFrame(camera_id, 1, time.time(), b'first', '', []), share=False)
+        self.addCleanup(latest_frames.discard, camera_id)
+        group_name = camera_group_name(camera_id)
+        viewers = [mjpeg_stream(group_name, camera_id), mjpeg_stream(group_name, camera_id)]
+        for viewer in viewers:
+            self.assertEqual(await asyncio.wait_for(viewer.__anext__(), 1), mjpeg_part(b'first'))
+        self.assertEqual(len(feeds.feeds), 1)
+        self.assertEqual(feeds.feeds[group_name].viewers, 2)
+
+        await get_channel_layer().group_send(group_name, {
+            'type': 'stream.frame', 'frame': base64.b64encode(b'second').decode(), 'ts': time.time()})
+        for viewer in viewers:
+            part = await asyncio.wait_for(viewer.__anext__(), 1)
+            self.assertTrue(part.startswith(b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: 6\r\n'))
+            self.assertIn(b'second', part)
+            await viewer.aclose()
+        self.assertEqual(feeds.feeds, {})
+
+    async def test_view_requires_token_and_permission(self):
+        camera_id = await database_sync_to_async(self.create_camera)()
+        viewer = await database_sync_to_async(User.objects.create_user)(
+            email='viewer@example.com', password='secret', role='USER')
+        url = f'/api/cameras/{camera_id}/mjpeg/'
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        token = (await database_sync_to_async(get_tokens_for_user)(viewer))['access']
+        self.assertEqual((await self.async_client.get(f'{url}?token={token}')).status_code, 404)
+
+        response = await mjpeg_view(RequestFactory().get(url, HTTP_AUTHORIZATION=f'Bearer {self.token}'), camera_id)
+        self.assertEqual(response['Content-Type'], 'multipart/x-mixed-replace; boundary=frame')
+        self.assertTrue(response.streaming)
+
+    def create_camera(self):
+        cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.token = get_tokens_for_user(admin)['access']
+        return Camera.objects.create(name='Gate', created_by=admin).id
+
+
+class VideoWallTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.cameras = [Camera.objects.create(name=f'Camera {index}', created_by=self.admin) for index in range(3)]
+        self.wall = VideoWall.objects.create(name='Control room', width=640, height=360, created_by=self.admin)
+        self.wall.cameras.set(self.cameras)
+        for camera in self.cameras:
+            self.addCleanup(latest_frames.discard, camera.id)
+
+    def put_frame(self, camera, seq, color):
+        _, jpeg = cv2.imencode('.jpg', np.full((720, 1280, 3), color, dtype=np.uint8))
+        latest_frames.put(LatestFrame(camera.id, seq, time.time(), jpeg.tobytes(), '', []), share=False)
+
+    def test_grid_is_as_square_as_the_count_allows(self):
+        self.assertEqual(grid(16, 1920, 1080)[5], (480, 270, 480, 270))
+        self.assertEqual(len({(x, y) for x, y, _, _ in grid(5, 1920, 1080)}), 5)
+        self.assertEqual(grid(5, 1920, 1080)[4], (640, 540, 640, 540))
+
+    def test_only_cells_with_new_frames_are_redrawn(self):
+        self.put_frame(self.cameras[0], 1, 200)
+        self.put_frame(self.cameras[1], 1, 50)
+        pipeline = WallPipeline(self.wall.id)
+        self.assertTrue(pipeline.compose(self.cameras, 640, 360))
+        self.assertEqual(pipeline.canvas.size, (640, 360))
+        self.assertAlmostEqual(pipeline.canvas.getpixel((160, 130))[0], 200, delta=4)  # Tile centre, below the label
+        self.assertAlmostEqual(pipeline.canvas.getpixel((480, 130))[0], 50, delta=4)
+
+        misses = snapshot_variants.misses
+        self.assertFalse(pipeline.compose(self.cameras, 640, 360))
+        self.put_frame(self.cameras[1], 2, 120)
+        self.assertTrue(pipeline.compose(self.cameras, 640, 360))
+        self.assertEqual(snapshot_variants.misses, misses + 1)
+        self.assertAlmostEqual(pipeline.canvas.getpixel((480, 130))[0], 120, delta=4)
+
+    def test_viewers_see_walls_of_cameras_they_can_view(self):
+        viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        headers = {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(viewer)['access']}
+        CameraPermission.objects.create(user=viewer, camera=self.cameras[0], can_view=True)
+        self.assertEqual(self.client.get('/api/walls/', **headers).json(), [])
+        self.assertEqual(self.client.get(f'/api/walls/{self.wall.id}/snapshot/', **headers).status_code, 404)
+
+        for camera in self.cameras[1:]:
+            CameraPermission.objects.create(user=viewer, camera=camera, can_view=True)
+        walls = self.client.get('/api/walls/', **headers).json()
+        self.assertEqual([wall['cameras'] for wall in walls], [[camera.id for camera in self.cameras]])
+
+    def test_admins_create_walls(self):
+        headers = {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(self.admin)['access']}
+        response = self.client.post('/api/walls/', {'name': 'Lobby', 'cameras': [self.cameras[0].id], 'fps': 0},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/walls/', {'name': 'Lobby', 'cameras': [self.cameras[0].id], 'fps': 2},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created_by'], self.admin.id)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CCTV_PROCESS_ROLE='web')
+class WallPipelineTest(TransactionTestCase):
+    def test_running_wall_serves_its_mosaic_as_a_snapshot(self):
+        cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        camera = Camera.objects.create(name='Gate', created_by=admin)
+        wall = VideoWall.objects.create(name='Lobby', width=320, height=180, fps=20, created_by=admin)
+        wall.cameras.add(camera)
+        _, jpeg = cv2.imencode('.jpg', np.full((360, 640, 3), 90, dtype=np.uint8))
+        latest_frames.put(LatestFrame(camera.id, 1, time.time(), jpeg.tobytes(), '', []), share=False)
+        self.addCleanup(latest_frames.discard, camera.id)
+
+        pipeline = WallPipeline(wall.id)
+        pipeline.start()
+        try:
+            deadline = time.time() + 5
+            while latest_frames.get(wall_frame_id(wall.id)) is None and time.time() < deadline:
+                time.sleep(0.02)
+            response = self.client.get(f'/api/walls/{wall.id}/snapshot/',
+                                       HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(admin)['access'])
+        finally:
+            pipeline.stop(wait=True)
+        self.assertEqual(response.status_code, 200)
+        mosaic = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(mosaic.shape, (180, 320, 3))
+        self.assertIsNone(latest_frames.get(wall_frame_id(wall.id)))
+
+
+class HlsWriterTest(SimpleTestCase):
+    def test_frames_reach_the_encoder_and_overflow_is_dropped(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            output = os.path.join(media_root, 'stdin')
+            writer = HlsWriter(5, command=['sh', '-c', f'cat > {output}'], maxsize=2)
+            self.assertEqual(writer.output_dir, os.path.join(media_root, 'hls', '5'))
+            writer.start()
+            for _ in range(3):
+                writer.write(b'jpeg')
+            writer.close()
+            self.assertEqual(writer.process.returncode, 0)
+            with open(output, 'rb') as written:
+                self.assertEqual(written.read(), b'jpeg' * (3 - writer.dropped))
+
+    def test_playlist_url_follows_media_url(self):
+        self.assertEqual(hls_playlist_url(5), f'{settings.MEDIA_URL}hls/5/index.m3u8')
+
+
+class PassthroughRecordingTest(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root.name
+
+    def test_command_copies_the_stream_into_segments(self):
+        command = passthrough_command('rtsp://cam/stream', '/recordings/3')
+        self.assertIn('-rtsp_transport', command)
+        self.assertEqual(command[command.index('-c') + 1], 'copy')
+        self.assertEqual(command[-1], '/recordings/3/%Y%m%d-%H%M%S.mp4')
+        self.assertNotIn('-rtsp_transport', passthrough_command('/videos/gate.mp4', '/recordings/3'))
+
+    def test_recorder_restarts_ffmpeg_and_stops_it_on_close(self):
+        recorder = PassthroughRecorder(3, 'rtsp://cam/stream', command=['sh', '-c', 'exit 1'])
+        recorder.restart_interval = 0
+        recorder.start()
+        recorder.process.wait()
+        recorder.command = ['sleep', '30']
+        recorder.check()
+        self.assertEqual(recorder.restarts, 1)
+        self.assertIsNone(recorder.process.poll())
+        recorder.close()
+        self.assertIsNotNone(recorder.process.poll())
+
+    def test_annotations_are_written_beside_the_segments(self):
+        log = AnnotationLog(3)
+        ts = time.time()
+        log.write(ts, [])
+        log.write(ts, [['person', 0.91, 1, 2, 3, 4]])
+        log.close()
+        [name] = os.listdir(os.path.join(self.media_root, 'recordings', '3'))
+        self.assertEqual(name, time.strftime('annotations-%Y%m%d-%H.jsonl', time.localtime(ts)))
+        with open(os.path.join(self.media_root, 'recordings', '3', name)) as annotations:
+            [line] = annotations.read().splitlines()
+        self.assertEqual(json.loads(line)['detections'], [['person', 0.91, 1, 2, 3, 4]])
+
+    def test_local_devices_fall_back_to_annotated_recording(self):
+        pipeline = CameraPipeline(3)
+        self.assertEqual(pipeline.recording_mode(Camera(source='0', recording_mode='passthrough')), 'annotated')
+        self.assertEqual(pipeline.recording_mode(Camera(source='rtsp://cam', recording_mode='passthrough')),
+                         'passthrough')
+
+
+class EventClipTest(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Gate', created_by=admin)
+        rule = AlertRule.objects.create(name='Person', camera=self.camera, label='person')
+        self.alert = Alert.objects.create(rule=rule, camera=self.camera)
+
+    def test_ring_is_bounded_by_age_and_bytes(self):
+        ring = FrameRing(seconds=5, max_bytes=40)
+        for ts in range(10):
+            ring.add(ts, b'x' * 4)
+        self.assertEqual([ts for ts, _ in ring.frames], [4, 5, 6, 7, 8, 9])
+        ring.add(10, b'x' * 30)
+        self.assertEqual([ts for ts, _ in ring.frames], [8, 9, 10])
+        self.assertEqual(ring.size, 38)
+
+    def test_clip_covers_pre_and_post_roll(self):
+        submitted = []
+        recorder = ClipRecorder(self.camera.id, pre_seconds=5, post_seconds=3, max_bytes=2**20,
+                                writer=MagicMock(submit=submitted.append))
+        for ts in range(1000, 1011):
+            recorder.add(ts, b'jpeg')
+        clip = recorder.trigger(1010, alert=self.alert)
+        self.assertEqual(clip.status, 'recording')
+        self.assertEqual(list(self.alert.clips.all()), [clip])
+        for ts in range(1011, 1015):
+            recorder.add(ts, b'jpeg')
+        [pending] = submitted
+        self.assertEqual([ts for ts, _ in pending.frames], list(range(1005, 1014)))
+        self.assertEqual(recorder.pending, [])
+
+    def test_writer_encodes_the_clip_and_links_the_file(self):
+        clip = EventClip.objects.create(camera=self.camera, alert=self.alert, started_at=timezone.now(),
+                                        triggered_at=timezone.now())
+        _, jpeg = cv2.imencode('.jpg', np.full((120, 160, 3), 100, dtype=np.uint8))
+        frames = [(1000 + index * 0.1, jpeg.tobytes()) for index in range(20)]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            ClipWriter().write(PendingClip(clip.id, self.camera.id, frames, 1002))
+            clip.refresh_from_db()
+            self.assertEqual(clip.status, 'ready')
+            self.assertEqual(clip.frames, 20)
+            capture = cv2.VideoCapture(os.path.join(media_root, clip.file.name))
+            self.assertEqual(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 20)
+            capture.release()
+
+
+class FailingBackend(StubBackend):
+    """Fails on the given call, like a process dying mid-file."""
+
+    def __init__(self, fail_on):
+        super().__init__()
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def detect_batch(self, frames):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("worker died")
+        return super().detect_batch(frames)
+
+
+class BatchAnalysisTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, CCTV_ANALYSIS_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.camera = Camera.objects.create(name='Gate', created_by=self.admin)
+        footage = os.path.join(media_root.name, 'footage')
+        os.makedirs(footage)
+        self.video = os.path.join(footage, '20261019-080000.mp4')
+        capture = SyntheticCapture(320, 240, frames=30, seed=1)
+        writer = cv2.VideoWriter(self.video, cv2.VideoWriter_fourcc(*'mp4v'), 10.0, (320, 240))
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            writer.write(frame)
+        writer.release()
+
+    def test_job_indexes_every_strided_frame_in_bulk(self):
+        job = create_job(self.camera, os.path.dirname(self.video), self.admin.id, stride=3, batch_size=4)
+        with self.assertNumQueries(37):  # Claim, open and finish the file; one transaction per batch
+            BatchAnalyzer(job, StubBackend()).run()
+        analysis_file = job.files.get()
+        self.assertEqual((analysis_file.status, analysis_file.frames_done, analysis_file.next_frame), ('done', 10, 28))
+        frames = DetectedFrame.objects.filter(camera=self.camera).order_by('timestamp')
+        self.assertEqual(frames.count(), 10)
+        self.assertEqual(timezone.localtime(frames[1].timestamp).strftime('%H:%M:%S.%f'), '08:00:00.300000')
+        hour = DetectionRollup.objects.get(period='hour', label='person')
+        self.assertEqual((hour.frames, hour.total), (10, analysis_file.detections))
+
+    def test_crashed_job_resumes_without_duplicates(self):
+        job = create_job(self.camera, self.video, self.admin.id, stride=3, batch_size=4)
+        BatchAnalyzer(job, FailingBackend(fail_on=2)).run()
+        self.assertEqual(DetectedFrame.objects.count(), 4)  # The first batch was committed
+        job.files.update(status='running')  # As a killed process leaves it
+
+        call_command('analyze_footage', '--job', str(job.id), '--detector', 'stub', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(DetectedFrame.objects.count(), 10)
+
+    def test_command_rejects_bad_stride_and_batch_size_before_creating_a_job(self):
+        for option, value in (('--stride', '0'), ('--batch-size', '-1'), ('--batch-size', '65')):
+            with self.assertRaises(CommandError):
+                call_command('analyze_footage', self.video, '--camera', str(self.camera.id), option, value,
+                             stdout=StringIO())
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_unreadable_footage_fails_the_job(self):
+        broken = os.path.join(os.path.dirname(self.video), 'broken.mp4')
+        with open(broken, 'wb') as video:
+            video.write(b'not a video')
+        job = create_job(self.camera, broken, self.admin.id)
+        call_command('analyze_footage', '--job', str(job.id), '--detector', 'stub', stdout=StringIO())
+        job.refresh_from_db()
+        analysis_file = job.files.get()
+        self.assertEqual((job.status, analysis_file.status), ('failed', 'failed'))
+        self.assertIn('broken.mp4', analysis_file.error)
+
+    def test_api_starts_jobs_inside_the_analysis_root(self):
+        headers = {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(self.admin)['access']}
+        with patch('api.views.launch_job') as launch:
+            response = self.client.post('/api/analysis-jobs/', {'camera': self.camera.id, 'path': 'footage'},
+                                        content_type='application/json', **headers)
+            self.assertEqual(response.status_code, 201)
+            launch.assert_called_once()
+            self.assertEqual(response.json()['progress']['files']['pending'], 1)
+            outside = self.client.post('/api/analysis-jobs/', {'camera': self.camera.id, 'path': '../'},
+                                       content_type='application/json', **headers)
+            self.assertEqual(outside.status_code, 400)
+        job_id = response.json()['id']
+        cancelled = self.client.post(f'/api/analysis-jobs/{job_id}/cancel/', **headers)
+        self.assertEqual(cancelled.json()['status'], 'cancelled')
+        self.assertEqual(AnalysisJob.objects.get(id=job_id).status, 'cancelled')
+
+
+class DetectionRollupTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='root@example.com', password='secret', role='SUPER_ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.gate = Camera.objects.create(name='Gate', created_by=self.admin)
+        self.yard = Camera.objects.create(name='Yard', created_by=self.admin)
+        CameraPermission.objects.create(user=self.viewer, camera=self.gate, can_view=True)
+        self.at = lambda minute, second: datetime(2026, 10, 19, 8, minute, second, tzinfo=dt_timezone.utc)
+        self.frames = [
+            (self.gate, self.at(0, 10), [('person', 0.9), ('person', 0.8)]),
+            (self.gate, self.at(0, 40), [('person', 0.9), ('car', 0.7)]),
+            (self.gate, self.at(1, 5), [('person', 0.9)] * 3),
+            (self.yard, self.at(0, 20), [('dog', 0.6)]),
+        ]
+
+    def rollups(self):
+        return {(rollup.camera_id, rollup.period, rollup.start.minute, rollup.label):
+                (rollup.frames, rollup.total, rollup.min_count, rollup.max_count)
+                for rollup in DetectionRollup.objects.all()}
+
+    def expected(self):
+        return {
+            (self.gate.id, 'minute', 0, 'person'): (2, 3, 1, 2),
+            (self.gate.id, 'minute', 0, 'car'): (1, 1, 1, 1),
+            (self.gate.id, 'minute', 1, 'person'): (1, 3, 3, 3),
+            (self.gate.id, 'hour', 0, 'person'): (3, 6, 1, 3),
+            (self.gate.id, 'hour', 0, 'car'): (1, 1, 1, 1),
+            (self.yard.id, 'minute', 0, 'dog'): (1, 1, 1, 1),
+            (self.yard.id, 'hour', 0, 'dog'): (1, 1, 1, 1),
+        }
+
+    def test_flushes_merge_into_existing_rollups(self):
+        buffer = RollupBuffer(flush_interval=0)
+        for camera, ts, detections in self.frames:
+            buffer.add(camera.id, ts, label_counts(detections))
+            buffer.flush()  # Every frame merged on its own, as across many pipeline flushes
+        self.assertEqual(self.rollups(), self.expected())
+
+    def test_backfill_matches_incremental_rollups_and_can_be_rerun(self):
+        for camera, ts, detections in self.frames:
+            DetectedFrame.objects.create(camera=camera, frame_image='frame.jpg', timestamp=ts,
+                                         detection_result=detection_result(detections))
+        for _ in range(2):
+            call_command('rollup_detections', stdout=StringIO())
+            self.assertEqual(self.rollups(), self.expected())
+
+    def test_api_reads_rollups_of_viewable_cameras(self):
+        buffer = RollupBuffer()
+        for camera, ts, detections in self.frames:
+            buffer.add(camera.id, ts, label_counts(detections))
+        buffer.flush()
+        headers = {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(self.viewer)['access']}
+        query = {'since': '2026-10-19T00:00:00Z', 'until': '2026-10-20T00:00:00Z'}
+
+        response = self.client.get('/api/detections/rollups/', query | {'label': 'person'}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['camera'], row['frames'], row['total'], row['min'], row['max'], row['average'])
+                          for row in response.json()['results']], [(self.gate.id, 3, 6, 1, 3, 2.0)])
+        daily = self.client.get('/api/detections/rollups/', query | {'period': 'day'}, **headers).json()
+        self.assertEqual(sorted((row['label'], row['total']) for row in daily['results']), [('car', 1), ('person', 6)])
+        self.assertEqual(self.client.get('/api/detections/rollups/', {'period': 'week'}, **headers).status_code, 400)
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.gate = Camera.objects.create(name='Gate', created_by=admin)
+        CameraPermission.objects.create(user=self.viewer, camera=self.gate, can_view=True)
+        self.token = str(RefreshToken.for_user(self.viewer).access_token)
+
+    def test_repeated_handshakes_skip_the_database(self):
+        user = async_to_sync(authenticate_token)(self.token)
+        self.assertEqual(user.id, self.viewer.id)
+        hits = token_cache.hits
+        with self.assertNumQueries(0):
+            for _ in range(64):
+                user = async_to_sync(authenticate_token)(self.token)
+                self.assertTrue(get_camera_acl(user).can_view(self.gate.id))
+        self.assertEqual(token_cache.hits, hits + 64)
+
+    def test_user_change_invalidates_cached_tokens(self):
+        async_to_sync(authenticate_token)(self.token)
+        self.viewer.is_active = False
+        self.viewer.save()
+        self.assertIsNone(async_to_sync(authenticate_token)(self.token))
+
+    def test_invalid_token_is_rejected(self):
+        self.assertIsNone(async_to_sync(authenticate_token)('not-a-token'))
+
+    def test_cache_is_bounded_and_expires(self):
+        bounded = TokenCache(maxsize=2, ttl=60)
+        for index in range(3):
+            bounded.set(f'token-{index}', self.viewer, time.time() + 60)
+        self.assertIsNone(bounded.get('token-0'))
+        self.assertEqual(bounded.stats()['evictions'], 1)
+        bounded.set('expired', self.viewer, time.time() - 1)
+        self.assertIsNone(bounded.get('expired'))
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', role='ADMIN')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', role='USER')
+        self.gate = Camera.objects.create(name='Gate', created_by=self.admin)
+        CameraPermission.objects.create(user=self.viewer, camera=self.gate, can_view=True)
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': 'Bearer ' + get_tokens_for_user(user)['access']}
+
+    def test_token_carries_role_but_not_camera_permissions(self):
+        token = AccessToken(get_tokens_for_user(self.viewer)['access'])
+        self.assertEqual(token['role'], 'USER')
+        self.assertNotIn('cameras', token)  # Permissions change; the ACL cache is the only source
+
+    def test_authenticated_list_only_queries_cameras(self):
+        headers = self.bearer(self.viewer)
+        self.client.get('/api/cameras/', **headers)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cameras/', **headers)
+        self.assertEqual([camera['id'] for camera in response.json()], [self.gate.id])
+
+    def test_admin_creates_camera_with_token_user(self):
+        response = self.client.post('/api/cameras/', {'name': 'Lobby'}, **self.bearer(self.admin))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Camera.objects.get(name='Lobby').created_by, self.admin)
+
+    def test_basic_auth_is_no_longer_accepted(self):
+        credentials = base64.b64encode(b'viewer@example.com:secret').decode()
+        response = self.client.get('/api/cameras/', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, 401)
+
 
-        # Verify cleanup
-        self.assertTrue(mock_writer.release.called, "Video writer release method was not called")
-        self.assertTrue(mock_cap.release.called, "Video capture release method was not called")
+class LazyImportTest(SimpleTestCase):
+    def test_asgi_does_not_load_ml_stack(self):
+        # A fresh interpreter, since this test module itself imports cv2
+        probe = ("import os, sys; os.environ['CCTV_PROCESS_ROLE'] = 'web'; import cctv.asgi; "
+                 "print(','.join(name for name in ('torch', 'cv2', 'ultralytics') if name in sys.modules))")
+        completed = subprocess.run([sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                                   capture_output=True, text=True, check=True)
+        self.assertEqual(completed.stdout.strip(), '')
 
-    # Additional assertions
-    self.assertGreater(mock_writer.write.call_count, 0, "No frames were written")
-    self.assertEqual(mock_cap.release.call_count, 1, "Video capture release should be called once")
-    self.assertEqual(mock_writer.release.call_count, 1, "Video writer release should be called once")
\ No newline at end of file
+    def test_web_processes_compose_walls_without_the_ml_stack(self):
+        probe = ("import os, sys; os.environ['CCTV_PROCESS_ROLE'] = 'web'; import cctv.asgi; "
+                 "from api.mosaic import WallPipeline; WallPipeline(1).compose([], 320, 180); "
+                 "print(','.join(name for name in ('torch', 'cv2', 'ultralytics') if name in sys.modules))")
+        completed = subprocess.run([sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                                   capture_output=True, text=True, check=True)
+        self.assertEqual(completed.stdout.strip(), '')
@@ -0,0 +1,94 @@
+import logging
+import os
+import sys
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpu_list(value):
+    """Parse a Linux-style CPU list such as "0-3,8" into a set of core ids."""
+    cores = set()
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        start, _, end = part.partition('-')
+        cores.update(range(int(start), int(end or start) + 1))
+    return cores
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ThreadBudget:
+    """Splits a core budget between the pipelines running in this process.
+
+    torch and OpenCV each size their pools to every core, so N pipelines
+    would run N times as many compute threads as there are cores. Instead
+    each pipeline gets an equal share of the budget, rebalanced as
+    pipelines start and stop. The pool sizes are process-wide and are only
+    set on libraries that are already imported. ONNX Runtime sessions take
+    their share when they are created.
+    """
+
+    def __init__(self, cores=None, enabled=None):
+        self.fixed_cores = cores
+        self.enabled = settings.CCTV_THREAD_BUDGETING if enabled is None else enabled
+        self.lock = threading.Lock()
+        self.pipelines = 0
+
+    @property
+    def cores(self):
+        # Read live so pinning the process later shrinks the budget with it
+        return self.fixed_cores or settings.CCTV_THREAD_BUDGET or available_cores()
+
+    @property
+    def per_pipeline(self):
+        return max(1, int(self.cores // max(self.pipelines, 1)))
+
+    def acquire(self):
+        with self.lock:
+            self.pipelines += 1
+            self.apply()
+
+    def release(self):
+        with self.lock:
+            self.pipelines = max(0, self.pipelines - 1)
+            self.apply()
+
+    def apply(self):
+        if not self.enabled:
+            return
+        threads = self.per_pipeline
+        if 'torch' in sys.modules:
+            sys.modules['torch'].set_num_threads(threads)
+        if 'cv2' in sys.modules:
+            sys.modules['cv2'].setNumThreads(threads)
+        logger.debug(f"Thread budget: {threads} threads for each of {self.pipelines} pipelines")
+
+    def session_options(self):
+        """ONNX Runtime options sized to one pipeline's share of the budget."""
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if self.enabled:
+            options.intra_op_num_threads = self.per_pipeline
+            options.inter_op_num_threads = 1
+            # Idle pool threads would otherwise spin and steal cycles from other pipelines
+            options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        return options
+
+
+def pin_process(cpu_list=None):
+    """Restrict this process to CCTV_CPU_AFFINITY cores, when set."""
+    cpu_list = cpu_list if cpu_list is not None else settings.CCTV_CPU_AFFINITY
+    if not cpu_list or not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = parse_cpu_list(cpu_list)
+    os.sched_setaffinity(0, cores)
+    logger.info(f"Pinned process {os.getpid()} to cores {sorted(cores)}")
+    return cores
+
+
+thread_budget = ThreadBudget()
@@ -0,0 +1,169 @@
+import logging
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Width frames are downscaled to for optical flow; boxes are tracked in this space.
+TRACK_WIDTH = 320
+POINTS_PER_BOX = 20
+# Forward-backward error, in tracking pixels, above which a flow point is discarded.
+MAX_FLOW_ERROR = 1.0
+# Share of a box's points that must survive for the box to be kept.
+MIN_TRACKED_RATIO = 0.5
+# Share of the last detection's boxes still tracked below which the detector runs early.
+RESYNC_CONFIDENCE = 0.6
+# Mean absolute difference of grey thumbnails, from 0 to 1, that counts as a scene change.
+SCENE_CHANGE_THRESHOLD = 0.12
+THUMBNAIL_SIZE = (32, 18)
+
+
+class BoxTracker:
+    """Propagates detection boxes between detector runs with Lucas-Kanade optical flow.
+
+    Each box is followed through a few corner points inside it: the median
+    point motion moves the box and the median change in spread scales it.
+    Boxes whose points are mostly lost are dropped.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.tracks = []  # [detection row in tracking pixels, points array]
+        self.initial = 0
+
+    @property
+    def confidence(self):
+        return len(self.tracks) / self.initial if self.initial else 1.0
+
+    def reset(self, gray, detections, scale):
+        import cv2
+        self.previous = gray
+        self.tracks = []
+        height, width = gray.shape
+        for label, confidence, *box in detections:
+            x1, y1, x2, y2 = (int(round(value * scale)) for value in box)
+            x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, width - 1), min(y2, height - 1)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            mask = np.zeros_like(gray)
+            mask[y1:y2, x1:x2] = 255
+            points = cv2.goodFeaturesToTrack(gray, POINTS_PER_BOX, 0.01, 3, mask=mask)
+            if points is None or len(points) < 4:
+                # Flat regions have no corners; follow a grid instead
+                xs, ys = np.meshgrid(np.linspace(x1, x2, 4), np.linspace(y1, y2, 4))
+                points = np.stack([xs.ravel(), ys.ravel()], axis=1)
+            self.tracks.append([[label, confidence, x1, y1, x2, y2], points.reshape(-1, 2).astype(np.float32)])
+        self.initial = len(self.tracks)
+
+    def update(self, gray):
+        """Move every box to the new frame; return the boxes still tracked, in tracking pixels."""
+        import cv2
+        previous, self.previous = self.previous, gray
+        if not self.tracks:
+            return []
+
+        points = np.concatenate([track[1] for track in self.tracks]).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, gray, points, None)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, previous, moved, None)
+        error = np.linalg.norm(points - back, axis=2).ravel()
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < MAX_FLOW_ERROR)
+        moved = moved.reshape(-1, 2)
+
+        tracks, start = [], 0
+        for row, old_points in self.tracks:
+            end = start + len(old_points)
+            keep, new = good[start:end], moved[start:end]
+            start = end
+            if keep.sum() < max(2, MIN_TRACKED_RATIO * len(old_points)):
+                continue
+            old, new = old_points[keep], new[keep]
+            shift = np.median(new - old, axis=0)
+            old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = old_spread > 1e-3
+            ratio = float(np.clip(np.median(new_spread[valid] / old_spread[valid]), 0.8, 1.25)) if valid.any() else 1.0
+
+            x1, y1, x2, y2 = row[2:]
+            center_x, center_y = (x1 + x2) / 2 + shift[0], (y1 + y2) / 2 + shift[1]
+            half_width, half_height = (x2 - x1) * ratio / 2, (y2 - y1) * ratio / 2
+            row = [row[0], row[1], center_x - half_width, center_y - half_height,
+                   center_x + half_width, center_y + half_height]
+            tracks.append([row, new])
+        self.tracks = tracks
+        return [track[0] for track in tracks]
+
+
+class DetectionScheduler:
+    """Runs the detector every ``interval`` frames and tracks boxes in between.
+
+    The detector also runs early when the scene changes or when too many of
+    its boxes have been lost by the tracker, so tracking never drifts far
+    from what the detector would report. With an interval of 1 every frame
+    is detected, as before.
+    """
+
+    def __init__(self, backend, interval=1):
+        self.backend = backend
+        self.name = backend.name
+        self.interval = max(1, interval)
+        self.tracker = BoxTracker()
+        self.keyframe = None
+        self.since_detection = 0
+        self.frames = 0
+        self.detector_runs = 0
+        self.resyncs = 0
+        self.detected = False  # Whether the last frame went through the detector
+        self.inference_seconds = 0.0  # Detector time within the last call
+
+    def detect(self, frame):
+        self.frames += 1
+        self.detected = False
+        self.inference_seconds = 0.0
+        if self.interval == 1:
+            return self.run_detector(frame)
+
+        import cv2
+        scale = TRACK_WIDTH / frame.shape[1]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (TRACK_WIDTH, int(round(frame.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        if self.keyframe is not None and self.since_detection < self.interval:
+            if np.abs(thumbnail - self.keyframe).mean() / 255 < SCENE_CHANGE_THRESHOLD:
+                boxes = self.tracker.update(gray)
+                if self.tracker.confidence >= RESYNC_CONFIDENCE:
+                    self.since_detection += 1
+                    return self.to_frame(boxes, scale, frame.shape)
+            self.resyncs += 1
+            logger.debug(f"Resyncing {self.name} detector after {self.since_detection} tracked frames")
+
+        detections = self.run_detector(frame)
+        self.tracker.reset(gray, detections, scale)
+        self.keyframe = thumbnail
+        self.since_detection = 1
+        return detections
+
+    def run_detector(self, frame):
+        started = time.perf_counter()
+        detections = self.backend.detect(frame)
+        self.inference_seconds = time.perf_counter() - started
+        self.detector_runs += 1
+        self.detected = True
+        return detections
+
+    def to_frame(self, boxes, scale, shape):
+        height, width = shape[:2]
+        detections = []
+        for label, confidence, x1, y1, x2, y2 in boxes:
+            detections.append([label, confidence,
+                               int(np.clip(x1 / scale, 0, width)), int(np.clip(y1 / scale, 0, height)),
+                               int(np.clip(x2 / scale, 0, width)), int(np.clip(y2 / scale, 0, height))])
+        return detections
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'detector_runs': self.detector_runs,
+            'resyncs': self.resyncs,
+            'inference_ratio': round(self.detector_runs / self.frames, 3) if self.frames else 0.0,
+        }
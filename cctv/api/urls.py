@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views, consumer
+from . import views
 from django.conf.urls.static import static 
 from django.conf import settings
 
@@ -8,6 +8,9 @@ from django.conf import settings
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
 router.register(r'cameras', views.CameraViewSet)
+router.register(r'walls', views.VideoWallViewSet)
+router.register(r'clips', views.EventClipViewSet)
+router.register(r'analysis-jobs', views.AnalysisJobViewSet)
 from .views import (
     
     UserLoginView,
@@ -15,10 +18,16 @@ from .views import (
     ChangeUserPasswordView,
     SendPasswordResetEmailView,
     UserPasswordResetView,
+    TokenCacheStatsView,
+    GovernorView,
+    MetricsView,
+    DetectionRollupView,
     
 )
 
 urlpatterns = [
+    path('cameras/<int:camera_id>/mjpeg/', views.mjpeg_view, name='camera-mjpeg'),
+    path('walls/<int:wall_id>/mjpeg/', views.wall_mjpeg_view, name='wall-mjpeg'),
     path('', include(router.urls)),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('home/', views.home, name='home'),  # Correct mapping for the home view
@@ -26,6 +35,10 @@ urlpatterns = [
     path('changepassword/', ChangeUserPasswordView.as_view(), name='changepassword'),
     path('send-password-reset-email/', SendPasswordResetEmailView.as_view(), name='send-password-reset-email'),
     path('user/reset-password/<str:uidb64>/<str:token>/', UserPasswordResetView.as_view(), name='password_reset'),
+    path('stats/token-cache/', TokenCacheStatsView.as_view(), name='token-cache-stats'),
+    path('stats/governor/', GovernorView.as_view(), name='governor-stats'),
+    path('stats/metrics/', MetricsView.as_view(), name='metrics-stats'),
+    path('detections/rollups/', DetectionRollupView.as_view(), name='detection-rollups'),
     
 
 
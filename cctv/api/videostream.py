@@ -1,18 +1,17 @@
-import cv2
 import threading
 import logging
-from ultralytics import YOLO
 import os
 from django.conf import settings
+from .logqueue import camera_logger
+from .pipeline import load_model, open_capture
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class VideoStream:
     def __init__(self, video_source=0, output_path=None):
         logger.info(f"Initializing VideoStream with source {video_source}")
-        self.video = cv2.VideoCapture(video_source)
+        self.log = camera_logger(logger, video_source)  # Sampled per-frame lines
+        self.video = open_capture(video_source)
         
         if not self.video.isOpened():
             logger.error(f"Unable to open video source: {video_source}")
@@ -26,7 +25,7 @@ class VideoStream:
         
         # Initialize YOLO model
         logger.info("Loading YOLO model")
-        self.model = YOLO('yolov8s.pt')
+        self.model = load_model()
         
         threading.Thread(target=self.update, args=()).start()
         logger.debug("VideoStream thread started")
@@ -43,9 +42,9 @@ class VideoStream:
     def get_frame(self):
         with self.lock:
             if self.frame is not None:
-                logger.debug("Returning current frame")
+                self.log.debug("Returning current frame")
                 return self.frame
-            logger.warning("No frame available")
+            self.log.warning("No frame available")
             return None
 
     def update(self):
@@ -57,32 +56,33 @@ class VideoStream:
                 self.running = False
                 break
             
-            logger.debug("Frame read successfully")
+            self.log.debug("Frame read successfully")
 
             # Perform object detection
-            logger.info("Performing object detection")
+            self.log.debug("Performing object detection")
             results = self.model(frame)
             
             # Draw bounding boxes on the frame
             for r in results:
                 annotated_frame = r.plot()
-                logger.debug("Object detection complete, frame annotated")
+                self.log.debug("Object detection complete, frame annotated")
             
             with self.lock:
                 self.frame = annotated_frame
-                logger.debug("Frame updated in memory")
+                self.log.debug("Frame updated in memory")
             
             # Write frame to video file if output path is specified
             if self.output_path:
                 if self.writer is None:
                     logger.info(f"Initializing video writer with output path: {self.output_path}")
+                    import cv2
                     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
                     self.writer = cv2.VideoWriter(self.output_path, fourcc, 20.0, 
                                                   (self.frame.shape[1], self.frame.shape[0]))
                     logger.debug("Video writer initialized")
                 
                 self.writer.write(self.frame)
-                logger.debug("Frame written to video file")
+                self.log.debug("Frame written to video file")
         
         logger.info("VideoStream update loop ended")
         if self.writer:
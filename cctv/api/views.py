@@ -1,30 +1,43 @@
-from rest_framework import viewsets, permissions, status, generics
+from rest_framework import viewsets, permissions, status, generics, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 from django.shortcuts import render
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.contrib.auth import authenticate
 import logging
-from .models import User, Camera, CameraPermission
+from datetime import timedelta
+from django.utils import timezone
+from .models import User, Camera, CameraPermission, EventClip, VideoWall, AnalysisJob, DetectionRollup
 from .serializers import (
     UserSerializer, CameraSerializer, 
     CameraPermissionSerializer, UserLoginSerializer, 
     ChangeUserPasswordSerializer, SendPasswordResetEmailSerializer, 
-    UserPasswordResetSerializer
+    UserPasswordResetSerializer, VideoWallSerializer, EventClipSerializer, AnalysisJobSerializer,
+    RollupQuerySerializer
 )
-from .premissions import IsSuperAdmin, IsAdmin, CanViewCamera, CanEditCamera
-from rest_framework_simplejwt.tokens import RefreshToken
+from .premissions import IsSuperAdmin, IsAdmin, CanViewCamera, CanEditCamera, CanViewWall
+from .acl import can_view_wall, get_camera_acl
+from .jwtMiddleware import authenticate_token, token_cache
+from .governor import governor_snapshots
+from .metrics import metrics, metrics_cache_key, scrape_authorized
+from .framecache import latest_frames, snapshot_variants
+from .livestream import BOUNDARY, mjpeg_stream
+from .mosaic import wall_frame_id, wall_group_name, walls
+from .pipeline import camera_group_name, registry
+from .leases import live_workers
+from .authentication import get_tokens_for_user, get_db_user
+from .batch import launch_job
+from .rollups import rollup_series
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
-    return {
-        'refresh': str(refresh),
-        'access': str(refresh.access_token),
-    }
-
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -78,10 +91,30 @@ class CameraViewSet(viewsets.ModelViewSet):
 
         if user.role == 'SUPER_ADMIN':
             return Camera.objects.all()
-        elif user.role == 'ADMIN':
-            return Camera.objects.filter(created_by=user)
+
+        # Filter by cached camera ids instead of joining through camerapermission
+        acl = get_camera_acl(user)
+        if user.role == 'ADMIN':
+            return Camera.objects.filter(id__in=acl.editable)
         else:
-            return Camera.objects.filter(camerapermission__user=user, camerapermission__can_view=True)
+            return Camera.objects.filter(id__in=acl.viewable)
+
+    @action(detail=True, methods=['get'])
+    def snapshot(self, request, pk=None):
+        """The camera's latest frame as a JPEG, optionally scaled to ``?width=`` and/or ``?height=``.
+
+        Served from memory without touching the database; clients revalidate
+        with If-None-Match and get a 304 until the next frame.
+        """
+        try:
+            camera_id = int(pk)
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        # Same rule as CanViewCamera, from the cached ACL instead of the camera row
+        if not get_camera_acl(request.user).can_view(camera_id):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return snapshot_response(request, camera_id)
 
     @action(detail=True, methods=['post'])
     def set_permissions(self, request, pk=None):
@@ -95,7 +128,152 @@ class CameraViewSet(viewsets.ModelViewSet):
             logger.warning(f"Failed to set camera permissions for camera ID: {camera.id}")
             return Response(serializer.errors, status=400)
 
+class VideoWallViewSet(viewsets.ModelViewSet):
+    queryset = VideoWall.objects.all()
+    serializer_class = VideoWallSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_permissions(self):
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return [permissions.IsAuthenticated(), IsAdmin()]
+        elif self.action in ['retrieve', 'list']:
+            return [permissions.IsAuthenticated(), CanViewWall()]
+        return [permissions.IsAuthenticated()]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.role in ['SUPER_ADMIN', 'ADMIN']:
+            return VideoWall.objects.all()
+        # Walls showing any camera the user may not view are hidden entirely
+        acl = get_camera_acl(user)
+        return VideoWall.objects.exclude(cameras__in=Camera.objects.exclude(id__in=acl.viewable)).distinct()
+
+    @action(detail=True, methods=['get'])
+    def snapshot(self, request, pk=None):
+        """The wall's latest mosaic as a JPEG while it is being composed; same options as camera snapshots."""
+        try:
+            wall_id = int(pk)
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not can_view_wall(request.user, wall_id):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return snapshot_response(request, wall_frame_id(wall_id))
+
+
+class EventClipViewSet(viewsets.ReadOnlyModelViewSet):
+    """Alert clips of the cameras the user may view, newest first; filter with ?camera= or ?alert=."""
+    queryset = EventClip.objects.all()
+    serializer_class = EventClipSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        clips = EventClip.objects.filter(camera_id__in=get_camera_acl(self.request.user).viewable)
+        for name in ('camera', 'alert'):
+            value = self.request.query_params.get(name)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({name: 'Must be an id.'})
+                clips = clips.filter(**{f'{name}_id': int(value)})
+        return clips.order_by('-triggered_at')
+
+
+class AnalysisJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                         viewsets.GenericViewSet):
+    """Offline detection jobs over recorded footage; each runs in its own analyze_footage process."""
+    queryset = AnalysisJob.objects.all()
+    serializer_class = AnalysisJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get_queryset(self):
+        return AnalysisJob.objects.filter(camera_id__in=get_camera_acl(self.request.user).editable).order_by('-id')
+
+    def perform_create(self, serializer):
+        job = serializer.save()
+        launch_job(job)
+        logger.info(f"Started analysis job {job.id} over {job.path}")
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Continue a stopped, failed or crashed job from its last committed batch.
+
+        A job still marked running is only resumed with ``{"force": true}``,
+        for when its process died; resuming a live job would analyse files twice.
+        """
+        job = self.get_object()
+        if job.status == 'running' and request.data.get('force') is not True:
+            return Response({'detail': 'Job is running; pass "force": true if its process died.'},
+                            status=status.HTTP_409_CONFLICT)
+        job.status = 'queued'
+        job.save(update_fields=['status'])
+        launch_job(job)
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Stop the job after the batch each process is working on."""
+        job = self.get_object()
+        if job.status in ['queued', 'running']:
+            job.status = 'cancelled'
+            job.save(update_fields=['status'])
+        return Response(self.get_serializer(job).data)
+
+
+class DetectionRollupView(APIView):
+    """Per-camera, per-class detection counts by minute, hour or day, from rollups rather than raw frames.
+
+    Filter with ?camera=, ?label=, ?since= and ?until=; without since, the
+    last ROLLUP_RANGES of the period is returned.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    ROLLUP_RANGES = {'minute': timedelta(days=1), 'hour': timedelta(days=31), 'day': timedelta(days=366)}
+
+    def get(self, request):
+        query = RollupQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        period = params['period']
+        until = params.get('until') or timezone.now()
+        since = params.get('since') or until - self.ROLLUP_RANGES[period]
+
+        rollups = DetectionRollup.objects.filter(
+            camera_id__in=get_camera_acl(request.user).viewable, start__gte=since, start__lt=until)
+        if 'camera' in params:
+            rollups = rollups.filter(camera_id=params['camera'])
+        if 'label' in params:
+            rollups = rollups.filter(label=params['label'])
+        return Response({'period': period, 'since': since, 'until': until,
+                         'results': rollup_series(rollups, period)}, status=status.HTTP_200_OK)
+
+
+def snapshot_response(request, frame_id):
+    """Serve a latest frame as a JPEG with validators, so unchanged frames revalidate with a 304."""
+    width, height = (snapshot_dimension(request, name) for name in ('width', 'height'))
+    latest = latest_frames.get(frame_id)
+    if latest is None:
+        return Response({'detail': 'No recent frame for this stream.'}, status=status.HTTP_404_NOT_FOUND)
+
+    etag = f'"{frame_id}-{latest.seq}-{int(latest.ts * 1000)}-{width or 0}x{height or 0}"'
+    last_modified = int(latest.ts)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(snapshot_variants.get(latest, width, height), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def snapshot_dimension(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    if not value.isdigit() or not 16 <= int(value) <= 4096:
+        raise ValidationError({name: 'Must be a whole number of pixels from 16 to 4096.'})
+    return int(value)
+
 from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from asgiref.sync import async_to_sync
 
 
@@ -126,10 +304,12 @@ class ChangeUserPasswordView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        serializer = self.get_serializer(data=request.data, context={"user": request.user})
+        # Token users carry no password; load the row being changed
+        user = get_db_user(request.user)
+        serializer = self.get_serializer(data=request.data, context={"user": user})
         if serializer.is_valid(raise_exception=True):
-            request.user.set_password(serializer.validated_data['new_password'])  # Ensure the password is updated
-            request.user.save()
+            user.set_password(serializer.validated_data['password'])  # Ensure the password is updated
+            user.save()
             return Response({"message": "Password changed successfully"}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -153,6 +333,71 @@ class UserPasswordResetView(generics.CreateAPIView):
             return Response({'message': 'Password reset successful'}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class TokenCacheStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
+
+    def get(self, request):
+        return Response(token_cache.stats(), status=status.HTTP_200_OK)
+
+class GovernorView(APIView):
+    """CPU governor state of every pipeline node: budget, headroom and degraded cameras."""
+    permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
+
+    def get(self, request):
+        nodes = sorted(set(live_workers()) | {settings.CCTV_WORKER_NAME})
+        return Response({'nodes': governor_snapshots(nodes)}, status=status.HTTP_200_OK)
+
+class MetricsView(APIView):
+    """Stage timing percentiles and counters of this process and every pipeline node."""
+    permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
+
+    def get(self, request):
+        nodes = cache.get_many([metrics_cache_key(node) for node in live_workers()])
+        return Response({
+            'local': metrics.snapshot(),
+            'nodes': [nodes[key] for key in sorted(nodes)],
+        }, status=status.HTTP_200_OK)
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires CCTV_METRICS_TOKEN as a bearer token when set."""
+    if not scrape_authorized(request.headers.get('Authorization')):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+async def stream_user(request):
+    """The user of a streaming request, from a bearer header or ``?token=``, since <img> cannot send headers."""
+    token = request.GET.get('token')
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        token = header[len('Bearer '):]
+    return await authenticate_token(token) if token else None
+
+def mjpeg_response(stream):
+    response = StreamingHttpResponse(stream, content_type=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+async def mjpeg_view(request, camera_id):
+    """The camera's live stream as multipart MJPEG, for <img> tags and players without WebSockets."""
+    user = await stream_user(request)
+    if user is None:
+        return HttpResponse(status=401)
+    acl = await database_sync_to_async(get_camera_acl)(user)
+    if not acl.can_view(camera_id):
+        return HttpResponse(status=404)
+    # Stream processes run the pipeline themselves, shared with WebSocket viewers
+    pipelines = registry if settings.CCTV_PROCESS_ROLE == 'stream' else None
+    return mjpeg_response(mjpeg_stream(camera_group_name(camera_id), camera_id, pipelines, camera_id))
+
+async def wall_mjpeg_view(request, wall_id):
+    """A video wall's mosaic as multipart MJPEG; the mosaic is composed in this process while watched."""
+    user = await stream_user(request)
+    if user is None:
+        return HttpResponse(status=401)
+    if not await database_sync_to_async(can_view_wall)(user, wall_id):
+        return HttpResponse(status=404)
+    return mjpeg_response(mjpeg_stream(wall_group_name(wall_id), wall_frame_id(wall_id), walls, wall_id))
+
 def home(request):
     logger.info("Home page accessed.")
     logger.warning("Potential issue: ensure streaming resources are available.")
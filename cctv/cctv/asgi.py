@@ -7,17 +7,31 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cctv.settings')
 django_asgi_app = get_asgi_application()
 
 # Import all other components after Django initialization
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.urls import path
-from api.consumer import VideoStreamConsumer
+from api.consumer import VideoStreamConsumer, DetectionEventConsumer, WallStreamConsumer
 from api.jwtMiddleware import JWTAuthMiddleware
 
+if settings.CCTV_PROCESS_ROLE == 'worker':
+    raise ImproperlyConfigured("Worker processes run 'manage.py run_camera_workers', not the ASGI application")
+if settings.CCTV_PROCESS_ROLE == 'stream':
+    # Stream processes run pipelines themselves; pay the ML imports at startup, not on the first viewer
+    from api.pipeline import preload_ml_stack
+    preload_ml_stack()
+    # HLS outputs have no viewer holding their pipelines
+    from api.holders import HlsHolder
+    HlsHolder().start()
+
 # Define the application
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": JWTAuthMiddleware(
         URLRouter([
             path("ws/stream/<int:camera_id>/", VideoStreamConsumer.as_asgi()),
+            path("ws/wall/<int:wall_id>/", WallStreamConsumer.as_asgi()),
+            path("ws/events/", DetectionEventConsumer.as_asgi()),
         ])
     ),
 })
\ No newline at end of file
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import socket
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -80,6 +81,60 @@ CHANNEL_LAYERS = {
         'BACKEND': 'channels.layers.InMemoryChannelLayer'
     }
 }
+# Camera pipelines: 'local' runs a camera's pipeline inside the process that
+# accepted its first viewer, under a camera lease so stream processes sharing
+# a channel layer never run the same camera twice; 'sharded' leaves pipelines
+# to run_camera_workers processes, assigned by consistent hashing over
+# CCTV_WORKERS, and web nodes only relay frames from the shared channel layer.
+CCTV_PIPELINE_MODE = os.getenv('CCTV_PIPELINE_MODE', 'local')
+CCTV_WORKERS = [name for name in os.getenv('CCTV_WORKERS', '').split(',') if name]
+CCTV_WORKER_NAME = os.getenv('CCTV_WORKER_NAME', socket.gethostname())
+# Which subsystems this process loads: 'web' serves REST and relays frames
+# without ever importing the ML stack, 'stream' also runs camera pipelines
+# in-process, 'worker' only runs pipelines through run_camera_workers.
+CCTV_PROCESS_ROLE = os.getenv('CCTV_PROCESS_ROLE', 'stream' if CCTV_PIPELINE_MODE == 'local' else 'web')
+# Seconds a worker keeps a camera after its last heartbeat; failover takes about this long.
+CCTV_LEASE_TTL = int(os.getenv('CCTV_LEASE_TTL', '10'))
+# WebSocket handshakes reuse a validated token for up to this many seconds
+CCTV_TOKEN_CACHE_SIZE = int(os.getenv('CCTV_TOKEN_CACHE_SIZE', '10000'))
+CCTV_TOKEN_CACHE_TTL = int(os.getenv('CCTV_TOKEN_CACHE_TTL', '60'))
+# Detector weights and where exported ONNX models are kept; see manage.py export_detector
+CCTV_DETECTOR_WEIGHTS = os.getenv('CCTV_DETECTOR_WEIGHTS', 'yolov8s.pt')
+CCTV_MODEL_DIR = os.getenv('CCTV_MODEL_DIR', os.path.join(BASE_DIR, 'models'))
+# Cores pipelines in one process may use before the governor sheds work; defaults to all cores
+CCTV_CPU_BUDGET = float(os.getenv('CCTV_CPU_BUDGET', '0')) or None
+CCTV_GOVERNOR_INTERVAL = float(os.getenv('CCTV_GOVERNOR_INTERVAL', '2'))
+# Cores torch, OpenCV and ONNX Runtime threads are shared out from, split evenly between
+# the pipelines in a process; defaults to the cores the process may run on
+CCTV_THREAD_BUDGET = int(os.getenv('CCTV_THREAD_BUDGET', '0')) or None
+CCTV_THREAD_BUDGETING = os.getenv('CCTV_THREAD_BUDGETING', 'true').lower() == 'true'
+# Optional CPU list such as "0-7" that camera worker processes are pinned to
+CCTV_CPU_AFFINITY = os.getenv('CCTV_CPU_AFFINITY', '')
+# Per-stage timing histograms and counters, served at /metrics and /api/stats/metrics/
+CCTV_METRICS_ENABLED = os.getenv('CCTV_METRICS_ENABLED', 'true').lower() == 'true'
+CCTV_METRICS_TOKEN = os.getenv('CCTV_METRICS_TOKEN', '')  # Bearer token required by /metrics when set
+CCTV_METRICS_PORT = int(os.getenv('CCTV_METRICS_PORT', '0'))  # Port camera workers serve /metrics on
+# New viewers are sent each camera's latest frame if it is younger than this many seconds;
+# camera workers copy it to the shared cache at most every CCTV_LATEST_FRAME_SHARE_INTERVAL
+CCTV_LATEST_FRAME_TTL = float(os.getenv('CCTV_LATEST_FRAME_TTL', '10'))
+CCTV_LATEST_FRAME_SHARE_INTERVAL = float(os.getenv('CCTV_LATEST_FRAME_SHARE_INTERVAL', '0.5'))
+# Resized snapshot JPEGs kept per process for /api/cameras/<id>/snapshot/?width=...
+CCTV_SNAPSHOT_VARIANTS = int(os.getenv('CCTV_SNAPSHOT_VARIANTS', '256'))
+# Cameras with hls_enabled get one ffmpeg process writing segments under MEDIA_ROOT/hls/<id>/
+CCTV_FFMPEG = os.getenv('CCTV_FFMPEG', 'ffmpeg')
+CCTV_HLS_SEGMENT_SECONDS = int(os.getenv('CCTV_HLS_SEGMENT_SECONDS', '2'))
+CCTV_HLS_PLAYLIST_SIZE = int(os.getenv('CCTV_HLS_PLAYLIST_SIZE', '6'))
+# Passthrough recordings are remuxed into segments of this many seconds under MEDIA_ROOT/recordings/<id>/
+CCTV_RECORDING_SEGMENT_SECONDS = int(os.getenv('CCTV_RECORDING_SEGMENT_SECONDS', '60'))
+# Alerts save a clip from CCTV_CLIP_PRE_SECONDS before to CCTV_CLIP_POST_SECONDS after; the
+# per-camera pre-event buffer never holds more than CCTV_CLIP_BUFFER_MB of JPEGs
+CCTV_CLIP_PRE_SECONDS = float(os.getenv('CCTV_CLIP_PRE_SECONDS', '10'))
+CCTV_CLIP_POST_SECONDS = float(os.getenv('CCTV_CLIP_POST_SECONDS', '10'))
+CCTV_CLIP_BUFFER_MB = int(os.getenv('CCTV_CLIP_BUFFER_MB', '32'))
+# Analysis jobs started through the API may only read footage below this directory
+CCTV_ANALYSIS_ROOT = os.getenv('CCTV_ANALYSIS_ROOT', os.path.join(BASE_DIR, 'media'))
+# Seconds pipelines buffer detection rollups before merging them into the database
+CCTV_ROLLUP_FLUSH_SECONDS = float(os.getenv('CCTV_ROLLUP_FLUSH_SECONDS', '10'))
 AUTH_USER_MODEL = 'api.User'
 
 
@@ -142,8 +197,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Verifies the token signature and builds request.user from its claims;
+        # Basic auth ran a full password hash on every request
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -162,6 +219,14 @@ from datetime import timedelta
 LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
 
+# Per-frame debug lines are only built when CCTV_LOG_LEVEL=DEBUG
+CCTV_LOG_LEVEL = os.getenv('CCTV_LOG_LEVEL', 'INFO')
+# Handlers write from a background thread; see api/logqueue.py
+CCTV_LOG_QUEUE = os.getenv('CCTV_LOG_QUEUE', 'true').lower() == 'true'
+CCTV_LOG_QUEUE_SIZE = int(os.getenv('CCTV_LOG_QUEUE_SIZE', '10000'))
+# Seconds between repeats of the same per-camera log line
+CCTV_LOG_SAMPLE_INTERVAL = float(os.getenv('CCTV_LOG_SAMPLE_INTERVAL', '10'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -220,7 +285,7 @@ LOGGING = {
     'loggers': {
         '': {  # Root logger
             'handlers': ['console'],  # Console handler for everything
-            'level': 'DEBUG',
+            'level': CCTV_LOG_LEVEL,
             'propagate': True,
         },
         'app_logger': {  # Application-specific logger
@@ -241,6 +306,7 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
     "UPDATE_LAST_LOGIN": False,
+    "TOKEN_USER_CLASS": "api.authentication.CameraTokenUser",
 
     }
 PASSWORD_RESET_TIMEOUT=1800
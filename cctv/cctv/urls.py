@@ -2,8 +2,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static 
+from api.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),  # Include API URLs here
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)